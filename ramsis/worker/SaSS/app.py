@@ -12,6 +12,9 @@
 RAMSIS SaSS (Shapiro and Smothed Seismicity) worker.
 """
 
+import argparse
+import functools
+import json
 import os
 import sys
 import traceback
@@ -21,11 +24,26 @@ from flask_restful import Api
 from ramsis.utils.app import CustomParser, App, AppError
 from ramsis.utils.error import Error, ExitCode
 from ramsis.worker import settings, utils
+from ramsis.worker.utils import profiling
 from ramsis.worker.SaSS import create_app
-from ramsis.worker.SaSS.task import SaSSTask
-from ramsis.worker.SaSS.schema import WorkerInputMessageSchema
-from ramsis.worker.utils.parser import parser
-from ramsis.worker.utils.resource import AsyncWorkerResource
+from ramsis.worker.SaSS.task import (Preload, SaSSTask,
+                                     create_engine_pool)
+from ramsis.worker.SaSS.schema import (BatchWorkerInputMessageSchema,
+                                       WorkerInputMessageSchema)
+from ramsis.worker.utils.cache import ResultCache
+from ramsis.worker.utils.executor import RunExecutor
+from ramsis.worker.utils.parser import parse_json, parser
+from ramsis.worker.utils.registry import RunRegistry, SingleFlight
+from ramsis.worker.utils.resource import (AsyncBatchWorkerResource,
+                                          AsyncWorkerResource,
+                                          HealthResource, MetricsResource,
+                                          ProfilingResource,
+                                          ReadinessResource,
+                                          RunEventsResource, RunLogResource)
+from ramsis.worker.utils.response import ResponseCache
+from ramsis.worker.utils.server import ServerError, serve, serve_asgi
+from ramsis.worker.utils.startup import StartupProfile, import_times
+from ramsis.worker.utils.store import ResultStore
 
 __version__ = utils.get_version("SaSS")
 
@@ -35,25 +53,42 @@ class SaSSWorkerResource(AsyncWorkerResource):
     """
     Concrete implementation of an asynchronous SaSS worker resource.
     """
-    TASK = SaSSTask('SaSS',
-                    func_nargout=1,
-                    matlab_opts='-sd {}'.format(
-                        os.path.join(
-                            os.path.dirname(os.path.realpath(__file__)),
-                            'model')))
 
     def _parse(self, request, locations=('json', )):
+        if tuple(locations) == ('json', ):
+            return parse_json(WorkerInputMessageSchema, request,
+                              max_bytes=self.max_payload_size)
         return parser.parse(WorkerInputMessageSchema(), request,
                             locations=locations)
 
 # class SaSSWorkerResource
 
 
+class SaSSBatchWorkerResource(AsyncBatchWorkerResource):
+    """
+    Concrete implementation of a SaSS worker resource for batch submission.
+    """
+
+    def _parse(self, request, locations=('json', )):
+        if tuple(locations) == ('json', ):
+            return parse_json(BatchWorkerInputMessageSchema, request,
+                              max_bytes=self.max_payload_size)
+        return parser.parse(BatchWorkerInputMessageSchema(), request,
+                            locations=locations)
+
+# class SaSSBatchWorkerResource
+
+
 class SaSSWorkerWebservice(App):
     """
     A webservice implementing the SaSS (Shapiro and Smothed Seismicity) model.
     """
 
+    # callables releasing the resources set up by setup_app ()
+    _shutdown_hooks = ()
+    _pool = None
+    _preload = None
+
     def build_parser(self, parents=[]):
         """
         Set up the commandline argument parser.
@@ -70,8 +105,184 @@ class SaSSWorkerWebservice(App):
         parser.add_argument('--version', '-V', action='version',
                             version='%(prog)s version ' + __version__)
         parser.add_argument('-p', '--port', metavar='PORT', type=int,
-                            default=5000,
+                            default=settings.RAMSIS_WORKER_SASS_PORT,
                             help='server port')
+        parser.add_argument('--host', metavar='HOST', type=str,
+                            default=settings.RAMSIS_WORKER_HOST,
+                            help='server host (default: %(default)s)')
+        parser.add_argument('--server', type=str,
+                            choices=('dev', 'production', 'asgi'),
+                            default=settings.RAMSIS_WORKER_SERVER,
+                            help=("either the local single-process WSGI "
+                                  "server ('dev'), a prefork "
+                                  "multi-process WSGI server ('production') "
+                                  "or an asyncio-native ASGI server "
+                                  "('asgi') (default: %(default)s)"))
+        parser.add_argument('--debug', action='store_true', default=False,
+                            help=("enable the debugger of the 'dev' "
+                                  "server"))
+        parser.add_argument('--workers', metavar='NUM', type=int,
+                            default=settings.RAMSIS_WORKER_SERVER_WORKERS,
+                            help=('number of worker processes of the '
+                                  "'production' server; each process "
+                                  "starts --pool-size MATLAB engines "
+                                  '(default: %(default)s)'))
+        parser.add_argument('--threads', metavar='NUM', type=int,
+                            default=settings.RAMSIS_WORKER_SERVER_THREADS,
+                            help=('number of request handling threads per '
+                                  'worker process (default: %(default)s)'))
+        parser.add_argument('--keepalive', metavar='SECONDS', type=int,
+                            default=settings.RAMSIS_WORKER_SERVER_KEEPALIVE,
+                            help=('seconds to wait for requests on a '
+                                  'keep-alive connection '
+                                  '(default: %(default)s)'))
+        parser.add_argument('--timeout', metavar='SECONDS', type=int,
+                            default=settings.RAMSIS_WORKER_SERVER_TIMEOUT,
+                            help=('seconds after which an unresponsive '
+                                  'worker process is restarted '
+                                  '(default: %(default)s)'))
+        parser.add_argument('--graceful-timeout', metavar='SECONDS',
+                            type=int,
+                            default=settings.
+                            RAMSIS_WORKER_SERVER_GRACEFUL_TIMEOUT,
+                            dest='graceful_timeout',
+                            help=('seconds worker processes are granted to '
+                                  'finish pending requests when shutting '
+                                  'down (default: %(default)s)'))
+        parser.add_argument('--pool-size', metavar='NUM', type=int,
+                            default=settings.RAMSIS_WORKER_SASS_POOL_SIZE,
+                            dest='pool_size',
+                            help=('number of MATLAB engines i.e. the number '
+                                  'of runs executed concurrently '
+                                  '(default: %(default)s)'))
+        parser.add_argument('--preload', metavar='NAME=PATH',
+                            type=_preload_variable, action='append',
+                            default=[], dest='preload',
+                            help=('load the data file PATH into the MATLAB '
+                                  'engines\' workspace as global variable '
+                                  'NAME; the variable stays resident '
+                                  'between runs and is reloaded if the file '
+                                  'changed; may be repeated'))
+        parser.add_argument('--queue-size', metavar='NUM', type=int,
+                            default=settings.RAMSIS_WORKER_QUEUE_SIZE,
+                            dest='queue_size',
+                            help=('maximum number of queued runs; 0 means '
+                                  'unbounded (default: %(default)s)'))
+        parser.add_argument('--run-timeout', metavar='SECONDS', type=float,
+                            default=settings.RAMSIS_WORKER_RUN_TIMEOUT,
+                            dest='run_timeout',
+                            help=('default wall-clock deadline of a run\'s '
+                                  'execution; runs exceeding the deadline '
+                                  'are cancelled; 0 disables the deadline '
+                                  '(default: %(default)s)'))
+        parser.add_argument('--batch-chunk-size', metavar='NUM', type=int,
+                            default=settings.RAMSIS_WORKER_BATCH_CHUNK_SIZE,
+                            dest='batch_chunk_size',
+                            help=('maximum number of parameter sets executed '
+                                  'within a single vectorized MATLAB call; '
+                                  '0 means unbounded (default: %(default)s)'))
+        parser.add_argument('--max-payload-size', metavar='MBYTES',
+                            type=float,
+                            default=settings.RAMSIS_WORKER_MAX_PAYLOAD_SIZE,
+                            dest='max_payload_size',
+                            help=('maximum size of a decoded input message '
+                                  'in MB; 0 disables the limit '
+                                  '(default: %(default)s)'))
+        parser.add_argument('--cache-size', metavar='MBYTES', type=float,
+                            default=settings.RAMSIS_WORKER_CACHE_SIZE,
+                            dest='cache_size',
+                            help=('size of the in-memory result cache in MB; '
+                                  '0 disables caching '
+                                  '(default: %(default)s)'))
+        parser.add_argument('--cache-ttl', metavar='SECONDS', type=float,
+                            default=settings.RAMSIS_WORKER_CACHE_TTL,
+                            dest='cache_ttl',
+                            help=('time-to-live of cached results '
+                                  '(default: %(default)s)'))
+        parser.add_argument('--cache-dir', metavar='PATH', type=str,
+                            default=None, dest='cache_dir',
+                            help='directory of the on-disk result cache tier')
+        parser.add_argument('--cache-disk-size', metavar='MBYTES', type=float,
+                            default=settings.RAMSIS_WORKER_CACHE_DISK_SIZE,
+                            dest='cache_disk_size',
+                            help=('size of the on-disk result cache tier in '
+                                  'MB; 0 means unbounded '
+                                  '(default: %(default)s)'))
+        parser.add_argument('--response-cache-size', metavar='MBYTES',
+                            type=float,
+                            default=settings.RAMSIS_WORKER_RESPONSE_CACHE_SIZE,
+                            dest='response_cache_size',
+                            help=('size of the cache of serialized and '
+                                  'compressed results in MB; delivered '
+                                  'results are retained until evicted; 0 '
+                                  'disables caching (default: %(default)s)'))
+        parser.add_argument('--no-single-flight', action='store_false',
+                            default=True, dest='single_flight',
+                            help=('disable the coalescing of identical runs '
+                                  'submitted while a run is in flight'))
+        parser.add_argument('--log-capacity', metavar='KBYTES', type=int,
+                            default=settings.RAMSIS_WORKER_LOG_CAPACITY,
+                            dest='log_capacity',
+                            help=('capacity of the in-memory stdout/stderr '
+                                  'buffer per run in KB '
+                                  '(default: %(default)s)'))
+        parser.add_argument('--log-spill-dir', metavar='PATH', type=str,
+                            default=None, dest='log_spill_dir',
+                            help=('directory stdout/stderr exceeding the '
+                                  'in-memory buffer is spilled to; if not '
+                                  'set exceeding output is dropped'))
+        parser.add_argument('--store-dir', metavar='PATH', type=str,
+                            default=None, dest='store_dir',
+                            help=('directory of the persistent result store; '
+                                  'if not set results are kept in memory and '
+                                  'delivered once'))
+        parser.add_argument('--store-retention', metavar='SECONDS',
+                            type=float,
+                            default=settings.RAMSIS_WORKER_STORE_RETENTION,
+                            dest='store_retention',
+                            help=('retention period of stored results '
+                                  '(default: %(default)s)'))
+        parser.add_argument('--run-retention', metavar='SECONDS',
+                            type=float,
+                            default=settings.RAMSIS_WORKER_RUN_RETENTION,
+                            dest='run_retention',
+                            help=('retention period of finished runs never '
+                                  'fetched; 0 retains runs until fetched '
+                                  '(default: %(default)s)'))
+        parser.add_argument('--max-finished-runs', metavar='NUM', type=int,
+                            default=settings.RAMSIS_WORKER_MAX_FINISHED_RUNS,
+                            dest='max_finished_runs',
+                            help=('maximum number of finished runs kept in '
+                                  'memory; 0 means unbounded '
+                                  '(default: %(default)s)'))
+        parser.add_argument('--profile-dir', metavar='PATH', type=str,
+                            default=None, dest='profile_dir',
+                            help=('directory profiles are written to; '
+                                  'enables profiling including the admin '
+                                  'resource reconfiguring the profiler at '
+                                  'runtime'))
+        parser.add_argument('--profile-rate', metavar='FRACTION', type=float,
+                            default=settings.RAMSIS_WORKER_PROFILE_RATE,
+                            dest='profile_rate',
+                            help=('fraction of requests and runs profiled '
+                                  '(default: %(default)s)'))
+        parser.add_argument('--profile-mode', type=str,
+                            choices=profiling.MODES,
+                            default=settings.RAMSIS_WORKER_PROFILE_MODE,
+                            dest='profile_mode',
+                            help=("either deterministic profiling "
+                                  "('cprofile') or wall-clock stack sampling "
+                                  "('sample') (default: %(default)s)"))
+        parser.add_argument('--profile-interval', metavar='SECONDS',
+                            type=float,
+                            default=settings.RAMSIS_WORKER_PROFILE_INTERVAL,
+                            dest='profile_interval',
+                            help=('stack sampling interval '
+                                  '(default: %(default)s)'))
+        parser.add_argument('--startup-profile', action='store_true',
+                            default=False, dest='startup_profile',
+                            help=('report import and initialization times '
+                                  '(JSON) and exit without serving'))
 
         return parser
 
@@ -83,9 +294,26 @@ class SaSSWorkerWebservice(App):
         """
         exit_code = ExitCode.EXIT_SUCCESS.value
         try:
-            app = self.setup_app()
-            self.logger.info('Serving with local WSGI server.')
-            app.run(threaded=True, debug=True, port=self.args.port)
+            if self.args.startup_profile:
+                json.dump(self.startup_profile(), sys.stdout, indent=2,
+                          sort_keys=True)
+                print()
+            elif self.args.server == 'production':
+                self._serve()
+            elif self.args.server == 'asgi':
+                serve_asgi(self.setup_asgi_app(), host=self.args.host,
+                           port=self.args.port,
+                           keepalive=self.args.keepalive,
+                           graceful_timeout=self.args.graceful_timeout,
+                           on_exit=self.shutdown)
+            else:
+                app = self.setup_app()
+                self.logger.info('Serving with local WSGI server.')
+                try:
+                    app.run(threaded=True, debug=self.args.debug,
+                            host=self.args.host, port=self.args.port)
+                finally:
+                    self.shutdown()
 
         except Error as err:
             self.logger.error(err)
@@ -93,15 +321,100 @@ class SaSSWorkerWebservice(App):
         except Exception as err:
             exc_type, exc_value, exc_traceback = sys.exc_info()
             self.logger.critical('Local Exception: %s' % err)
-            self.logger.critical('Traceback information: ' +
-                                 repr(traceback.format_exception(
-                                     exc_type, exc_value, exc_traceback)))
+            tb = repr(traceback.format_exception(
+                exc_type, exc_value, exc_traceback))
+            self.logger.critical('Traceback information: ' + tb)
             exit_code = ExitCode.EXIT_ERROR.value
 
         sys.exit(exit_code)
 
     # run ()
 
+    def _serve(self):
+        """
+        Serve the application by means of the prefork multi-process WSGI
+        server. Each worker process sets up its own application including
+        its MATLAB engines.
+        """
+        if self.args.workers > 1:
+            if not self.args.store_dir:
+                # NOTE(damb): Runs are accepted and polled by arbitrary
+                # worker processes. Hence, the run state must be shared.
+                raise ServerError(
+                    'Serving with multiple worker processes requires a '
+                    'persistent result store (--store-dir).')
+            # recover once before forking; worker processes are restarted
+            # independently and must not fail runs of their siblings. Runs
+            # of a worker process killed (e.g. due to a timeout) are failed
+            # when read by its siblings (see ResultStore).
+            ResultStore(self.args.store_dir,
+                        retention=self.args.store_retention).close()
+
+        serve(self.setup_app,
+              bind='{}:{}'.format(self.args.host, self.args.port),
+              workers=self.args.workers,
+              threads=self.args.threads,
+              keepalive=self.args.keepalive,
+              timeout=self.args.timeout,
+              graceful_timeout=self.args.graceful_timeout,
+              on_exit=self.shutdown)
+
+    # _serve ()
+
+    def startup_profile(self):
+        """
+        Profile the worker's startup i.e. the import time of the worker
+        (measured within a fresh interpreter), the application's setup and
+        the MATLAB engine pool's startup. The resources set up are released
+        afterwards.
+
+        :returns: Startup profile
+        :rtype: dict
+        """
+        profile = StartupProfile()
+        try:
+            with profile.phase('setup'):
+                if self.args.server == 'asgi':
+                    self.setup_asgi_app()
+                else:
+                    self.setup_app()
+
+            pool = self._pool
+            with profile.phase('pool_ready'):
+                # first engine available
+                while not pool.wait_ready(timeout=0.01):
+                    if pool.wait_started(timeout=0):
+                        break
+            with profile.phase('pool_started'):
+                pool.wait_started()
+        finally:
+            self.shutdown()
+
+        if not pool.is_ready:
+            del profile.phases['pool_ready']
+        return {'server': self.args.server,
+                'pool_size': pool.size,
+                'pool_error': (str(pool.startup_error)
+                               if pool.startup_error else None),
+                'imports': import_times('ramsis.worker.SaSS.app'),
+                'phases': profile.phases}
+
+    # startup_profile ()
+
+    def shutdown(self):
+        """
+        Release the resources set up by :py:meth:`setup_app`. Queued runs
+        are failed; runs currently executed are completed.
+        """
+        for fn in reversed(self._shutdown_hooks):
+            try:
+                fn()
+            except Exception as err:
+                self.logger.warning('Shutdown failed ({}).'.format(err))
+        self._shutdown_hooks = ()
+
+    # shutdown ()
+
     def setup_app(self):
         """
         Setup and configure the Flask app with its API.
@@ -113,17 +426,233 @@ class SaSSWorkerWebservice(App):
             'PORT': self.args.port, }
         app = create_app(config_dict=app_config)
 
+        pool, resource_kwargs = self._setup_resources()
+        run_kwargs = {'registry': resource_kwargs['registry'],
+                      'store': resource_kwargs['store']}
+
         # configure webservice API with resource
         api = Api(app)
-        api.add_resource(SaSSWorkerResource,
-                         settings.PATH_RAMSIS_WORKER_SCENARIOS)
+        api.add_resource(
+            SaSSWorkerResource,
+            settings.PATH_RAMSIS_WORKER_SCENARIOS,
+            settings.PATH_RAMSIS_WORKER_SCENARIO,
+            resource_class_kwargs=resource_kwargs)
+        api.add_resource(
+            SaSSBatchWorkerResource,
+            settings.PATH_RAMSIS_WORKER_SCENARIOS_BATCH,
+            resource_class_kwargs=dict(
+                resource_kwargs, chunk_size=self.args.batch_chunk_size))
+        api.add_resource(RunEventsResource,
+                         settings.PATH_RAMSIS_WORKER_SCENARIO_EVENTS,
+                         resource_class_kwargs=run_kwargs)
+        api.add_resource(RunLogResource,
+                         settings.PATH_RAMSIS_WORKER_SCENARIO_LOG,
+                         resource_class_kwargs=run_kwargs)
+        health_kwargs = {'pool': pool,
+                         'executor': resource_kwargs['executor']}
+        api.add_resource(HealthResource, settings.PATH_RAMSIS_WORKER_HEALTH,
+                         resource_class_kwargs=health_kwargs)
+        api.add_resource(ReadinessResource, settings.PATH_RAMSIS_WORKER_READY,
+                         resource_class_kwargs=health_kwargs)
+        api.add_resource(MetricsResource, settings.PATH_RAMSIS_WORKER_METRICS,
+                         resource_class_kwargs={
+                             'pool': pool,
+                             'executor': resource_kwargs['executor'],
+                             'cache': resource_kwargs['cache'],
+                             'response_cache': resource_kwargs[
+                                 'response_cache']})
+        if resource_kwargs['profiler'] is not None:
+            api.add_resource(
+                ProfilingResource, settings.PATH_RAMSIS_WORKER_PROFILING,
+                resource_class_kwargs={
+                    'profiler': resource_kwargs['profiler']})
 
         return app
 
     # setup_app ()
 
+    def setup_asgi_app(self):
+        """
+        Setup and configure the asyncio-native ASGI app. The app provides
+        the same API as the Flask app.
+
+        :returns: The configured ASGI application instance.
+        :rtype :py:class:`starlette.applications.Starlette`:
+        """
+        # NOTE(damb): ASGI facilities are imported lazily; importing them
+        # is expensive and not required when serving WSGI.
+        from ramsis.worker.SaSS.asgi import (SaSSAsgiBatchWorkerResource,
+                                             SaSSAsgiWorkerResource)
+        from ramsis.worker.utils.asgi import (AsgiMetricsResource,
+                                              AsgiProfilingResource,
+                                              AsgiRunEventsResource,
+                                              AsgiRunLogResource)
+        from ramsis.worker.utils.asgi import create_app as create_asgi_app
+
+        pool, resource_kwargs = self._setup_resources()
+        run_kwargs = {'registry': resource_kwargs['registry'],
+                      'store': resource_kwargs['store']}
+
+        resource = SaSSAsgiWorkerResource(**resource_kwargs)
+        # NOTE(damb): The static batch route must precede the item route.
+        resources = [
+            (settings.PATH_RAMSIS_WORKER_SCENARIOS, resource,
+             ('GET', 'POST')),
+            (settings.PATH_RAMSIS_WORKER_SCENARIOS_BATCH,
+             SaSSAsgiBatchWorkerResource(
+                 chunk_size=self.args.batch_chunk_size, **resource_kwargs),
+             ('GET', 'POST')),
+            (settings.PATH_RAMSIS_WORKER_SCENARIO, resource,
+             ('GET', 'POST', 'DELETE')),
+            (settings.PATH_RAMSIS_WORKER_SCENARIO_EVENTS,
+             AsgiRunEventsResource(**run_kwargs), ('GET', )),
+            (settings.PATH_RAMSIS_WORKER_SCENARIO_LOG,
+             AsgiRunLogResource(**run_kwargs), ('GET', )),
+            (settings.PATH_RAMSIS_WORKER_HEALTH,
+             HealthResource(pool=pool,
+                            executor=resource_kwargs['executor']).get,
+             ('GET', )),
+            (settings.PATH_RAMSIS_WORKER_READY,
+             ReadinessResource(pool=pool,
+                               executor=resource_kwargs['executor']).get,
+             ('GET', )),
+            (settings.PATH_RAMSIS_WORKER_METRICS,
+             AsgiMetricsResource(pool=pool,
+                                 executor=resource_kwargs['executor'],
+                                 cache=resource_kwargs['cache'],
+                                 response_cache=resource_kwargs[
+                                     'response_cache']),
+             ('GET', ))]
+        if resource_kwargs['profiler'] is not None:
+            resources.append(
+                (settings.PATH_RAMSIS_WORKER_PROFILING,
+                 AsgiProfilingResource(profiler=resource_kwargs['profiler']),
+                 ('GET', 'PUT')))
+
+        return create_asgi_app(resources)
+
+    # setup_asgi_app ()
+
+    def create_preload(self):
+        """
+        Create the static data preloaded into the MATLAB engines' workspace.
+
+        :returns: The static data preloaded or `None`
+        :rtype: :py:class:`ramsis.worker.SaSS.task.Preload`
+        """
+        if not self.args.preload:
+            return None
+        return Preload(dict(self.args.preload))
+
+    # create_preload ()
+
+    def create_pool(self):
+        """
+        Create the pool of MATLAB engines. Note that the engines are not
+        started yet.
+
+        :rtype: :py:class:`ramsis.worker.utils.pool.Pool`
+        """
+        return create_engine_pool(
+            size=self.args.pool_size,
+            matlab_opts='-sd {}'.format(
+                os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             'model')),
+            preload=self._preload)
+
+    # create_pool ()
+
+    def _setup_resources(self):
+        """
+        Set up the collaborators shared by the worker resources.
+
+        :returns: Tuple of the form `(pool, resource_kwargs)`
+        """
+        # start and warm up the MATLAB engines (including the static data
+        # preloaded) in the background; runs submitted meanwhile are queued
+        preload = self._preload = self.create_preload()
+        pool = self._pool = self.create_pool()
+        pool.start(background=True)
+
+        cache = None
+        if self.args.cache_size > 0:
+            max_disk_bytes = None
+            if self.args.cache_disk_size > 0:
+                max_disk_bytes = int(self.args.cache_disk_size * 1024**2)
+            cache = ResultCache(max_bytes=int(self.args.cache_size * 1024**2),
+                                ttl=self.args.cache_ttl,
+                                path=self.args.cache_dir,
+                                max_disk_bytes=max_disk_bytes)
+
+        response_cache = None
+        if self.args.response_cache_size > 0:
+            response_cache = ResponseCache(
+                max_bytes=int(self.args.response_cache_size * 1024**2))
+
+        single_flight = SingleFlight() if self.args.single_flight else None
+
+        store = None
+        if self.args.store_dir:
+            shared = self.args.server == 'production' and self.args.workers > 1
+            store = ResultStore(
+                self.args.store_dir, retention=self.args.store_retention,
+                recover=not shared)
+
+        profiler = None
+        if self.args.profile_dir:
+            profiler = profiling.Profiler(
+                self.args.profile_dir, rate=self.args.profile_rate,
+                mode=self.args.profile_mode,
+                interval=self.args.profile_interval)
+
+        executor = RunExecutor(max_workers=pool.size,
+                               max_queue_size=self.args.queue_size,
+                               run_timeout=self.args.run_timeout or None,
+                               profiler=profiler)
+
+        self._shutdown_hooks = [pool.close, executor.shutdown]
+        if store is not None:
+            self._shutdown_hooks.insert(0, store.close)
+
+        return pool, {
+            'task': functools.partial(
+                SaSSTask, 'SaSS', pool=pool, func_nargout=1,
+                stream_capacity=self.args.log_capacity * 1024,
+                spill_dir=self.args.log_spill_dir, preload=preload),
+            'registry': RunRegistry(
+                retention=self.args.run_retention or None,
+                max_finished=self.args.max_finished_runs or None),
+            'executor': executor,
+            'cache': cache,
+            'store': store,
+            'profiler': profiler,
+            'response_cache': response_cache,
+            'single_flight': single_flight,
+            'max_payload_size': (int(self.args.max_payload_size * 1024**2)
+                                 if self.args.max_payload_size > 0 else
+                                 None)}
+
+    # _setup_resources ()
+
 # class SaSSWorkerWebservice
 
+
+def _preload_variable(arg):
+    """
+    Parse a `NAME=PATH` commandline argument.
+
+    :returns: Tuple of the form `(name, path)`
+    :rtype: tuple
+    """
+    name, sep, path = arg.partition('=')
+    if not (name and sep and path):
+        raise argparse.ArgumentTypeError(
+            'Invalid preload variable: {!r} (expected NAME=PATH)'.format(arg))
+    return name, path
+
+# _preload_variable ()
+
+
 # ----------------------------------------------------------------------------
 def main():
     """
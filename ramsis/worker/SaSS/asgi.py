@@ -0,0 +1,46 @@
+# This is <asgi.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: SaSS worker ASGI resource facilities.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+asyncio-native (ASGI) SaSS worker resources.
+
+.. note::
+
+    Requires the `asgi` extra.
+"""
+
+from ramsis.worker.SaSS.schema import (BatchWorkerInputMessageSchema,
+                                       WorkerInputMessageSchema)
+from ramsis.worker.utils.asgi import (AsgiBatchWorkerResource,
+                                      AsgiWorkerResource)
+from ramsis.worker.utils.schema import compiled_schema
+
+
+# -----------------------------------------------------------------------------
+class SaSSAsgiWorkerResource(AsgiWorkerResource):
+    """
+    Concrete implementation of an asyncio-native SaSS worker resource.
+    """
+
+    def schema(self):
+        return compiled_schema(WorkerInputMessageSchema)
+
+# class SaSSAsgiWorkerResource
+
+
+class SaSSAsgiBatchWorkerResource(AsgiBatchWorkerResource):
+    """
+    Concrete implementation of an asyncio-native SaSS worker resource for
+    batch submission.
+    """
+
+    def schema(self):
+        return compiled_schema(BatchWorkerInputMessageSchema)
+
+# class SaSSAsgiBatchWorkerResource
+
+# ---- END OF <asgi.py> ----
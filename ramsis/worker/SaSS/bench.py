@@ -0,0 +1,325 @@
+# This is <bench.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: SaSS worker benchmark.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+SaSS worker benchmark. By default the worker is served in-process with
+simulated MATLAB engines i.e. no MATLAB installation is required. The
+simulated compute latency and result size are configurable. Alternatively,
+a running worker is benchmarked by means of `--url`.
+
+The benchmark report is written as JSON.
+"""
+
+import concurrent.futures
+import functools
+import json
+import sys
+import threading
+import traceback
+
+from ramsis.utils.app import CustomParser, App, AppError
+from ramsis.utils.error import Error, ExitCode
+from ramsis.worker import settings
+from ramsis.worker.SaSS.app import SaSSWorkerWebservice, __version__
+from ramsis.worker.SaSS.task import engine_is_healthy, stop_engine
+from ramsis.worker.utils.bench import Benchmark, free_port, serve_background
+from ramsis.worker.utils.pool import Pool
+
+
+# -----------------------------------------------------------------------------
+class SimulatedEngine(object):
+    """
+    Stand-in for a MATLAB engine. Any function called with `background=True`
+    completes after `latency` seconds returning `result_size` values.
+
+    .. note::
+
+        Since MATLAB functions are executed by the MATLAB process the
+        simulated computation sleeps rather than occupying the CPU.
+
+    :param float latency: Simulated compute latency in seconds
+    :param int result_size: Number of values returned
+    """
+
+    def __init__(self, latency=0.1, result_size=1):
+        self.latency = latency
+        self.result = [[float(i) for i in range(result_size)]]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self._call
+
+    def _call(self, *args, nargout=1, background=False, stdout=None,
+              stderr=None):
+        future = SimulatedFuture(self.latency, self.result)
+        return future if background else future.result()
+
+    def eval(self, expr, nargout=0, **kwargs):
+        return None
+
+    def quit(self):
+        pass
+
+# class SimulatedEngine
+
+
+class SimulatedFuture(object):
+    """
+    Stand-in for a MATLAB `FutureResult`.
+    """
+
+    def __init__(self, latency, result):
+        self._future = concurrent.futures.Future()
+        self._timer = threading.Timer(latency, self._complete, args=(result, ))
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _complete(self, result):
+        if self._future.set_running_or_notify_cancel():
+            self._future.set_result(result)
+
+    def cancel(self):
+        self._timer.cancel()
+        return self._future.cancel()
+
+    def cancelled(self):
+        return self._future.cancelled()
+
+    def done(self):
+        return self._future.done()
+
+    def result(self, timeout=None):
+        return self._future.result(timeout=timeout)
+
+# class SimulatedFuture
+
+
+def create_simulated_engine_pool(size=1, latency=0.1, result_size=1):
+    """
+    Factory function creating a pool of simulated MATLAB engines.
+
+    :rtype: :py:class:`ramsis.worker.utils.pool.Pool`
+    """
+    return Pool(functools.partial(SimulatedEngine, latency=latency,
+                                  result_size=result_size),
+                size=size, health_check=engine_is_healthy,
+                destroy=stop_engine, logger='ramsis.worker.sass_engine_pool')
+
+# create_simulated_engine_pool ()
+
+
+class SimulatedSaSSWorkerWebservice(SaSSWorkerWebservice):
+    """
+    SaSS worker webservice executing runs by means of simulated MATLAB
+    engines.
+    """
+
+    def __init__(self, latency=0.1, result_size=1, **kwargs):
+        super().__init__(**kwargs)
+        self._latency = latency
+        self._result_size = result_size
+
+    def create_pool(self):
+        return create_simulated_engine_pool(
+            size=self.args.pool_size, latency=self._latency,
+            result_size=self._result_size)
+
+# class SimulatedSaSSWorkerWebservice
+
+
+# -----------------------------------------------------------------------------
+class SaSSBenchmark(App):
+    """
+    Benchmark of the SaSS worker webservice.
+    """
+
+    def build_parser(self, parents=[]):
+        """
+        Set up the commandline argument parser.
+
+        :param list parents: list of parent parsers
+        :returns: parser
+        :rtype: :py:class:`argparse.ArgumentParser`
+        """
+        parser = CustomParser(
+            prog="ramsis-worker-sass-bench",
+            description='Benchmark the SaSS worker webservice.',
+            parents=parents)
+        # optional arguments
+        parser.add_argument('--version', '-V', action='version',
+                            version='%(prog)s version ' + __version__)
+        parser.add_argument('--url', metavar='URL', type=str, default=None,
+                            help=('base URL of a running worker; if not set '
+                                  'the worker is served in-process with '
+                                  'simulated MATLAB engines'))
+        parser.add_argument('--server', type=str, choices=('dev', 'asgi'),
+                            default='dev',
+                            help=('in-process server; either the local WSGI '
+                                  "server ('dev') or the ASGI server "
+                                  "('asgi') (default: %(default)s)"))
+        parser.add_argument('--pool-size', metavar='NUM', type=int,
+                            default=settings.RAMSIS_WORKER_SASS_POOL_SIZE,
+                            dest='pool_size',
+                            help=('number of simulated MATLAB engines '
+                                  '(default: %(default)s)'))
+        parser.add_argument('--latency', metavar='SECONDS', type=float,
+                            default=settings.RAMSIS_WORKER_BENCH_LATENCY,
+                            help=('simulated compute latency of a run '
+                                  '(default: %(default)s)'))
+        parser.add_argument('--result-size', metavar='NUM', type=int,
+                            default=settings.RAMSIS_WORKER_BENCH_RESULT_SIZE,
+                            dest='result_size',
+                            help=('number of values of a simulated result '
+                                  '(default: %(default)s)'))
+        parser.add_argument('--concurrency', '-c', metavar='NUM', type=int,
+                            default=settings.RAMSIS_WORKER_BENCH_CONCURRENCY,
+                            help=('number of concurrent clients '
+                                  '(default: %(default)s)'))
+        parser.add_argument('--runs', '-n', metavar='NUM', type=int,
+                            default=settings.RAMSIS_WORKER_BENCH_RUNS,
+                            help=('number of measured runs '
+                                  '(default: %(default)s)'))
+        parser.add_argument('--warmup', metavar='NUM', type=int, default=0,
+                            help=('number of runs executed before the '
+                                  'benchmark (default: %(default)s)'))
+        parser.add_argument('--poll-interval', metavar='SECONDS', type=float,
+                            default=0, dest='poll_interval',
+                            help=('interval runs are polled with; 0 means '
+                                  'long-polling (default: %(default)s)'))
+        parser.add_argument('--output', '-o', metavar='PATH', type=str,
+                            default=None,
+                            help=('file the JSON report is written to; if '
+                                  'not set the report is written to stdout'))
+
+        return parser
+
+    # build_parser ()
+
+    def run(self):
+        """
+        Run application.
+        """
+        exit_code = ExitCode.EXIT_SUCCESS.value
+        try:
+            report = self.benchmark()
+            if self.args.output:
+                with open(self.args.output, 'w') as ofd:
+                    json.dump(report, ofd, indent=2, sort_keys=True)
+            else:
+                json.dump(report, sys.stdout, indent=2, sort_keys=True)
+                print()
+
+        except Error as err:
+            self.logger.error(err)
+            exit_code = ExitCode.EXIT_ERROR.value
+        except Exception as err:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            self.logger.critical('Local Exception: %s' % err)
+            tb = repr(traceback.format_exception(
+                exc_type, exc_value, exc_traceback))
+            self.logger.critical('Traceback information: ' + tb)
+            exit_code = ExitCode.EXIT_ERROR.value
+
+        sys.exit(exit_code)
+
+    # run ()
+
+    def benchmark(self):
+        """
+        :returns: Benchmark report
+        :rtype: dict
+        """
+        report = {'url': self.args.url}
+        url = self.args.url
+        stop = None
+        if url is None:
+            url, stop = self._serve()
+            report.update({'server': self.args.server,
+                           'pool_size': self.args.pool_size,
+                           'latency_simulated': self.args.latency,
+                           'result_size': self.args.result_size})
+
+        try:
+            # NOTE(damb): Parameters are unique per run such that runs are
+            # not served from a result cache.
+            bench = Benchmark(
+                url, lambda i: {'x': float(i)},
+                concurrency=self.args.concurrency, runs=self.args.runs,
+                warmup=self.args.warmup,
+                poll_interval=self.args.poll_interval)
+            bench.wait_ready()
+            report.update(bench.run())
+        finally:
+            if stop is not None:
+                stop()
+
+        return report
+
+    # benchmark ()
+
+    def _serve(self):
+        """
+        Serve the worker in-process with simulated MATLAB engines.
+
+        :returns: Tuple of the form `(url, stop)`
+        """
+        host = '127.0.0.1'
+        port = free_port(host)
+
+        worker = SimulatedSaSSWorkerWebservice(
+            latency=self.args.latency, result_size=self.args.result_size,
+            log_id='RAMSIS-SASS')
+        worker.args = worker.build_parser().parse_args([
+            '--server', self.args.server,
+            '--pool-size', str(self.args.pool_size),
+            '--queue-size', '0',
+            '--cache-size', '0'])
+
+        asgi = self.args.server == 'asgi'
+        app = worker.setup_asgi_app() if asgi else worker.setup_app()
+        stop_server = serve_background(app, host, port, asgi=asgi)
+
+        def stop():
+            stop_server()
+            worker.shutdown()
+
+        return 'http://{}:{}'.format(host, port), stop
+
+    # _serve ()
+
+# class SaSSBenchmark
+
+
+# ----------------------------------------------------------------------------
+def main():
+    """
+    main function for the SaSS worker benchmark
+    """
+
+    app = SaSSBenchmark(log_id='RAMSIS-SASS-BENCH')
+
+    try:
+        app.configure(
+            settings.PATH_RAMSIS_WORKER_CONFIG,
+            config_section=settings.RAMSIS_WORKER_SASS_BENCH_CONFIG_SECTION)
+    except AppError as err:
+        # handle errors during the application configuration
+        print('ERROR: Application configuration failed "%s".' % err,
+              file=sys.stderr)
+        sys.exit(ExitCode.EXIT_ERROR.value)
+
+    return app.run()
+
+# main ()
+
+
+# -----------------------------------------------------------------------------
+if __name__ == '__main__':
+    main()
+
+# ---- END OF <bench.py> ----
@@ -0,0 +1,262 @@
+# This is <dispatch.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: SaSS worker dispatcher.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+SaSS worker dispatcher. The dispatcher spawns several local SaSS worker
+processes (each with its own pool of MATLAB engines) and fronts them by
+means of a single `/runs` endpoint. Alternatively, already running workers
+are fronted by means of `--backend`.
+
+Arguments following `--` are passed to the worker processes spawned e.g.
+
+..code::
+
+    ramsis-worker-sass-dispatch --workers 4 -- --pool-size 2
+"""
+
+import argparse
+import sys
+import traceback
+
+from flask_restful import Api
+
+from ramsis.utils.app import CustomParser, App, AppError
+from ramsis.utils.error import Error, ExitCode
+from ramsis.worker import settings
+from ramsis.worker.SaSS import create_app
+from ramsis.worker.SaSS.app import __version__
+from ramsis.worker.utils.dispatch import (Backend, Dispatcher,
+                                          DispatchBatchResource,
+                                          DispatchHealthResource,
+                                          DispatchReadinessResource,
+                                          DispatchResource,
+                                          DispatchStreamResource)
+from ramsis.worker.utils.server import serve
+
+
+# -----------------------------------------------------------------------------
+class SaSSDispatcherWebservice(App):
+    """
+    A webservice dispatching runs across several SaSS worker processes.
+    """
+
+    _dispatcher = None
+
+    def build_parser(self, parents=[]):
+        """
+        Set up the commandline argument parser.
+
+        :param list parents: list of parent parsers
+        :returns: parser
+        :rtype: :py:class:`argparse.ArgumentParser`
+        """
+        parser = CustomParser(
+            prog="ramsis-worker-sass-dispatch",
+            description=('Dispatch runs across several SaSS worker '
+                         'processes.'),
+            parents=parents)
+        # optional arguments
+        parser.add_argument('--version', '-V', action='version',
+                            version='%(prog)s version ' + __version__)
+        parser.add_argument('-p', '--port', metavar='PORT', type=int,
+                            default=settings.RAMSIS_WORKER_SASS_PORT,
+                            help='server port (default: %(default)s)')
+        parser.add_argument('--host', metavar='HOST', type=str,
+                            default=settings.RAMSIS_WORKER_HOST,
+                            help='server host (default: %(default)s)')
+        parser.add_argument('--server', type=str,
+                            choices=('dev', 'production'),
+                            default=settings.RAMSIS_WORKER_SERVER,
+                            help=("either the local WSGI server ('dev') or "
+                                  "the production WSGI server "
+                                  "('production'); the dispatcher is served "
+                                  "by a single process "
+                                  "(default: %(default)s)"))
+        parser.add_argument('--threads', metavar='NUM', type=int,
+                            default=settings.RAMSIS_WORKER_SERVER_THREADS,
+                            help=('production server request handling '
+                                  'threads (default: %(default)s)'))
+        parser.add_argument('--workers', metavar='NUM', type=int,
+                            default=settings.RAMSIS_WORKER_DISPATCH_WORKERS,
+                            help=('number of worker processes spawned '
+                                  '(default: %(default)s)'))
+        parser.add_argument('--worker-port', metavar='PORT', type=int,
+                            default=None, dest='worker_port',
+                            help=('port of the first worker process spawned; '
+                                  'subsequent workers use the following '
+                                  'ports (default: PORT + 1)'))
+        parser.add_argument('--backend', metavar='URL', type=str,
+                            action='append', default=[], dest='backends',
+                            help=('base URL of a running worker to be '
+                                  'fronted; may be repeated; if set no '
+                                  'worker processes are spawned'))
+        parser.add_argument('--health-interval', metavar='SECONDS',
+                            type=float,
+                            default=(settings.
+                                     RAMSIS_WORKER_DISPATCH_HEALTH_INTERVAL),
+                            dest='health_interval',
+                            help=('interval workers are probed with '
+                                  '(default: %(default)s)'))
+        parser.add_argument('--timeout', metavar='SECONDS', type=float,
+                            default=settings.RAMSIS_WORKER_DISPATCH_TIMEOUT,
+                            help=('timeout of requests forwarded to workers '
+                                  '(default: %(default)s)'))
+        parser.add_argument('worker_args', nargs=argparse.REMAINDER,
+                            help=('arguments passed to the worker processes '
+                                  'spawned (following --)'))
+
+        return parser
+
+    # build_parser ()
+
+    def run(self):
+        """
+        Run application.
+        """
+        exit_code = ExitCode.EXIT_SUCCESS.value
+        try:
+            if self.args.server == 'production':
+                serve(self.setup_app,
+                      bind='{}:{}'.format(self.args.host, self.args.port),
+                      workers=1, threads=self.args.threads,
+                      timeout=int(self.args.timeout),
+                      on_exit=self.shutdown)
+            else:
+                app = self.setup_app()
+                self.logger.info('Serving with local WSGI server.')
+                try:
+                    app.run(threaded=True, host=self.args.host,
+                            port=self.args.port)
+                finally:
+                    self.shutdown()
+
+        except Error as err:
+            self.logger.error(err)
+            exit_code = ExitCode.EXIT_ERROR.value
+        except Exception as err:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            self.logger.critical('Local Exception: %s' % err)
+            tb = repr(traceback.format_exception(
+                exc_type, exc_value, exc_traceback))
+            self.logger.critical('Traceback information: ' + tb)
+            exit_code = ExitCode.EXIT_ERROR.value
+
+        sys.exit(exit_code)
+
+    # run ()
+
+    def shutdown(self):
+        """
+        Stop the dispatcher including the worker processes spawned.
+        """
+        if self._dispatcher is not None:
+            self._dispatcher.stop()
+            self._dispatcher = None
+
+    # shutdown ()
+
+    def setup_app(self):
+        """
+        Setup and configure the Flask app. The dispatcher is started i.e.
+        worker processes are spawned.
+
+        :returns: The configured Flask application instance.
+        :rtype :py:class:`flask.Flask`:
+        """
+        dispatcher = self._dispatcher = Dispatcher(
+            self.create_backends(),
+            health_interval=self.args.health_interval)
+        dispatcher.start()
+
+        app = create_app(config_dict={'PORT': self.args.port})
+        kwargs = {'dispatcher': dispatcher}
+
+        api = Api(app)
+        api.add_resource(DispatchResource,
+                         settings.PATH_RAMSIS_WORKER_SCENARIOS,
+                         settings.PATH_RAMSIS_WORKER_SCENARIO,
+                         resource_class_kwargs=kwargs)
+        api.add_resource(DispatchBatchResource,
+                         settings.PATH_RAMSIS_WORKER_SCENARIOS_BATCH,
+                         resource_class_kwargs=kwargs)
+        api.add_resource(DispatchStreamResource,
+                         settings.PATH_RAMSIS_WORKER_SCENARIO_EVENTS,
+                         settings.PATH_RAMSIS_WORKER_SCENARIO_LOG,
+                         resource_class_kwargs=kwargs)
+        api.add_resource(DispatchHealthResource,
+                         settings.PATH_RAMSIS_WORKER_HEALTH,
+                         resource_class_kwargs=kwargs)
+        api.add_resource(DispatchReadinessResource,
+                         settings.PATH_RAMSIS_WORKER_READY,
+                         resource_class_kwargs=kwargs)
+
+        return app
+
+    # setup_app ()
+
+    def create_backends(self):
+        """
+        :returns: The backends fronted by the dispatcher
+        :rtype: list
+        """
+        if self.args.backends:
+            return [Backend(url, timeout=self.args.timeout)
+                    for url in self.args.backends]
+
+        worker_args = list(self.args.worker_args)
+        if worker_args[:1] == ['--']:
+            worker_args = worker_args[1:]
+        # NOTE(damb): Workers bind to the loopback interface; they are
+        # reachable by means of the dispatcher, only.
+        host = '127.0.0.1'
+        port = self.args.worker_port or self.args.port + 1
+        return [Backend('http://{}:{}'.format(host, port + i),
+                        cmd=self.worker_cmd(host, port + i, worker_args),
+                        timeout=self.args.timeout)
+                for i in range(self.args.workers)]
+
+    # create_backends ()
+
+    def worker_cmd(self, host, port, worker_args=()):
+        """
+        :returns: The command line of a worker process
+        :rtype: list
+        """
+        return ([sys.executable, '-m', 'ramsis.worker.SaSS.app',
+                 '--host', host, '--port', str(port)] + list(worker_args))
+
+# class SaSSDispatcherWebservice
+
+
+# ----------------------------------------------------------------------------
+def main():
+    """
+    main function for the SaSS worker dispatcher
+    """
+
+    app = SaSSDispatcherWebservice(log_id='RAMSIS-SASS-DISPATCH')
+
+    try:
+        app.configure(
+            settings.PATH_RAMSIS_WORKER_CONFIG,
+            config_section=settings.RAMSIS_WORKER_SASS_DISPATCH_CONFIG_SECTION)
+    except AppError as err:
+        # handle errors during the application configuration
+        print('ERROR: Application configuration failed "%s".' % err,
+              file=sys.stderr)
+        sys.exit(ExitCode.EXIT_ERROR.value)
+
+    return app.run()
+
+# main ()
+
+
+# -----------------------------------------------------------------------------
+if __name__ == '__main__':
+    main()
+
+# ---- END OF <dispatch.py> ----
@@ -9,13 +9,16 @@
 # 2018/04/16        V0.1    Daniel Armbruster
 # =============================================================================
 
-from marshmallow import fields, Schema
+from marshmallow import fields, validate, Schema
 
 from ramsis.utils.protocol import WorkerInputMessageSchema as \
     _WorkerInputMessageSchema
 
 
 class ShapiroModelParameterSchema(Schema):
+    # NOTE(damb): The SaSS model parameters are scalars. Bulk numeric
+    # parameters (e.g. grids) are to be declared by means of
+    # ramsis.worker.utils.schema.Array in order to be decoded incrementally.
     x = fields.Float(required=True)
 
     class Meta:
@@ -29,4 +32,10 @@ class WorkerInputMessageSchema(_WorkerInputMessageSchema):
                                      required=True)
 
 
+class BatchWorkerInputMessageSchema(_WorkerInputMessageSchema):
+    model_parameters = fields.Nested(ShapiroModelParameterSchema,
+                                     many=True, required=True,
+                                     validate=validate.Length(min=1))
+
+
 # ---- END OF <schema.py> ----
@@ -12,12 +12,18 @@
 SaSS (Shapiro and Smothed Seismicity) task facilities.
 """
 
-import io
+import functools
+import logging
+import os
+import re
+import threading
+import weakref
 
-import matlab.engine
-
-from ramsis.worker.utils.task import (AsyncTask, TaskStream, TaskError,
-                                      NotConfigured,
+from ramsis.worker.utils.metrics import PRELOADS
+from ramsis.worker.utils.pool import Pool
+from ramsis.worker.utils.serializer import to_ndarray
+from ramsis.worker.utils.task import (AsyncTask, RingBufferTaskStream,
+                                      TaskError, NotConfigured,
                                       InvalidConfiguration)
 
 
@@ -27,17 +33,119 @@ class InvalidMatlabFunction(TaskError):
 class MatlabError(TaskError):
     """MATLAB error ({})."""
 
+class PreloadError(TaskError):
+    """Preloading static data failed ({})."""
+
+
+# valid MATLAB variable names
+_MATLAB_IDENTIFIER = re.compile(r'^[A-Za-z][A-Za-z0-9_]{0,62}$')
+
 
-class SaSSTaskStream(io.StringIO, TaskStream):
+class SaSSTaskStream(RingBufferTaskStream):
 
     def __str__(self):
         try:
-            return self.getvalue()
+            return super().__str__()
         except Exception:
             return ''
 
 # class SaSSTaskStream
 
+
+class Preload(object):
+    """
+    Static model data (e.g. grids, velocity models or catalog background
+    rates) preloaded into the workspace of MATLAB engines. Each variable is
+    loaded (by means of MATLAB's `load`) as a global variable once per
+    engine and stays resident between runs. Model functions access the data
+    by declaring `global <name>` rather than reading the source file on
+    every call.
+
+    Variables are reloaded as soon as their source file changed i.e. its
+    modification time or size differs from the file loaded.
+
+    :param dict variables: Mapping of MATLAB variable names to source file
+        paths
+    """
+
+    LOGGER = 'ramsis.worker.sass_preload'
+
+    def __init__(self, variables, logger=None):
+        for name in variables:
+            if not _MATLAB_IDENTIFIER.match(name):
+                raise PreloadError(
+                    'Invalid variable name: {!r}'.format(name))
+
+        # NOTE(damb): MATLAB engines are started within the model
+        # directory.
+        self.variables = {name: os.path.abspath(path)
+                          for name, path in variables.items()}
+        # engine: {name: signature of the file loaded}
+        self._loaded = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+        self.logger = (logging.getLogger(logger) if logger else
+                       logging.getLogger(self.LOGGER))
+
+    # __init__ ()
+
+    def signatures(self):
+        """
+        :returns: Signatures (i.e. modification time and size) of the source
+            files by variable name
+        :rtype: dict
+        :raises PreloadError: If a source file is not accessible
+        """
+        retval = {}
+        for name, path in self.variables.items():
+            try:
+                stat = os.stat(path)
+            except OSError as err:
+                raise PreloadError(err)
+            retval[name] = (stat.st_mtime_ns, stat.st_size)
+        return retval
+
+    # signatures ()
+
+    def load(self, engine):
+        """
+        Load the variables into the workspace of `engine` unless they are
+        already resident and up to date. The engine must not be used
+        concurrently.
+
+        :returns: Names of the variables (re)loaded
+        :rtype: list
+        :raises PreloadError: If loading a variable failed
+        """
+        # NOTE(damb): Source files are checked before being loaded; files
+        # changing meanwhile are reloaded next time.
+        signatures = self.signatures()
+        with self._lock:
+            loaded = self._loaded.setdefault(engine, {})
+
+        stale = [name for name, signature in signatures.items()
+                 if loaded.get(name) != signature]
+        for name in stale:
+            path = self.variables[name]
+            self.logger.info('{} {!r} from {!r} into engine {!r} ...'.format(
+                'Reloading' if name in loaded else 'Loading', name, path,
+                engine))
+            try:
+                engine.eval("global {0}; {0} = load('{1}');".format(
+                    name, path.replace("'", "''")), nargout=0)
+            except Exception as err:
+                loaded.pop(name, None)
+                raise PreloadError('{}: {}'.format(path, err))
+            loaded[name] = signatures[name]
+            PRELOADS.inc()
+
+        return stale
+
+    # load ()
+
+# class Preload
+
+
 # -----------------------------------------------------------------------------
 class SaSSTask(AsyncTask):
     """
@@ -47,16 +155,35 @@ class SaSSTask(AsyncTask):
     The task currently makes use of the `MATLAB Python API
     <https://www.mathworks.com/help/matlab/matlab-engine-for-python.html>`_.
 
+    When executed the task leases a MATLAB engine from `pool`. The engine is
+    returned to the pool as soon as the task finished. With `preload` static
+    data is loaded into the engine's workspace before the MATLAB function is
+    called (unless already resident).
+
     :param str matlab_func: MATLAB function to be called.
+    :param pool: Pool of MATLAB engines
+    :type pool: :py:class:`ramsis.worker.utils.pool.Pool`
+    :param int stream_capacity: Capacity in bytes of the in-memory
+        stdout/stderr buffers
+    :param str spill_dir: Optional directory stdout/stderr evicted from the
+        buffers is spilled to
+    :param preload: Optional static data preloaded into the engine's
+        workspace
+    :type preload: :py:class:`Preload`
     """
 
     LOGGER = 'ramsis.worker.sass_task'
 
-    def __init__(self, matlab_func, func_nargout=1, matlab_opts=''):
-        self.engine = matlab.engine.start_matlab(matlab_opts)
+    def __init__(self, matlab_func, pool, func_nargout=1,
+                 stream_capacity=1024**2, spill_dir=None, preload=None):
+        self.engine = None
+        self._pool = pool
+        self._preload = preload
         self._func = matlab_func
         self._func_nargout = func_nargout
         self._func_args = None
+        self._stream_capacity = stream_capacity
+        self._spill_dir = spill_dir
 
         super().__init__(logger=self.LOGGER)
 
@@ -80,7 +207,8 @@ class SaSSTask(AsyncTask):
             # TODO(damb): The task has to order the kwargs and add it to the
             # _func_args list appropriately.
             try:
-                self._func_args = kwargs.values()
+                self._func_args = [_to_matlab_array(v)
+                                   for v in kwargs.values()]
             except KeyError as err:
                 raise InvalidConfiguration(err)
 
@@ -88,34 +216,262 @@ class SaSSTask(AsyncTask):
 
     # configure ()
 
+    def configure_batch(self, params):
+        """
+        Configure a task for the vectorized execution of multiple parameter
+        sets. Each function argument is passed as a row vector with one
+        element per parameter set; the MATLAB function is expected to
+        return results stacked along the first dimension.
+        """
+        if not self.is_configured:
+            try:
+                keys = list(params[0].keys())
+                self._func_args = [
+                    _to_matlab([p[k] for p in params]) for k in keys]
+            except (IndexError, KeyError, TypeError) as err:
+                raise InvalidConfiguration(err)
+
+            self.batch_size = len(params)
+            self.is_configured = True
+
+    # configure_batch ()
+
     def poll(self):
         if self._process and self._process.done():
-            self._result = self._process.result()
-            self._returncode = 0
+            if self._returncode is None:
+                try:
+                    self._result = to_ndarray(self._process.result())
+                except Exception as err:
+                    self._stderr.write(str(err))
+                    self._returncode = 1
+                else:
+                    self._returncode = 0
+                finally:
+                    self._release_engine()
             return self.returncode
         return None
 
     # poll ()
 
+    def wait(self, timeout=None):
+        if self._process is None:
+            return
+        try:
+            self._process.result(timeout=timeout)
+        except Exception:
+            # NOTE(damb): errors are handled when polling
+            pass
+
+    # wait ()
+
+    def cancel(self):
+        """
+        Cancel the MATLAB function call and return the engine to the pool.
+        """
+        if self._process is None or self._returncode is not None:
+            return False
+        if not self._process.cancel():
+            return False
+
+        self._stderr.write('Task cancelled.\n')
+        self._returncode = 1
+        self._release_engine()
+        return True
+
+    # cancel ()
+
+    def reset(self):
+        self._release_engine()
+        super().reset()
+
+    def prepare(self, timeout=None):
+        """
+        Lease a MATLAB engine from the pool and make sure static data (see
+        :py:class:`Preload`) is resident in the engine's workspace.
+
+        :param timeout: Timeout in seconds to wait for an idle engine
+        """
+        if not self.is_configured:
+            raise NotConfigured()
+
+        if self.engine is None:
+            self.engine = self._pool.acquire(timeout=timeout)
+        if self._preload is not None:
+            try:
+                self._preload.load(self.engine)
+            except Exception:
+                self._release_engine()
+                raise
+
+    # prepare ()
+
     def _run(self):
         if not self.is_configured:
             raise NotConfigured()
 
+        if self.engine is None:
+            self.prepare()
         try:
             matlab_func = getattr(self.engine, self._func)
         except AttributeError as err:
+            self._release_engine()
             raise InvalidMatlabFunction(err)
 
         # NOTE(damb): Due to the fact that the task is run asynchronously
         # capturing exceptions is not possible.
-        self._stdout = SaSSTaskStream()
-        self._stderr = SaSSTaskStream()
-        self._process = matlab_func(*self._func_args,
-                                    nargout=self._func_nargout,
-                                    async=True,
-                                    stdout=self._stdout,
-                                    stderr=self._stderr)
+        self._stdout = SaSSTaskStream(capacity=self._stream_capacity,
+                                      spill_dir=self._spill_dir)
+        self._stderr = SaSSTaskStream(capacity=self._stream_capacity,
+                                      spill_dir=self._spill_dir)
+        try:
+            self._process = matlab_func(*self._func_args,
+                                        nargout=self._func_nargout,
+                                        background=True,
+                                        stdout=self._stdout,
+                                        stderr=self._stderr)
+        except Exception as err:
+            self._release_engine()
+            raise MatlabError(err)
 
     # _run ()
 
+    def _release_engine(self):
+        if self.engine is not None:
+            self._pool.release(self.engine)
+            self.engine = None
+
+    # _release_engine ()
+
+# class SaSSTask
+
+
+def _to_matlab(values):
+    """
+    Convert a list of parameter values into a MATLAB row vector. Non-numeric
+    values are passed as a list i.e. as MATLAB cell array. Without the
+    MATLAB engine API values are passed as a list, too.
+    """
+    matlab = _import_matlab()
+    if matlab is not None and all(
+            isinstance(v, (int, float)) and not isinstance(v, bool)
+            for v in values):
+        return matlab.double([values])
+    return [_to_matlab_array(v) for v in values]
+
+# _to_matlab ()
+
+
+def _to_matlab_array(value):
+    """
+    Convert an array parameter (see
+    :py:class:`ramsis.worker.utils.schema.Array`) into a MATLAB row vector.
+    Other values are returned unchanged.
+
+    .. note::
+
+        Initializing MATLAB arrays from :py:class:`numpy.ndarray` objects
+        without copying element-wise requires MATLAB>=R2022a.
+    """
+    matlab = _import_matlab()
+    if matlab is None:
+        return value
+
+    import numpy as np
+
+    if isinstance(value, np.ndarray):
+        return matlab.double(value.reshape(1, -1))
+    return value
+
+# _to_matlab_array ()
+
+
+@functools.lru_cache(maxsize=None)
+def _import_matlab():
+    """
+    Import the MATLAB engine API lazily. Importing the API is expensive and
+    is deferred until the first engine is started (in the background).
+
+    :returns: The :py:mod:`matlab` package or `None` if the MATLAB engine API
+        is not available (e.g. when running with simulated engines, see
+        :py:mod:`ramsis.worker.SaSS.bench`)
+    """
+    try:
+        import matlab.engine
+    except ImportError:
+        return None
+    return matlab
+
+# _import_matlab ()
+
+
+# -----------------------------------------------------------------------------
+def start_engine(matlab_opts='', preload=None):
+    """
+    Start a MATLAB engine.
+
+    :param str matlab_opts: MATLAB startup options
+    :param preload: Optional static data loaded into the engine's workspace
+        at startup
+    :type preload: :py:class:`Preload`
+    :rtype: :py:class:`matlab.engine.MatlabEngine`
+    :raises MatlabError: If the MATLAB engine API is not available
+    """
+    matlab = _import_matlab()
+    if matlab is None:
+        raise MatlabError('MATLAB engine API not available.')
+    engine = matlab.engine.start_matlab(matlab_opts)
+    if preload is not None:
+        try:
+            preload.load(engine)
+        except Exception:
+            stop_engine(engine)
+            raise
+    return engine
+
+# start_engine ()
+
+
+def engine_is_healthy(engine):
+    """
+    Health check for a MATLAB engine.
+
+    :returns: `True` if the engine is responsive, else `False`
+    """
+    try:
+        engine.eval('true;', nargout=0)
+    except Exception:
+        return False
+    return True
+
+# engine_is_healthy ()
+
+
+def stop_engine(engine):
+    """
+    Stop a MATLAB engine.
+    """
+    engine.quit()
+
+# stop_engine ()
+
+
+def create_engine_pool(size=1, matlab_opts='', preload=None):
+    """
+    Factory function creating a pool of MATLAB engines. Note that the
+    engines are not started until :py:meth:`Pool.start` is called.
+
+    :param int size: Number of MATLAB engines
+    :param str matlab_opts: MATLAB startup options
+    :param preload: Optional static data loaded into the engines' workspace
+        at startup
+    :type preload: :py:class:`Preload`
+    :rtype: :py:class:`ramsis.worker.utils.pool.Pool`
+    """
+    return Pool(functools.partial(start_engine, matlab_opts=matlab_opts,
+                                  preload=preload),
+                size=size, health_check=engine_is_healthy,
+                destroy=stop_engine, logger='ramsis.worker.sass_engine_pool')
+
+# create_engine_pool ()
+
 # ---- END OF <task.py> ----
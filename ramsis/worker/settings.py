@@ -18,10 +18,78 @@ General purpose configuration constants.
 PATH_RAMSIS_WORKER_CONFIG = '/path/to/ramsis_config'
 # worker resource URL path
 PATH_RAMSIS_WORKER_SCENARIOS = '/runs'
+PATH_RAMSIS_WORKER_SCENARIO = '/runs/<run_id>'
+PATH_RAMSIS_WORKER_SCENARIOS_BATCH = '/runs/batch'
+PATH_RAMSIS_WORKER_SCENARIO_EVENTS = '/runs/<run_id>/events'
+PATH_RAMSIS_WORKER_SCENARIO_LOG = '/runs/<run_id>/log'
+# liveness and readiness probes
+PATH_RAMSIS_WORKER_HEALTH = '/health'
+PATH_RAMSIS_WORKER_READY = '/ready'
+# metrics in Prometheus text format
+PATH_RAMSIS_WORKER_METRICS = '/metrics'
+# admin resource (re)configuring the profiler
+PATH_RAMSIS_WORKER_PROFILING = '/admin/profiling'
+# maximum number of queued runs (0 means unbounded)
+RAMSIS_WORKER_QUEUE_SIZE = 64
+# capacity of the in-memory stdout/stderr buffer per run in KB
+RAMSIS_WORKER_LOG_CAPACITY = 1024
+# default wall-clock deadline of a run's execution in seconds (0 disables
+# the deadline)
+RAMSIS_WORKER_RUN_TIMEOUT = 0
+# maximum number of parameter sets per batch run (0 means unbounded)
+RAMSIS_WORKER_BATCH_CHUNK_SIZE = 0
+# maximum size of a decoded input message in MB (0 disables the limit)
+RAMSIS_WORKER_MAX_PAYLOAD_SIZE = 256
+# result cache size in MB (0 disables caching) and time-to-live in seconds
+RAMSIS_WORKER_CACHE_SIZE = 64
+RAMSIS_WORKER_CACHE_TTL = 24 * 3600
+# size of the on-disk result cache tier in MB (0 means unbounded)
+RAMSIS_WORKER_CACHE_DISK_SIZE = 1024
+RAMSIS_WORKER_RESPONSE_CACHE_SIZE = 64
+# retention period of persistently stored results in seconds
+RAMSIS_WORKER_STORE_RETENTION = 7 * 24 * 3600
+# retention period of finished runs never fetched in seconds and maximum
+# number of finished runs kept in memory (0 disables the respective limit)
+RAMSIS_WORKER_RUN_RETENTION = 3600
+RAMSIS_WORKER_MAX_FINISHED_RUNS = 1000
+# fraction of requests and runs profiled (0 disables profiling), profiling
+# mode (either 'cprofile' or 'sample') and stack sampling interval in seconds
+RAMSIS_WORKER_PROFILE_RATE = 0.
+RAMSIS_WORKER_PROFILE_MODE = 'cprofile'
+RAMSIS_WORKER_PROFILE_INTERVAL = 0.005
+# benchmark: simulated compute latency in seconds, number of values of a
+# simulated result, number of concurrent clients and number of measured runs
+RAMSIS_WORKER_BENCH_LATENCY = 0.1
+RAMSIS_WORKER_BENCH_RESULT_SIZE = 1
+RAMSIS_WORKER_BENCH_CONCURRENCY = 4
+RAMSIS_WORKER_BENCH_RUNS = 100
+# server: either 'dev' (local single-process WSGI server) or 'production'
+# (prefork multi-process WSGI server)
+RAMSIS_WORKER_SERVER = 'dev'
+RAMSIS_WORKER_HOST = '127.0.0.1'
+# production server worker processes and request handling threads per
+# process
+RAMSIS_WORKER_SERVER_WORKERS = 2
+RAMSIS_WORKER_SERVER_THREADS = 8
+# production server keep-alive, worker timeout and graceful shutdown timeout
+# in seconds
+RAMSIS_WORKER_SERVER_KEEPALIVE = 5
+RAMSIS_WORKER_SERVER_TIMEOUT = 30
+RAMSIS_WORKER_SERVER_GRACEFUL_TIMEOUT = 30
+# dispatcher: number of local worker processes, health probe interval and
+# timeout of forwarded requests in seconds (must exceed the long-polling
+# upper bound)
+RAMSIS_WORKER_DISPATCH_WORKERS = 2
+RAMSIS_WORKER_DISPATCH_HEALTH_INTERVAL = 1.
+RAMSIS_WORKER_DISPATCH_TIMEOUT = 120
 
 # -----------------------------------------------------------------------------
 # SaSS worker specific settings
 RAMSIS_WORKER_SASS_PORT = 5000
 RAMSIS_WORKER_SASS_CONFIG_SECTION = 'CONFIG_WORKER_SASS'
+# number of pooled MATLAB engines
+RAMSIS_WORKER_SASS_POOL_SIZE = 1
+RAMSIS_WORKER_SASS_BENCH_CONFIG_SECTION = 'CONFIG_WORKER_SASS_BENCH'
+RAMSIS_WORKER_SASS_DISPATCH_CONFIG_SECTION = 'CONFIG_WORKER_SASS_DISPATCH'
 
 # ---- END OF <settings.py> ----
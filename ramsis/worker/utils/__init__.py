@@ -12,7 +12,15 @@
 General purpose ramsis.workers utilities
 """
 
-import pkg_resources
+import functools
+import importlib
+import importlib.util
+
+try:
+    from importlib import metadata
+except ImportError:
+    # Python < 3.8
+    metadata = None
 
 # -----------------------------------------------------------------------------
 def get_version(namespace_pkg_name=None):
@@ -23,13 +31,22 @@ def get_version(namespace_pkg_name=None):
     :returns: version string
     :rtype: str
     """
+    if metadata is None:
+        # NOTE(damb): importing pkg_resources is expensive
+        import pkg_resources
+
+        def version(name):
+            return pkg_resources.get_distribution(name).version
+    else:
+        version = metadata.version
+
     try:
         # distributed as namespace package
         if namespace_pkg_name:
-            return pkg_resources.get_distribution(namespace_pkg_name).version
+            return version(namespace_pkg_name)
         raise
     except Exception:
-        return pkg_resources.get_distribution("ramsis.worker").version
+        return version("ramsis.worker")
 
 # get_version ()
 
@@ -39,6 +56,40 @@ def escape_newline(s):
 
     :param str s: String to be processed.
     """
-    return s.replace('\n','\\n').replace('\r','\\r')
+    return s.replace('\n', '\\n').replace('\r', '\\r')
+
+# escape_newline ()
+
+
+@functools.lru_cache(maxsize=None)
+def import_optional(name):
+    """
+    Import an optional module lazily.
+
+    :param str name: Module name
+    :returns: The module or `None` if the module is not available
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+# import_optional ()
+
+
+@functools.lru_cache(maxsize=None)
+def is_available(name):
+    """
+    :param str name: Module name
+    :returns: Whether the optional module `name` is available. The module is
+        looked up without being imported.
+    :rtype: bool
+    """
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+# is_available ()
 
 # ---- END OF <__init__.py> ----
@@ -0,0 +1,595 @@
+# This is <asgi.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: asyncio-native (ASGI) worker resource facilities.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+asyncio-native worker resource facilities. Resources are served by an ASGI
+server (e.g. `uvicorn <https://www.uvicorn.org>`_) by means of
+`Starlette <https://www.starlette.io>`_. Run completion is awaited rather
+than polled i.e. open status connections, long-polls and event streams cost
+coroutines instead of threads. Runs are still executed by the
+:py:class:`ramsis.worker.utils.executor.RunExecutor`.
+
+The Flask resources (see :py:mod:`ramsis.worker.utils.resource`) remain
+available; both flavours share the same collaborators and protocol.
+
+.. note::
+
+    Requires the `asgi` extra.
+"""
+
+import asyncio
+import contextvars
+import functools
+import inspect
+import logging
+import re
+
+from http import HTTPStatus
+
+from ramsis.utils.protocol import StatusCode, WorkerInputMessageSchema
+from ramsis.worker.utils import escape_newline
+from ramsis.worker.utils.executor import QueueFull
+from ramsis.worker.utils.metrics import CONTENT_TYPE, STAGE_LATENCY
+from ramsis.worker.utils.payload import (PayloadDecoder, PayloadError,
+                                         PayloadTooLarge, UnsupportedEncoding)
+from ramsis.worker.utils.profiling import ProfilingConfigSchema, session
+from ramsis.worker.utils.registry import RunState
+from ramsis.worker.utils.resource import (AsyncBatchWorkerResource,
+                                          AsyncWorkerResource,
+                                          MetricsResource, ProfilingResource,
+                                          WorkerError, _sse)
+from ramsis.worker.utils.response import conditional, negotiate_encoding
+from ramsis.worker.utils.schema import compiled_schema
+from ramsis.worker.utils.serializer import (DTYPES, MIMETYPE_JSON,
+                                            SerializationError, mimetypes,
+                                            negotiate_mimetype, serialize)
+from ramsis.worker.utils.task import TaskError
+
+try:
+    from starlette.applications import Starlette
+    from starlette.responses import Response, StreamingResponse
+    from starlette.routing import Route
+except ImportError:
+    Starlette = None
+
+
+# -----------------------------------------------------------------------------
+class AsgiWorkerResource(AsyncWorkerResource):
+    """
+    asyncio-native variant of
+    :py:class:`ramsis.worker.utils.resource.AsyncWorkerResource`. Handlers
+    are coroutines taking a :py:class:`starlette.requests.Request`.
+
+    The input message is validated by means of the compiled schema returned
+    by :py:meth:`schema`. Overload it in order to validate model specific
+    `model_parameters`.
+    """
+    LOGGER = 'ramsis.worker_resource_asgi'
+
+    def schema(self):
+        """
+        :returns: Compiled schema the input message is validated with
+        :rtype: :py:class:`ramsis.worker.utils.schema.CompiledSchema`
+        """
+        return compiled_schema(WorkerInputMessageSchema)
+
+    async def __call__(self, request):
+        run_id = request.path_params.get('run_id')
+        with session(self._profiler, request.method.lower(), run_id=run_id):
+            if request.method == 'GET':
+                return await self.get(request, run_id=run_id)
+            elif request.method == 'POST':
+                return await self.post(request, run_id=run_id)
+            elif request.method == 'DELETE':
+                return await self.delete(request, run_id=run_id)
+        return _response('Method not allowed.',
+                         StatusCode.HTTPMethodNotAllowed.value)
+
+    # __call__ ()
+
+    async def get(self, request, run_id=None):
+        """
+        HTTP GET method. See
+        :py:meth:`ramsis.worker.utils.resource.AsyncWorkerResource.get`.
+        """
+        # NOTE(damb): Polling may finish a run i.e. invoke its done
+        # callbacks (storing and caching the result).
+        if run_id is None:
+            runs = self.registry().runs()
+            states = await _offload(_poll, runs)
+            # TODO(damb): Standardize ramsis client return values
+            return _response({'message': HTTPStatus.OK.phrase,
+                              'result': [{'run_id': run.id,
+                                          'state': state.value}
+                                         for run, state in zip(runs, states)]},
+                             HTTPStatus.OK.value)
+
+        wait = min(_query(request, 'wait', 0, float), self.MAX_WAIT)
+
+        run = self.registry().get(run_id)
+        if run is not None:
+            state = await _offload(run.poll)
+            if not run.is_finished and wait > 0:
+                # long-polling
+                state = await run.wait_async(timeout=wait)
+            if not run.is_finished:
+                return self._processing(run.id, state,
+                                        self.executor().position(run.id))
+
+        if self._store is not None:
+            record = await _offload(self._store.get, run_id)
+            if run is None and record is not None and record.finished is None:
+                # the run is executed by another worker process sharing the
+                # store
+                if wait > 0:
+                    record = await _wait_stored(self._store, run_id, wait)
+                if record is not None and record.finished is None:
+                    return self._processing(run_id, record.state)
+            if record is not None and record.finished is not None:
+                return await self._finished(
+                    request, record.run_id, record.state, record.result,
+                    record.error, record.stdout, record.stderr,
+                    batch_size=record.batch_size)
+
+        if run is None:
+            retained = self._retained(run_id)
+            if retained is not None:
+                return await self._finished(
+                    request, run_id, RunState.DONE, retained[0], None, None,
+                    None, batch_size=retained[1])
+
+            self.logger.debug('No such run: {!r}'.format(run_id))
+            return _response({'message': HTTPStatus.NOT_FOUND.phrase,
+                              'result': []}, HTTPStatus.NOT_FOUND.value)
+
+        try:
+            result = run.task.result if state is RunState.DONE else None
+        except Exception as err:
+            msg = 'Failed to fetch results ({})'.format(err)
+            self.logger.warning(msg)
+            return _response({'message': msg,
+                              'run_id': run.id,
+                              'result': []}, StatusCode.WorkerError.value)
+
+        # without a store the run is dropped; the result is retained by the
+        # response cache (if configured)
+        self.registry().remove(run.id)
+        retval = await self._finished(request, run.id, state, result,
+                                      run.error, run.task.stdout,
+                                      run.task.stderr,
+                                      batch_size=run.task.batch_size)
+        if state is RunState.DONE:
+            self._retain(run.id, result, batch_size=run.task.batch_size)
+        await _offload(run.task.reset)
+        return retval
+
+    # get ()
+
+    async def post(self, request, run_id=None):
+        """
+        HTTP POST method. See
+        :py:meth:`ramsis.worker.utils.resource.AsyncWorkerResource.post`.
+        """
+        if run_id is not None:
+            return _response('Method not allowed.',
+                             StatusCode.HTTPMethodNotAllowed.value)
+
+        self.logger.debug('Received HTTP POST request.')
+        try:
+            args, errors = await self._load(request)
+            if errors:
+                return _response({'errors': errors},
+                                 StatusCode.UnprocessableEntity.value)
+
+            # NOTE(damb): Submitting looks up the result cache and records
+            # the run with the store.
+            retval = await _offload(
+                self._submit, args,
+                priority=_query(request, 'priority', 0, int),
+                timeout=_query(request, 'timeout', None, float))
+            return _response(*retval)
+
+        except PayloadTooLarge as err:
+            return _response({'errors': {'json': [str(err)]}},
+                             HTTPStatus.REQUEST_ENTITY_TOO_LARGE.value)
+        except UnsupportedEncoding as err:
+            return _response({'errors': {'json': [str(err)]}},
+                             HTTPStatus.UNSUPPORTED_MEDIA_TYPE.value)
+        except QueueFull as err:
+            retry_after = self.executor().retry_after()
+            self.logger.warning('{} (Retry-After: {}s)'.format(
+                err, retry_after))
+            return _response({'message': str(err),
+                              'result': []},
+                             HTTPStatus.SERVICE_UNAVAILABLE.value,
+                             {'Retry-After': str(retry_after)})
+        except TaskError as err:
+            self.logger.warning('{}'.format(err))
+            return _response({'message': str(err),
+                              'result': []}, StatusCode.WorkerError.value)
+        except Exception as err:
+            self.logger.error('{}'.format(err))
+            return _response({'message': str(err),
+                              'result': []}, StatusCode.WorkerError.value)
+
+    # post ()
+
+    async def delete(self, request, run_id=None):
+        """
+        HTTP DELETE method. See
+        :py:meth:`ramsis.worker.utils.resource.AsyncWorkerResource.delete`.
+        """
+        if run_id is None:
+            return _response('Method not allowed.',
+                             StatusCode.HTTPMethodNotAllowed.value)
+        # NOTE(damb): Cancelling a run may block until the task's process
+        # exited.
+        return _response(*await _offload(self._delete, run_id))
+
+    # delete ()
+
+    async def _load(self, request):
+        """
+        Load and validate the input message. The body is streamed (see
+        :py:mod:`ramsis.worker.utils.payload`).
+
+        :returns: Tuple of the form `(args, errors)`
+        :raises PayloadTooLarge: If the decoded input message exceeds
+            `max_payload_size`
+        :raises UnsupportedEncoding: If the body's content encoding is not
+            supported
+        """
+        schema = self.schema()
+        with STAGE_LATENCY.time(stage='parse'):
+            decoder = PayloadDecoder(
+                encoding=request.headers.get('content-encoding'),
+                arrays=schema.arrays, max_bytes=self.max_payload_size)
+            try:
+                async for chunk in request.stream():
+                    decoder.feed(chunk)
+                message = decoder.close()
+            except (PayloadTooLarge, UnsupportedEncoding):
+                raise
+            except PayloadError as err:
+                return None, {'json': [str(err)]}
+            return schema.load(message)
+
+    # _load ()
+
+    def _accepted(self, run, queue_position=None):
+        # NOTE(damb): Location headers require the request; clients use the
+        # run identifier.
+        return ({'message': StatusCode.TaskAccepted.name,
+                 'run_id': run.id,
+                 'state': run.state.value,
+                 'queue_position': queue_position,
+                 'result': []}, StatusCode.TaskAccepted.value)
+
+    # _accepted ()
+
+    def _processing(self, run_id, state, queue_position=None):
+        # TODO(damb): Standardize ramsis client return values
+        return _response({'message': StatusCode.TaskCurrentlyProcessing.name,
+                          'run_id': run_id,
+                          'state': state.value,
+                          'queue_position': queue_position,
+                          'result': []},
+                         StatusCode.TaskCurrentlyProcessing.value)
+
+    # _processing ()
+
+    async def _finished(self, request, run_id, state, result, error, stdout,
+                        stderr, batch_size=None):
+        """
+        Create the response for a finished run.
+        """
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        if state is not RunState.DONE:
+            self.logger.warning('Run {} execution failed ({}).'.format(
+                run_id, error))
+            if debug and stderr:
+                self.logger.debug('Run {} STDERR: {}'.format(
+                    run_id, escape_newline(str(stderr))))
+            return _response({'message': StatusCode.TaskProcessingError.name,
+                              'run_id': run_id,
+                              'state': state.value,
+                              'result': []},
+                             StatusCode.TaskProcessingError.value)
+
+        if debug and stdout:
+            self.logger.debug('Run {} STDOUT: {}'.format(
+                run_id, escape_newline(str(stdout))))
+
+        mimetype = negotiate_mimetype(request.headers.get('accept'))
+        if mimetype is None:
+            return _response({'message': HTTPStatus.NOT_ACCEPTABLE.phrase,
+                              'result': mimetypes()},
+                             HTTPStatus.NOT_ACCEPTABLE.value)
+        dtype = request.query_params.get('dtype')
+        if dtype is not None and dtype not in DTYPES:
+            return _response({'message': 'Invalid dtype: {!r}'.format(dtype),
+                              'result': list(DTYPES)},
+                             HTTPStatus.BAD_REQUEST.value)
+
+        try:
+            rep = await _offload(
+                self._represent, run_id, state, result, mimetype, dtype=dtype,
+                encoding=negotiate_encoding(
+                    request.headers.get('accept-encoding')),
+                batch_size=batch_size)
+        except SerializationError as err:
+            msg = 'Failed to serialize results ({})'.format(err)
+            self.logger.warning(msg)
+            return _response({'message': msg,
+                              'run_id': run_id,
+                              'result': []}, StatusCode.WorkerError.value)
+
+        status, body, headers = conditional(rep, request.headers)
+        headers.update({'X-Run-Id': run_id, 'X-Run-State': state.value})
+        return Response(body, status_code=status, media_type=mimetype,
+                        headers=headers)
+
+    # _finished ()
+
+# class AsgiWorkerResource
+
+
+class AsgiBatchWorkerResource(AsgiWorkerResource, AsyncBatchWorkerResource):
+    """
+    asyncio-native variant of
+    :py:class:`ramsis.worker.utils.resource.AsyncBatchWorkerResource`.
+    """
+    LOGGER = 'ramsis.worker_resource_asgi_batch'
+
+    async def get(self, request, run_id=None):
+        return _response('Method not allowed.',
+                         StatusCode.HTTPMethodNotAllowed.value)
+
+# class AsgiBatchWorkerResource
+
+
+class AsgiRunEventsResource(object):
+    """
+    asyncio-native variant of
+    :py:class:`ramsis.worker.utils.resource.RunEventsResource`.
+    """
+    LOGGER = 'ramsis.worker_resource_asgi_events'
+
+    KEEPALIVE = 15
+
+    def __init__(self, registry=None, store=None, logger=None):
+        self._registry = registry
+        self._store = store
+        self.logger = (logging.getLogger(logger) if logger else
+                       logging.getLogger(self.LOGGER))
+
+    async def __call__(self, request):
+        run_id = request.path_params['run_id']
+        run = self._registry.get(run_id) if self._registry else None
+        if run is not None:
+            events = self._events(run)
+        else:
+            record = (await _offload(self._store.get, run_id)
+                      if self._store is not None else None)
+            if record is None:
+                return _response({'message': HTTPStatus.NOT_FOUND.phrase,
+                                  'result': []}, HTTPStatus.NOT_FOUND.value)
+            events = self._stored_events(record)
+
+        return StreamingResponse(events, media_type='text/event-stream',
+                                 headers={'Cache-Control': 'no-cache',
+                                          'X-Accel-Buffering': 'no'})
+
+    # __call__ ()
+
+    async def _events(self, run):
+        state = run.state
+        yield _sse(run.id, state, run.error)
+        while state not in (RunState.DONE, RunState.FAILED):
+            _state = await run.wait_for_transition_async(
+                state, timeout=self.KEEPALIVE)
+            if _state is state:
+                yield ': keep-alive\n\n'
+                continue
+            state = _state
+            yield _sse(run.id, state, run.error)
+
+    # _events ()
+
+    async def _stored_events(self, record):
+        yield _sse(record.run_id, record.state, record.error)
+        while record is not None and record.finished is None:
+            state = record.state
+            record = await _wait_stored(self._store, record.run_id,
+                                        self.KEEPALIVE)
+            if record is None:
+                break
+            if record.state is state:
+                yield ': keep-alive\n\n'
+                continue
+            yield _sse(record.run_id, record.state, record.error)
+
+    # _stored_events ()
+
+# class AsgiRunEventsResource
+
+
+class AsgiRunLogResource(object):
+    """
+    asyncio-native variant of
+    :py:class:`ramsis.worker.utils.resource.RunLogResource`.
+    """
+    LOGGER = 'ramsis.worker_resource_asgi_log'
+
+    MAX_BYTES = 1024**2
+
+    def __init__(self, registry=None, store=None, logger=None):
+        self._registry = registry
+        self._store = store
+        self.logger = (logging.getLogger(logger) if logger else
+                       logging.getLogger(self.LOGGER))
+
+    async def __call__(self, request):
+        run_id = request.path_params['run_id']
+        name = request.query_params.get('stream', 'stdout')
+        offset = _query(request, 'offset', 0, int)
+        if name not in ('stdout', 'stderr'):
+            return _response({'message': 'Invalid stream: {!r}'.format(name),
+                              'result': []}, HTTPStatus.BAD_REQUEST.value)
+
+        run = self._registry.get(run_id) if self._registry else None
+        if run is not None:
+            state = run.state
+            # NOTE(damb): Output exceeding the in-memory buffer is read from
+            # the spill file.
+            data, next_offset = await _offload(
+                run.task.read_stream, name, offset=offset,
+                max_bytes=self.MAX_BYTES)
+        else:
+            record = (await _offload(self._store.get, run_id)
+                      if self._store is not None else None)
+            if record is None:
+                return _response({'message': HTTPStatus.NOT_FOUND.phrase,
+                                  'result': []}, HTTPStatus.NOT_FOUND.value)
+            state = record.state
+            data = (getattr(record, name) or '').encode('utf-8')
+            data = data[offset:offset + self.MAX_BYTES]
+            next_offset = offset + len(data)
+
+        return Response(data, media_type='text/plain',
+                        headers={'X-Log-Offset': str(next_offset),
+                                 'X-Run-State': state.value})
+
+    # __call__ ()
+
+# class AsgiRunLogResource
+
+
+class AsgiMetricsResource(MetricsResource):
+    """
+    asyncio-native variant of
+    :py:class:`ramsis.worker.utils.resource.MetricsResource`.
+    """
+
+    async def __call__(self, request):
+        return Response(self.render(), headers={'Content-Type': CONTENT_TYPE})
+
+# class AsgiMetricsResource
+
+
+class AsgiProfilingResource(ProfilingResource):
+    """
+    asyncio-native variant of
+    :py:class:`ramsis.worker.utils.resource.ProfilingResource`.
+    """
+
+    async def __call__(self, request):
+        if request.method == 'PUT':
+            args, errors = compiled_schema(ProfilingConfigSchema).loads(
+                await request.body())
+            if errors:
+                return _response({'errors': errors},
+                                 StatusCode.UnprocessableEntity.value)
+            return _response(*self._configure(args))
+        return _response(*self.get())
+
+# class AsgiProfilingResource
+
+
+# -----------------------------------------------------------------------------
+def create_app(resources):
+    """
+    Create an ASGI application.
+
+    :param list resources: List of tuples of the form `(path, resource,
+        methods)`. Paths use the Flask URL rule syntax (e.g.
+        `/runs/<run_id>`). Resources are coroutine callables taking a
+        request. Callables returning a tuple of the form `(body, status)`
+        (e.g. bound methods of Flask-RESTful resources which do not access
+        the request) are wrapped.
+    :rtype: :py:class:`starlette.applications.Starlette`
+    """
+    if Starlette is None:
+        raise WorkerError(
+            "ASGI resources require 'starlette' (install the 'asgi' extra).")
+
+    routes = []
+    for path, resource, methods in resources:
+        endpoint = (resource if inspect.isroutine(resource) else
+                    resource.__call__)
+        if not asyncio.iscoroutinefunction(endpoint):
+            endpoint = _wrap(endpoint)
+        routes.append(Route(re.sub(r'<(?:\w+:)?(\w+)>', r'{\1}', path),
+                            endpoint=endpoint, methods=list(methods)))
+
+    return Starlette(routes=routes)
+
+# create_app ()
+
+
+def _wrap(fn):
+    async def endpoint(request):
+        return _response(*fn())
+
+    return endpoint
+
+# _wrap ()
+
+
+def _response(body, status, headers=None):
+    return Response(serialize(MIMETYPE_JSON, body, None),
+                    status_code=status, media_type=MIMETYPE_JSON,
+                    headers=headers)
+
+# _response ()
+
+
+def _query(request, key, default, type):
+    try:
+        return type(request.query_params[key])
+    except (KeyError, ValueError):
+        return default
+
+# _query ()
+
+
+def _poll(runs):
+    return [run.poll() for run in runs]
+
+
+async def _wait_stored(store, run_id, timeout):
+    """
+    Awaitable variant of
+    :py:meth:`ramsis.worker.utils.store.ResultStore.wait`.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        record = await _offload(store.get, run_id)
+        remaining = deadline - loop.time()
+        finished = record is None or record.finished is not None
+        if finished or remaining <= 0:
+            return record
+        await asyncio.sleep(min(store.POLL_INTERVAL, remaining))
+
+# _wait_stored ()
+
+
+async def _offload(fn, *args, **kwargs):
+    """
+    Call `fn` by means of the event loop's default executor i.e. without
+    blocking the event loop. `fn` is called within a copy of the current
+    context (e.g. the profiling session is preserved).
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        None, functools.partial(context.run, fn, *args, **kwargs))
+
+# _offload ()
+
+# ---- END OF <asgi.py> ----
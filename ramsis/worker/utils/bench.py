@@ -0,0 +1,298 @@
+# This is <bench.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Benchmark facilities.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Benchmark facilities for worker webservices. Runs are driven through the
+`/runs` API i.e. the full `POST` → poll → `GET` cycle at a configurable
+concurrency. Results are reported as a JSON serializable mapping such that
+regressions can be detected by comparing subsequent benchmarks.
+"""
+
+import concurrent.futures
+import http.client
+import json
+import logging
+import socket
+import threading
+import time
+import urllib.parse
+
+from ramsis.utils.error import Error
+from ramsis.utils.protocol import StatusCode
+from ramsis.worker import settings
+
+
+PERCENTILES = (50, 90, 99)
+
+
+# -----------------------------------------------------------------------------
+class BenchmarkError(Error):
+    """Base benchmark error ({})."""
+
+
+# -----------------------------------------------------------------------------
+class Benchmark(object):
+    """
+    Benchmark driving runs through the `/runs` API of a worker webservice.
+    Each client thread uses its own persistent HTTP connection.
+
+    :param str url: Base URL of the worker webservice
+    :param params: Callable taking the (0-based) run index and returning the
+        run's `model_parameters`
+    :param int concurrency: Number of concurrent clients
+    :param int runs: Number of measured runs
+    :param int warmup: Number of runs executed (but not measured) before
+        the benchmark
+    :param float poll_interval: Interval in seconds runs are polled with. If
+        `0` runs are long-polled.
+    :param float timeout: Timeout in seconds of a single run
+    """
+
+    LOGGER = 'ramsis.worker.bench'
+
+    # long-polling interval in seconds
+    WAIT = 30
+
+    def __init__(self, url, params, concurrency=1, runs=100, warmup=0,
+                 poll_interval=0, timeout=300, logger=None):
+        self.url = urllib.parse.urlsplit(url)
+        self.params = params
+        self.concurrency = concurrency
+        self.runs = runs
+        self.warmup = warmup
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+        self.logger = (logging.getLogger(logger) if logger else
+                       logging.getLogger(self.LOGGER))
+
+        self._local = threading.local()
+
+    # __init__ ()
+
+    def wait_ready(self, timeout=60):
+        """
+        Block until the worker reports to be ready.
+
+        :raises BenchmarkError: If the worker is not ready within `timeout`
+            seconds
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                status, _ = self._request('GET',
+                                          settings.PATH_RAMSIS_WORKER_READY)
+            except (OSError, http.client.HTTPException):
+                self._close()
+            else:
+                if status == 200:
+                    return
+            time.sleep(0.1)
+
+        raise BenchmarkError('Worker not ready (timeout={}s).'.format(timeout))
+
+    # wait_ready ()
+
+    def run(self):
+        """
+        Run the benchmark.
+
+        :returns: Benchmark report
+        :rtype: dict
+        """
+        if self.warmup:
+            self.logger.info('Warming up ({} runs) ...'.format(self.warmup))
+            self._execute(range(self.warmup))
+
+        self.logger.info(
+            'Benchmarking {} runs (concurrency={}) ...'.format(
+                self.runs, self.concurrency))
+        start = time.monotonic()
+        samples = self._execute(range(self.warmup, self.warmup + self.runs))
+        duration = time.monotonic() - start
+
+        succeeded = [s for s in samples if s['error'] is None]
+        errors = {}
+        for s in samples:
+            if s['error'] is not None:
+                errors[s['error']] = errors.get(s['error'], 0) + 1
+
+        return {
+            'concurrency': self.concurrency,
+            'poll_interval': self.poll_interval,
+            'runs': len(samples),
+            'succeeded': len(succeeded),
+            'errors': errors,
+            'duration': duration,
+            'runs_per_second': len(succeeded) / duration if duration else 0.,
+            'latency': summarize([s['latency'] for s in succeeded]),
+            'submit_latency': summarize([s['submit'] for s in succeeded]),
+            'polls': summarize([s['polls'] for s in succeeded]), }
+
+    # run ()
+
+    def _execute(self, indices):
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.concurrency,
+                thread_name_prefix='ramsis-bench') as executor:
+            return list(executor.map(self._cycle, indices))
+
+    def _cycle(self, index):
+        """
+        Drive a single run through the `POST` → poll → `GET` cycle.
+
+        :returns: Sample of the form `{'latency': ..., 'submit': ...,
+            'polls': ..., 'error': ...}`
+        :rtype: dict
+        """
+        sample = {'latency': None, 'submit': None, 'polls': 0, 'error': None}
+        start = time.monotonic()
+        try:
+            status, body = self._request(
+                'POST', settings.PATH_RAMSIS_WORKER_SCENARIOS,
+                {'model_parameters': self.params(index)})
+            sample['submit'] = time.monotonic() - start
+            if status != StatusCode.TaskAccepted.value:
+                raise BenchmarkError('POST: HTTP {}'.format(status))
+
+            path = settings.PATH_RAMSIS_WORKER_SCENARIO.replace(
+                '<run_id>', body['run_id'])
+            if not self.poll_interval:
+                path += '?wait={}'.format(self.WAIT)
+
+            deadline = start + self.timeout
+            while True:
+                status, body = self._request('GET', path)
+                sample['polls'] += 1
+                if status != StatusCode.TaskCurrentlyProcessing.value:
+                    break
+                if time.monotonic() > deadline:
+                    raise BenchmarkError('Timeout')
+                if self.poll_interval:
+                    time.sleep(self.poll_interval)
+
+            if status != StatusCode.TaskCompleted.value:
+                raise BenchmarkError('GET: HTTP {}'.format(status))
+            if body.get('state') != 'done':
+                raise BenchmarkError('Run {}'.format(body.get('state')))
+        except (OSError, http.client.HTTPException, ValueError) as err:
+            self._close()
+            sample['error'] = type(err).__name__
+        except BenchmarkError as err:
+            sample['error'] = err.args[0]
+        else:
+            sample['latency'] = time.monotonic() - start
+
+        return sample
+
+    # _cycle ()
+
+    def _request(self, method, path, payload=None):
+        """
+        :returns: Tuple of the form `(status, body)`
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(
+                self.url.hostname, self.url.port, timeout=self.timeout)
+
+        headers = {'Accept': 'application/json'}
+        data = None
+        if payload is not None:
+            data = json.dumps(payload).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        conn.request(method, self.url.path.rstrip('/') + path, body=data,
+                     headers=headers)
+        resp = conn.getresponse()
+        body = resp.read()
+        return resp.status, json.loads(body) if body else None
+
+    # _request ()
+
+    def _close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+# class Benchmark
+
+
+def summarize(values):
+    """
+    Summarize `values` by means of percentiles.
+
+    :rtype: dict
+    """
+    if not values:
+        return None
+
+    import numpy as np
+
+    arr = np.asarray(values, dtype=float)
+    retval = {'mean': float(arr.mean()), 'min': float(arr.min()),
+              'max': float(arr.max())}
+    for p, v in zip(PERCENTILES, np.percentile(arr, PERCENTILES)):
+        retval['p{}'.format(p)] = float(v)
+    return retval
+
+# summarize ()
+
+
+def serve_background(app, host, port, asgi=False):
+    """
+    Serve `app` within a background thread of the current process.
+
+    :param app: Either a WSGI or (if `asgi` is set) an ASGI application
+    :returns: Callable stopping the server
+    :raises BenchmarkError: If the ASGI server is not available
+    """
+    if asgi:
+        try:
+            import uvicorn
+        except ImportError:
+            raise BenchmarkError(
+                "ASGI server requires 'uvicorn' (install the 'asgi' extra).")
+
+        server = uvicorn.Server(uvicorn.Config(app, host=host, port=port,
+                                               log_level='warning'))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+
+        def stop():
+            server.should_exit = True
+            thread.join()
+    else:
+        from werkzeug.serving import make_server
+
+        # suppress the request log
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        server = make_server(host, port, app, threaded=True)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        def stop():
+            server.shutdown()
+            thread.join()
+
+    return stop
+
+# serve_background ()
+
+
+def free_port(host='127.0.0.1'):
+    """
+    :returns: A currently unused TCP port
+    :rtype: int
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+# free_port ()
+
+# ---- END OF <bench.py> ----
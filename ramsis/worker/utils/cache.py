@@ -0,0 +1,330 @@
+# This is <cache.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Result cache facilities.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Content-addressed result cache facilities. Results are keyed on a canonical
+hash of the (validated) worker input message.
+"""
+
+import collections
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+from ramsis.utils.error import Error
+
+
+# -----------------------------------------------------------------------------
+class CacheError(Error):
+    """Base cache error ({})."""
+
+
+def _hash_default(obj):
+    import numpy as np
+
+    if isinstance(obj, np.ndarray):
+        # NOTE(damb): str() abbreviates large arrays
+        arr = np.ascontiguousarray(obj)
+        return 'ndarray:{}:{}:{}'.format(
+            arr.dtype.str, arr.shape, hashlib.sha256(arr.data).hexdigest())
+    return str(obj)
+
+
+def canonical_hash(payload):
+    """
+    Compute a canonical hash of a JSON serializable payload. The hash does
+    not depend on the order of mapping keys. Arrays (e.g. decoded array
+    fields) are hashed by content.
+
+    :param payload: Payload to be hashed e.g. a validated input message
+    :returns: Hexadecimal SHA-256 digest
+    :rtype: str
+    """
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, separators=(',', ':'),
+                   default=_hash_default).encode('utf-8')).hexdigest()
+
+# canonical_hash ()
+
+
+# -----------------------------------------------------------------------------
+class ResultCache(object):
+    """
+    Thread-safe LRU cache for task results. Entries are stored pickled; the
+    memory tier is bounded by the total size of the pickled entries.
+    Optionally, entries are written through to an on-disk tier located at
+    `path`. Entries missing in memory are looked up on disk and promoted.
+    The on-disk tier is swept periodically: expired entries are removed and,
+    if the tier exceeds `max_disk_bytes`, the oldest entries are removed.
+
+    :param int max_bytes: Maximum size of the memory tier in bytes
+    :param ttl: Time-to-live of an entry in seconds. `None` disables
+        expiration.
+    :param str path: Optional directory of the on-disk tier
+    :param max_disk_bytes: Maximum size of the on-disk tier in bytes.
+        `None` means unbounded.
+    """
+
+    LOGGER = 'ramsis.worker.cache'
+
+    SUFFIX = '.pickle'
+    TMP_SUFFIX = '.tmp'
+    # minimum interval between sweeps of the on-disk tier in seconds
+    SWEEP_INTERVAL = 60
+    # age of abandoned temporary files removed when sweeping in seconds
+    TMP_MAX_AGE = 3600
+    # fraction of max_disk_bytes the on-disk tier is reduced to when sweeping
+    DISK_LOW_WATERMARK = 0.9
+
+    def __init__(self, max_bytes=64 * 1024**2, ttl=None, path=None,
+                 max_disk_bytes=None, logger=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.path = path
+        self.max_disk_bytes = max_disk_bytes
+
+        self.hits = 0
+        self.misses = 0
+
+        # key: (timestamp, data)
+        self._entries = collections.OrderedDict()
+        self._num_bytes = 0
+        self._num_disk_bytes = 0
+        self._last_sweep = None
+        self._lock = threading.Lock()
+
+        self.logger = (logging.getLogger(logger) if logger else
+                       logging.getLogger(self.LOGGER))
+
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+            self.sweep()
+
+    # __init__ ()
+
+    @property
+    def num_bytes(self):
+        return self._num_bytes
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.
+
+    def stats(self):
+        """
+        :returns: Cache statistics
+        :rtype: dict
+        """
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'entries': len(self._entries),
+                    'bytes': self._num_bytes}
+
+    # stats ()
+
+    def get(self, key):
+        """
+        Look up the result cached for `key`.
+
+        :returns: Tuple of the form `(hit, result)`
+        :rtype: tuple
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._is_expired(entry[0], time.monotonic()):
+                    self._pop(key)
+                    entry = None
+                else:
+                    self._entries.move_to_end(key)
+
+        if entry is None and self.path:
+            entry = self._load(key)
+            if entry is not None:
+                with self._lock:
+                    self._insert(key, entry[1], timestamp=entry[0])
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+
+        return True, pickle.loads(entry[1])
+
+    # get ()
+
+    def put(self, key, result):
+        """
+        Cache `result` for `key`.
+        """
+        try:
+            data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as err:
+            self.logger.warning(
+                'Result not cacheable ({}).'.format(err))
+            return
+
+        with self._lock:
+            self._insert(key, data)
+
+        if self.path:
+            self._dump(key, data)
+
+    # put ()
+
+    def sweep(self):
+        """
+        Sweep the on-disk tier. Expired entries and abandoned temporary files
+        are removed. If the tier exceeds `max_disk_bytes` the oldest entries
+        (by modification time) are removed.
+        """
+        if not self.path:
+            return
+
+        now = time.time()
+        entries = []
+        try:
+            with os.scandir(self.path) as it:
+                for f in it:
+                    try:
+                        st = f.stat()
+                    except OSError:
+                        continue
+                    age = now - st.st_mtime
+                    if f.name.endswith(self.SUFFIX):
+                        if self.ttl is not None and age > self.ttl:
+                            self._remove(f.path)
+                        else:
+                            entries.append((st.st_mtime, st.st_size, f.path))
+                    elif f.name.endswith(self.TMP_SUFFIX):
+                        if age > self.TMP_MAX_AGE:
+                            self._remove(f.path)
+        except OSError as err:
+            self.logger.warning(
+                'Failed to sweep cache directory {} ({}).'.format(
+                    self.path, err))
+            return
+
+        num_bytes = sum(size for _, size, _ in entries)
+        if self._exceeds_disk_limit(num_bytes):
+            # NOTE(damb): reduce the tier below a low watermark such that
+            # subsequent writes do not trigger a sweep each
+            limit = self.max_disk_bytes * self.DISK_LOW_WATERMARK
+            for _, size, fname in sorted(entries):
+                if num_bytes <= limit:
+                    break
+                if self._remove(fname):
+                    num_bytes -= size
+
+        with self._lock:
+            self._num_disk_bytes = num_bytes
+            self._last_sweep = time.monotonic()
+
+    # sweep ()
+
+    def _insert(self, key, data, timestamp=None):
+        self._pop(key)
+        if len(data) > self.max_bytes:
+            return
+
+        self._entries[key] = (
+            time.monotonic() if timestamp is None else timestamp, data)
+        self._num_bytes += len(data)
+        # LRU eviction
+        while self._num_bytes > self.max_bytes:
+            _key, (_, _data) = self._entries.popitem(last=False)
+            self._num_bytes -= len(_data)
+
+    # _insert ()
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._num_bytes -= len(entry[1])
+
+    def _is_expired(self, timestamp, now):
+        return self.ttl is not None and now - timestamp > self.ttl
+
+    def _exceeds_disk_limit(self, num_bytes):
+        if self.max_disk_bytes is None:
+            return False
+        return num_bytes > self.max_disk_bytes
+
+    def _sweep_due(self):
+        if self._last_sweep is None:
+            return True
+        return time.monotonic() - self._last_sweep > self.SWEEP_INTERVAL
+
+    def _filename(self, key):
+        return os.path.join(self.path, key + self.SUFFIX)
+
+    def _load(self, key):
+        fname = self._filename(key)
+        try:
+            age = time.time() - os.path.getmtime(fname)
+            if self.ttl is not None and age > self.ttl:
+                os.remove(fname)
+                return None
+            with open(fname, 'rb') as ifd:
+                data = ifd.read()
+        except OSError:
+            return None
+
+        # map the file age onto the monotonic clock of the memory tier
+        return time.monotonic() - age, data
+
+    # _load ()
+
+    def _dump(self, key, data):
+        if self._exceeds_disk_limit(len(data)):
+            return
+
+        tmp = None
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.path, suffix=self.TMP_SUFFIX)
+            with os.fdopen(fd, 'wb') as ofd:
+                ofd.write(data)
+            os.replace(tmp, self._filename(key))
+        except OSError as err:
+            if tmp is not None:
+                self._remove(tmp)
+            self.logger.warning(
+                'Failed to write cache entry {} ({}).'.format(key, err))
+            return
+
+        with self._lock:
+            self._num_disk_bytes += len(data)
+            due = self._exceeds_disk_limit(self._num_disk_bytes)
+            due = due or self._sweep_due()
+
+        if due:
+            self.sweep()
+
+    # _dump ()
+
+    def _remove(self, fname):
+        try:
+            os.remove(fname)
+        except FileNotFoundError:
+            return False
+        except OSError as err:
+            self.logger.warning(
+                'Failed to remove {} ({}).'.format(fname, err))
+            return False
+        return True
+
+# class ResultCache
+
+# ---- END OF <cache.py> ----
@@ -0,0 +1,757 @@
+# This is <dispatch.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Dispatcher facilities.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Dispatcher facilities. A :py:class:`Dispatcher` fronts several worker
+webservices (*backends*) on the same host by means of the worker's `/runs`
+API:
+
+    - New runs are routed to the least loaded backend providing free engine
+      capacity. The load of a backend is estimated from its readiness probe
+      (engines, queued and running runs) and the runs routed to it since.
+    - Runs are pinned to the backend they were routed to i.e. subsequent
+      requests of a run are forwarded to that backend.
+    - Backends are probed periodically. Unreachable backends are skipped
+      (failover); worker processes spawned by the dispatcher are restarted
+      once they exited (with an exponentially increasing delay if exiting
+      repeatedly).
+
+.. note::
+
+    The runs of a worker process which exited are lost unless the workers
+    share a persistent result store (`--store-dir`). With a shared store,
+    requests of a run whose backend is unreachable (or which is not pinned
+    e.g. after restarting the dispatcher) are forwarded to the remaining
+    backends.
+"""
+
+import collections
+import http.client
+import json
+import logging
+import math
+import subprocess
+import threading
+import time
+import urllib.parse
+
+from http import HTTPStatus
+
+from flask import Response, request
+from flask_restful import Resource
+
+from ramsis.utils.error import Error
+from ramsis.utils.protocol import StatusCode
+from ramsis.worker import settings
+
+
+# request headers forwarded to backends
+FORWARDED_HEADERS = ('Accept', 'Accept-Encoding', 'Content-Encoding',
+                     'Content-Type', 'If-None-Match', 'If-Range', 'Range')
+# response headers not forwarded to clients
+HOP_BY_HOP_HEADERS = ('connection', 'content-length', 'date', 'keep-alive',
+                      'server', 'transfer-encoding')
+
+# size in bytes of the chunks streamed responses are forwarded in
+CHUNK_SIZE = 64 * 1024
+
+
+# -----------------------------------------------------------------------------
+class DispatchError(Error):
+    """Base dispatch error ({})."""
+
+class NoBackendAvailable(DispatchError):
+    """No worker available ({})."""
+
+
+# -----------------------------------------------------------------------------
+class Backend(object):
+    """
+    A worker webservice fronted by the dispatcher. Requests are forwarded by
+    means of a persistent HTTP connection per thread.
+
+    :param str url: Base URL of the worker
+    :param list cmd: Optional command line spawning the worker process
+    :param float timeout: Timeout in seconds of forwarded requests
+    """
+
+    LOGGER = 'ramsis.worker.dispatch.backend'
+
+    # initial and maximum delay (in seconds) before respawning a worker
+    # process exiting repeatedly
+    RETRY_DELAY = 1.
+    MAX_RETRY_DELAY = 60.
+
+    def __init__(self, url, cmd=None,
+                 timeout=settings.RAMSIS_WORKER_DISPATCH_TIMEOUT,
+                 logger=None):
+        self.url = url
+        self.cmd = cmd
+        self.timeout = timeout
+        self.process = None
+        # delay before the worker process is respawned once exited; reset
+        # once the worker is ready
+        self.retry_delay = self.RETRY_DELAY
+        # monotonic time the exited worker process is respawned at
+        self.respawn_at = None
+
+        # state updated by means of readiness probes
+        self.reachable = False
+        self.ready = False
+        self.size = 0
+        self.running = 0
+        self.queued = 0
+        # runs routed since the last probe
+        self.pending = 0
+        # total number of runs routed
+        self.routed = 0
+
+        self._url = urllib.parse.urlsplit(url)
+        self._local = threading.local()
+
+        self.logger = (logging.getLogger(logger) if logger else
+                       logging.getLogger(self.LOGGER))
+
+    # __init__ ()
+
+    @property
+    def load(self):
+        """Estimated number of runs per engine."""
+        return (self.running + self.queued + self.pending) / max(self.size, 1)
+
+    @property
+    def free(self):
+        """Estimated number of idle engines."""
+        return self.size - self.running - self.queued - self.pending
+
+    @property
+    def exited(self):
+        """`True` if the spawned worker process exited."""
+        return self.process is not None and self.process.poll() is not None
+
+    def spawn(self):
+        """
+        (Re)start the worker process.
+        """
+        self.logger.info('Spawning worker {} ...'.format(self.url))
+        self.respawn_at = None
+        self.process = subprocess.Popen(self.cmd)
+
+    def terminate(self, timeout=10):
+        """
+        Terminate the worker process (if spawned).
+        """
+        if self.process is None or self.process.poll() is not None:
+            return
+
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.logger.warning(
+                'Killing worker {} (pid={}) ...'.format(
+                    self.url, self.process.pid))
+            self.process.kill()
+            self.process.wait()
+
+    # terminate ()
+
+    def request(self, method, path, body=None, headers=None):
+        """
+        Forward a request by means of the calling thread's persistent
+        connection. A request failing on a reused connection (e.g. closed
+        by the worker meanwhile) is retried once.
+
+        :returns: Tuple of the form `(status, headers, body)`
+        :raises OSError: If the worker is not reachable
+        :raises http.client.HTTPException: If the worker is not reachable
+        """
+        conn = getattr(self._local, 'conn', None)
+        reused = conn is not None
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        try:
+            conn.request(method, self._path(path), body=body,
+                         headers=headers or {})
+            resp = conn.getresponse()
+            return resp.status, resp.getheaders(), resp.read()
+        except (OSError, http.client.HTTPException) as err:
+            conn.close()
+            self._local.conn = None
+            if reused and isinstance(err, (ConnectionError,
+                                           http.client.RemoteDisconnected)):
+                return self.request(method, path, body=body, headers=headers)
+            raise
+
+    # request ()
+
+    def open(self, method, path, headers=None):
+        """
+        Forward a request by means of a dedicated connection e.g. in order
+        to stream the response.
+
+        :returns: Tuple of the form `(conn, response)`; close the connection
+            once the response was consumed
+        :raises OSError: If the worker is not reachable
+        :raises http.client.HTTPException: If the worker is not reachable
+        """
+        conn = self._connect()
+        try:
+            conn.request(method, self._path(path), headers=headers or {})
+            return conn, conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+
+    # open ()
+
+    def status(self):
+        """
+        :returns: The backend's status
+        :rtype: dict
+        """
+        return {'url': self.url,
+                'pid': self.process.pid if self.process is not None else None,
+                'reachable': self.reachable,
+                'ready': self.ready,
+                'size': self.size,
+                'running': self.running,
+                'queued': self.queued,
+                'routed': self.routed}
+
+    # status ()
+
+    def _connect(self):
+        return http.client.HTTPConnection(self._url.hostname, self._url.port,
+                                          timeout=self.timeout)
+
+    def _path(self, path):
+        return self._url.path.rstrip('/') + path
+
+    def __repr__(self):
+        return '<{}(url={})>'.format(type(self).__name__, self.url)
+
+# class Backend
+
+
+class Dispatcher(object):
+    """
+    Dispatcher routing runs across backends.
+
+    :param list backends: List of :py:class:`Backend` objects
+    :param float health_interval: Interval in seconds backends are probed
+        with
+    :param int max_pinned: Maximum number of runs pinned to their backend;
+        the least recently routed runs are forgotten first.
+    """
+
+    LOGGER = 'ramsis.worker.dispatch'
+
+    MAX_PINNED = 100000
+
+    def __init__(self, backends, health_interval=1., max_pinned=MAX_PINNED,
+                 logger=None):
+        self.backends = list(backends)
+        self.health_interval = health_interval
+        self.max_pinned = max_pinned
+
+        # run_id: backend
+        self._pinned = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        self.logger = (logging.getLogger(logger) if logger else
+                       logging.getLogger(self.LOGGER))
+
+    # __init__ ()
+
+    @property
+    def is_ready(self):
+        """`True` if at least one backend is ready."""
+        with self._lock:
+            return any(b.ready for b in self.backends)
+
+    def start(self):
+        """
+        Spawn the worker processes (if any) and start probing the backends
+        in the background.
+        """
+        for backend in self.backends:
+            if backend.cmd is not None:
+                backend.spawn()
+
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._monitor,
+                                        name='ramsis-dispatch-monitor',
+                                        daemon=True)
+        self._thread.start()
+
+    # start ()
+
+    def stop(self):
+        """
+        Stop probing the backends and terminate the worker processes
+        spawned.
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for backend in self.backends:
+            backend.terminate()
+
+    # stop ()
+
+    def probe(self, backend):
+        """
+        Probe the readiness of `backend` and update its state.
+
+        :returns: `True` if the backend is reachable, else `False`
+        """
+        try:
+            status, _, body = backend.request(
+                'GET', settings.PATH_RAMSIS_WORKER_READY,
+                headers={'Accept': 'application/json'})
+            data = json.loads(body)
+        except (OSError, http.client.HTTPException, ValueError):
+            self._unreachable(backend)
+            return False
+
+        pool = data.get('pool') or {}
+        runs = data.get('runs') or {}
+        with self._lock:
+            if not backend.reachable:
+                self.logger.info('Worker {} is reachable.'.format(
+                    backend.url))
+            backend.reachable = True
+            backend.ready = status == HTTPStatus.OK.value
+            if backend.ready:
+                backend.retry_delay = backend.RETRY_DELAY
+            backend.size = pool.get('size', 0)
+            backend.running = runs.get('running', pool.get('busy', 0))
+            backend.queued = runs.get('queued', 0)
+            backend.pending = 0
+        return True
+
+    # probe ()
+
+    def select(self, exclude=()):
+        """
+        Select the backend a new run is routed to. Ready backends providing
+        free engine capacity are preferred; ties are broken by the load.
+        Backends not ready yet (e.g. starting their engines) queue runs.
+
+        :param exclude: Backends not to be selected
+        :rtype: :py:class:`Backend`
+        :raises NoBackendAvailable: If no backend is reachable
+        """
+        with self._lock:
+            candidates = [b for b in self.backends
+                          if b.reachable and b not in exclude]
+            if not candidates:
+                raise NoBackendAvailable(
+                    '{} of {} tried'.format(len(exclude), len(self.backends)))
+            return min(candidates,
+                       key=lambda b: (not b.ready, b.free <= 0, b.load))
+
+    # select ()
+
+    def submit(self, path, body=None, headers=None):
+        """
+        Route a new run (or a batch of runs) to a backend and pin the runs
+        accepted. Unreachable backends and backends whose queue is full are
+        skipped.
+
+        :returns: Tuple of the form `(status, headers, body)` of the
+            backend's response
+        :raises NoBackendAvailable: If no backend is reachable
+        """
+        tried = []
+        retval = None
+        while True:
+            try:
+                backend = self.select(exclude=tried)
+            except NoBackendAvailable:
+                if retval is not None:
+                    # all queues are full
+                    return retval
+                raise
+            tried.append(backend)
+
+            try:
+                retval = backend.request('POST', path, body=body,
+                                         headers=headers)
+            except (OSError, http.client.HTTPException) as err:
+                # NOTE(damb): The run might have been accepted nonetheless
+                # (e.g. if the response was lost).
+                self.logger.warning(
+                    'Failed to route run to {} ({}).'.format(backend, err))
+                self._unreachable(backend)
+                continue
+
+            status, _, data = retval
+            if status == HTTPStatus.SERVICE_UNAVAILABLE.value:
+                continue
+            if status == StatusCode.TaskAccepted.value:
+                self._pin(backend, _run_ids(data), routed=True)
+            return retval
+
+    # submit ()
+
+    def forward(self, run_id, method, path, headers=None):
+        """
+        Forward a request of the run `run_id` to the backend the run is
+        pinned to. If the backend is not reachable or the run is not pinned,
+        the request is forwarded to the remaining backends.
+
+        :returns: Tuple of the form `(status, headers, body)` or `None` if no
+            backend knows the run
+        """
+        retval = None
+        for backend in self._candidates(run_id):
+            try:
+                response = backend.request(method, path, headers=headers)
+            except (OSError, http.client.HTTPException) as err:
+                self.logger.warning(
+                    'Failed to forward request to {} ({}).'.format(
+                        backend, err))
+                self._unreachable(backend)
+                continue
+
+            retval = response
+            if response[0] != HTTPStatus.NOT_FOUND.value:
+                self._pin(backend, [run_id])
+                break
+
+        return retval
+
+    # forward ()
+
+    def open(self, run_id, method, path, headers=None):
+        """
+        Streaming variant of :py:meth:`forward`.
+
+        :returns: Tuple of the form `(conn, response)` or `None` if no
+            backend knows the run
+        """
+        for backend in self._candidates(run_id):
+            try:
+                conn, resp = backend.open(method, path, headers=headers)
+            except (OSError, http.client.HTTPException) as err:
+                self.logger.warning(
+                    'Failed to forward request to {} ({}).'.format(
+                        backend, err))
+                self._unreachable(backend)
+                continue
+
+            if resp.status != HTTPStatus.NOT_FOUND.value:
+                self._pin(backend, [run_id])
+                return conn, resp
+            conn.close()
+
+        return None
+
+    # open ()
+
+    def runs(self):
+        """
+        :returns: The runs currently known to the reachable backends
+        :rtype: list
+        """
+        with self._lock:
+            backends = [b for b in self.backends if b.reachable]
+
+        retval = []
+        for backend in backends:
+            try:
+                status, _, body = backend.request(
+                    'GET', settings.PATH_RAMSIS_WORKER_SCENARIOS,
+                    headers={'Accept': 'application/json'})
+                if status == HTTPStatus.OK.value:
+                    retval.extend(json.loads(body).get('result', []))
+            except (OSError, http.client.HTTPException, ValueError) as err:
+                self.logger.warning(
+                    'Failed to list runs of {} ({}).'.format(backend, err))
+        return retval
+
+    # runs ()
+
+    def status(self):
+        """
+        :returns: The backends' status
+        :rtype: list
+        """
+        with self._lock:
+            return [b.status() for b in self.backends]
+
+    def retry_after(self):
+        """
+        :returns: Number of seconds after which a backend might be available
+        :rtype: int
+        """
+        return max(1, int(math.ceil(self.health_interval)))
+
+    def _monitor(self):
+        while not self._stopped.is_set():
+            for backend in self.backends:
+                if backend.exited:
+                    self._respawn(backend)
+                    continue
+                self.probe(backend)
+
+            self._stopped.wait(self.health_interval)
+
+    # _monitor ()
+
+    def _respawn(self, backend):
+        """
+        Respawn the exited worker process of `backend`. Worker processes
+        exiting repeatedly (e.g. right after being spawned) are respawned
+        with an exponentially increasing delay.
+        """
+        now = time.monotonic()
+        if backend.respawn_at is None:
+            self.logger.warning(
+                'Worker {} exited (returncode={}); respawning in {}s.'.format(
+                    backend.url, backend.process.returncode,
+                    backend.retry_delay))
+            self._unreachable(backend)
+            backend.respawn_at = now + backend.retry_delay
+            backend.retry_delay = min(backend.retry_delay * 2,
+                                      backend.MAX_RETRY_DELAY)
+        elif now >= backend.respawn_at:
+            backend.spawn()
+
+    # _respawn ()
+
+    def _candidates(self, run_id):
+        """
+        :returns: The backends requests of `run_id` are forwarded to in
+            order of preference
+        """
+        with self._lock:
+            pinned = self._pinned.get(run_id)
+            retval = [b for b in self.backends
+                      if b.reachable and b is not pinned]
+            if pinned is not None and pinned.reachable:
+                retval.insert(0, pinned)
+        return retval
+
+    # _candidates ()
+
+    def _pin(self, backend, run_ids, routed=False):
+        with self._lock:
+            if routed:
+                backend.pending += len(run_ids)
+                backend.routed += len(run_ids)
+            for run_id in run_ids:
+                self._pinned[run_id] = backend
+                self._pinned.move_to_end(run_id)
+            while len(self._pinned) > self.max_pinned:
+                self._pinned.popitem(last=False)
+
+    # _pin ()
+
+    def _unreachable(self, backend):
+        with self._lock:
+            if backend.reachable:
+                self.logger.warning('Worker {} is unreachable.'.format(
+                    backend.url))
+            backend.reachable = False
+            backend.ready = False
+
+    # _unreachable ()
+
+# class Dispatcher
+
+
+def _run_ids(body):
+    """
+    :returns: The identifiers of the runs accepted (both for single and
+        batch submissions)
+    :rtype: list
+    """
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return []
+    if 'runs' in data:
+        return [r['run_id'] for r in data['runs']]
+    return [data['run_id']] if data.get('run_id') else []
+
+# _run_ids ()
+
+
+# -----------------------------------------------------------------------------
+class DispatchResource(Resource):
+    """
+    Resource forwarding the `/runs` API to the dispatcher's backends. The
+    resource is intended to be registered both for the collection and the
+    item URL (and for the batch URL, see :py:class:`DispatchBatchResource`).
+
+    :param dispatcher: Dispatcher routing the runs
+    :type dispatcher: :py:class:`Dispatcher`
+    """
+    LOGGER = 'ramsis.worker_resource_dispatch'
+
+    def __init__(self, dispatcher=None, logger=None):
+        self._dispatcher = dispatcher
+        self.logger = (logging.getLogger(logger) if logger else
+                       logging.getLogger(self.LOGGER))
+
+    def get(self, run_id=None):
+        if run_id is None:
+            # TODO(damb): Standardize ramsis client return values
+            return ({'message': HTTPStatus.OK.phrase,
+                     'result': self._dispatcher.runs()},
+                    HTTPStatus.OK.value)
+        return self._forward(run_id)
+
+    def post(self, run_id=None):
+        if run_id is not None:
+            return 'Method not allowed.', StatusCode.HTTPMethodNotAllowed.value
+
+        try:
+            response = self._dispatcher.submit(
+                _path(), body=request.get_data(), headers=_headers())
+        except NoBackendAvailable as err:
+            self.logger.warning('{}'.format(err))
+            return ({'message': str(err),
+                     'result': []}, HTTPStatus.SERVICE_UNAVAILABLE.value,
+                    {'Retry-After': str(self._dispatcher.retry_after())})
+        return _response(*response)
+
+    # post ()
+
+    def delete(self, run_id=None):
+        if run_id is None:
+            return 'Method not allowed.', StatusCode.HTTPMethodNotAllowed.value
+        return self._forward(run_id)
+
+    def _forward(self, run_id):
+        response = self._dispatcher.forward(run_id, request.method, _path(),
+                                            headers=_headers())
+        if response is None:
+            return ({'message': HTTPStatus.NOT_FOUND.phrase,
+                     'result': []}, HTTPStatus.NOT_FOUND.value)
+        return _response(*response)
+
+    # _forward ()
+
+# class DispatchResource
+
+
+class DispatchBatchResource(DispatchResource):
+    """
+    Resource forwarding batch submissions. A batch is routed to a single
+    backend.
+    """
+
+    def get(self, run_id=None):
+        return 'Method not allowed.', StatusCode.HTTPMethodNotAllowed.value
+
+# class DispatchBatchResource
+
+
+class DispatchStreamResource(DispatchResource):
+    """
+    Resource forwarding the streamed resources of a run (i.e. the events
+    and log resources). Responses are forwarded chunk-wise.
+    """
+
+    def get(self, run_id):
+        opened = self._dispatcher.open(run_id, 'GET', _path(),
+                                       headers=_headers())
+        if opened is None:
+            return ({'message': HTTPStatus.NOT_FOUND.phrase,
+                     'result': []}, HTTPStatus.NOT_FOUND.value)
+
+        conn, resp = opened
+
+        def generate():
+            try:
+                while True:
+                    chunk = resp.read1(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+            finally:
+                conn.close()
+
+        return Response(generate(), status=resp.status,
+                        headers=_filter(resp.getheaders()))
+
+    # get ()
+
+# class DispatchStreamResource
+
+
+class DispatchHealthResource(Resource):
+    """
+    Liveness probe of the dispatcher reporting the status of its backends.
+
+    :param dispatcher: Dispatcher routing the runs
+    :type dispatcher: :py:class:`Dispatcher`
+    """
+    LOGGER = 'ramsis.worker_resource_dispatch_health'
+
+    def __init__(self, dispatcher=None, logger=None):
+        self._dispatcher = dispatcher
+        self.logger = (logging.getLogger(logger) if logger else
+                       logging.getLogger(self.LOGGER))
+
+    def get(self):
+        return self._status(HTTPStatus.OK)
+
+    def _status(self, status):
+        return ({'message': status.phrase,
+                 'workers': self._dispatcher.status()}, status.value)
+
+# class DispatchHealthResource
+
+
+class DispatchReadinessResource(DispatchHealthResource):
+    """
+    Readiness probe of the dispatcher. Returns HTTP status code 200 as soon
+    as at least one backend is ready, else 503.
+    """
+    LOGGER = 'ramsis.worker_resource_dispatch_ready'
+
+    def get(self):
+        if self._dispatcher.is_ready:
+            return self._status(HTTPStatus.OK)
+        return self._status(HTTPStatus.SERVICE_UNAVAILABLE)
+
+# class DispatchReadinessResource
+
+
+def _path():
+    """
+    :returns: Path including the query string of the current request
+    """
+    query = request.query_string.decode('latin-1')
+    return request.path + ('?' + query if query else '')
+
+
+def _headers():
+    """
+    :returns: Headers of the current request forwarded to backends
+    """
+    return {k: request.headers[k] for k in FORWARDED_HEADERS
+            if k in request.headers}
+
+
+def _filter(headers):
+    return [(k, v) for k, v in headers
+            if k.lower() not in HOP_BY_HOP_HEADERS]
+
+
+def _response(status, headers, body):
+    return Response(body, status=status, headers=_filter(headers))
+
+# ---- END OF <dispatch.py> ----
@@ -0,0 +1,299 @@
+# This is <executor.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Run executor facilities.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Run executor facilities. The executor drives runs from `accepted` through
+`running` until they are finished.
+"""
+
+import datetime
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+
+from ramsis.utils.error import Error
+from ramsis.worker.utils.metrics import STAGE_LATENCY
+from ramsis.worker.utils.profiling import session
+
+
+# -----------------------------------------------------------------------------
+class ExecutorError(Error):
+    """Base executor error ({})."""
+
+class QueueFull(ExecutorError):
+    """Run queue is full (max_queue_size={})."""
+
+class ExecutorShutdown(ExecutorError):
+    """Executor is shut down."""
+
+
+# -----------------------------------------------------------------------------
+class RunExecutor(object):
+    """
+    Execute runs by means of a pool of threads. Runs are admitted to a
+    bounded priority queue (runs with equal priority are executed in FIFO
+    order). Each thread starts a run's task and blocks until the task
+    finished such that resources leased by the task (e.g. a pooled MATLAB
+    engine) are returned as soon as the run is completed.
+
+    A run exceeding its wall-clock deadline (either the run's `timeout` or
+    `run_timeout`) is cancelled. The deadline starts as soon as the run is
+    dequeued i.e. it includes starting the run's task (e.g. leasing a pooled
+    MATLAB engine).
+
+    :param int max_workers: Maximum number of runs executed concurrently
+    :param int max_queue_size: Maximum number of queued runs. If `0` the
+        queue is unbounded.
+    :param run_timeout: Default wall-clock deadline in seconds of a run's
+        execution. `None` disables the deadline.
+    :param profiler: Optional profiler sampling run executions
+    :type profiler: :py:class:`ramsis.worker.utils.profiling.Profiler`
+    """
+
+    LOGGER = 'ramsis.worker.executor'
+
+    # weight of the most recent run when estimating the run duration
+    DURATION_SMOOTHING = 0.2
+
+    def __init__(self, max_workers=1, max_queue_size=0, run_timeout=None,
+                 profiler=None, logger=None):
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.run_timeout = run_timeout
+        self.profiler = profiler
+
+        self._queue = []
+        self._counter = itertools.count()
+        self._cv = threading.Condition()
+        self._num_running = 0
+        self._duration = None
+        self._shutdown = False
+
+        self.logger = (logging.getLogger(logger) if logger else
+                       logging.getLogger(self.LOGGER))
+
+        self._threads = []
+        for i in range(max_workers):
+            t = threading.Thread(target=self._worker,
+                                 name='ramsis-run-{}'.format(i),
+                                 daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    # __init__ ()
+
+    @property
+    def num_queued(self):
+        with self._cv:
+            return len(self._queue)
+
+    @property
+    def num_running(self):
+        with self._cv:
+            return self._num_running
+
+    def submit(self, run, priority=0):
+        """
+        Admit `run` to the queue.
+
+        :param run: Run to be executed
+        :type run: :py:class:`ramsis.worker.utils.registry.Run`
+        :param int priority: Run priority; lower values are executed first.
+        :returns: The run's (1-based) queue position
+        :rtype: int
+        :raises QueueFull: If the queue is full
+        """
+        with self._cv:
+            if self._shutdown:
+                raise ExecutorShutdown()
+            if self.max_queue_size and len(self._queue) >= self.max_queue_size:
+                raise QueueFull(self.max_queue_size)
+
+            item = (priority, next(self._counter), run)
+            heapq.heappush(self._queue, item)
+            self._cv.notify()
+            return self._ahead(item[:2]) + 1
+
+    # submit ()
+
+    def submit_many(self, runs, priority=0):
+        """
+        Admit all `runs` to the queue or none of them.
+
+        :returns: List of the runs' (1-based) queue positions
+        :rtype: list
+        :raises QueueFull: If the queue cannot take all runs
+        """
+        with self._cv:
+            if self._shutdown:
+                raise ExecutorShutdown()
+            num_queued = len(self._queue) + len(runs)
+            if self.max_queue_size and num_queued > self.max_queue_size:
+                raise QueueFull(self.max_queue_size)
+
+            keys = []
+            for run in runs:
+                item = (priority, next(self._counter), run)
+                heapq.heappush(self._queue, item)
+                keys.append(item[:2])
+            self._cv.notify(len(runs))
+            if not keys:
+                return []
+            # NOTE(damb): The runs are queued in order and behind the runs
+            # already queued with the same priority.
+            ahead = self._ahead(keys[0])
+            return [ahead + pos for pos in range(1, len(keys) + 1)]
+
+    # submit_many ()
+
+    def position(self, run_id):
+        """
+        :returns: The (1-based) queue position of the run identified by
+            `run_id` or `None` if the run is not queued.
+        """
+        with self._cv:
+            return self._position(run_id)
+
+    def cancel(self, run_id):
+        """
+        Remove the run identified by `run_id` from the queue.
+
+        :returns: `True` if the run was queued, else `False`
+        """
+        with self._cv:
+            for i, item in enumerate(self._queue):
+                if item[2].id == run_id:
+                    self._queue.pop(i)
+                    heapq.heapify(self._queue)
+                    return True
+        return False
+
+    # cancel ()
+
+    def retry_after(self):
+        """
+        Estimate the number of seconds until a queue slot becomes available.
+
+        :rtype: int
+        """
+        with self._cv:
+            duration = self._duration if self._duration is not None else 1.
+            backlog = len(self._queue) + self._num_running - self.max_workers
+            return max(1, int(math.ceil(
+                duration * max(backlog, 1) / self.max_workers)))
+
+    # retry_after ()
+
+    def shutdown(self, wait=True):
+        """
+        Shut the executor down. Queued runs are failed; with `wait` the
+        call blocks until the runs currently executed are finished.
+        """
+        with self._cv:
+            self._shutdown = True
+            queued = [item[2] for item in self._queue]
+            self._queue = []
+            self._cv.notify_all()
+
+        for run in queued:
+            run.fail('Worker shut down.')
+        if wait:
+            for t in self._threads:
+                t.join()
+
+    # shutdown ()
+
+    def _position(self, run_id):
+        for item in self._queue:
+            if item[2].id == run_id:
+                return self._ahead(item[:2]) + 1
+        return None
+
+    def _ahead(self, key):
+        """
+        :returns: The number of queued runs ahead of the run queued with the
+            `(priority, counter)` key `key`
+        """
+        return sum(1 for item in self._queue if item[:2] < key)
+
+    def _worker(self):
+        while True:
+            with self._cv:
+                while not self._queue and not self._shutdown:
+                    self._cv.wait()
+                if self._shutdown:
+                    return
+                _, _, run = heapq.heappop(self._queue)
+                self._num_running += 1
+
+            STAGE_LATENCY.observe(_age(run), stage='queue')
+            start = time.monotonic()
+            try:
+                self._execute(run)
+            finally:
+                duration = time.monotonic() - start
+                STAGE_LATENCY.observe(duration, stage='execute')
+                with self._cv:
+                    self._num_running -= 1
+                    self._update_duration(duration)
+
+    # _worker ()
+
+    def _update_duration(self, duration):
+        if self._duration is None:
+            self._duration = duration
+        else:
+            self._duration += self.DURATION_SMOOTHING * (
+                duration - self._duration)
+
+    def _execute(self, run):
+        if run.is_finished:
+            # cancelled while being dequeued
+            return run.state
+
+        timeout = run.timeout if run.timeout is not None else self.run_timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self.logger.info('Executing run {0!r} ...'.format(run))
+        try:
+            with session(self.profiler, 'run', run_id=run.id):
+                run.start(timeout=timeout)
+                run.task.wait(timeout=_remaining(deadline))
+        except Exception as err:
+            self.logger.warning('Run {!r} failed ({}).'.format(run, err))
+            run.fail(err)
+
+        state = run.poll()
+        if not run.is_finished and timeout is not None:
+            self.logger.warning(
+                'Run {!r} exceeded its deadline ({}s).'.format(run, timeout))
+            run.cancel('Deadline exceeded ({}s).'.format(timeout))
+            state = run.state
+        if not run.is_finished:
+            run.fail('Task did not finish.')
+            state = run.state
+
+        self.logger.info('Run {!r} finished ({}).'.format(run, state.value))
+        return state
+
+    # _execute ()
+
+# class RunExecutor
+
+
+def _age(run):
+    return (datetime.datetime.utcnow() - run.created).total_seconds()
+
+
+def _remaining(deadline):
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0)
+
+# ---- END OF <executor.py> ----
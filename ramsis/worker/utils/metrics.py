@@ -0,0 +1,273 @@
+# This is <metrics.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Metrics facilities.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Lightweight metrics facilities. Metrics are exposed by means of the
+`Prometheus text format
+<https://prometheus.io/docs/instrumenting/exposition_formats/>`_.
+
+Recording a sample costs a lock acquisition and (for histograms) a bisection
+i.e. instrumentation is cheap enough to be left enabled in production.
+
+.. note::
+
+    Metrics are collected per process. When serving with multiple worker
+    processes each scrape reflects the process handling the request.
+"""
+
+import bisect
+import contextlib
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# default latency buckets in seconds
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5,
+                   1., 2.5, 5., 10., 30., 60., 300., 900., 3600.)
+# default size buckets in bytes
+SIZE_BUCKETS = tuple(1024 * 4**i for i in range(11))
+
+
+# -----------------------------------------------------------------------------
+class Metric(object):
+    """
+    Base class for a metric with optional labels.
+
+    :param str name: Metric name
+    :param str doc: Help text
+    :param tuple labelnames: Label names
+    """
+
+    TYPE = None
+
+    def __init__(self, name, doc, labelnames=()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(k, '')) for k in self.labelnames)
+
+    def _labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(k, _escape(v))
+                              for k, v in pairs) + '}'
+
+    def expose(self):
+        """
+        :returns: The metric in Prometheus text format
+        :rtype: str
+        """
+        lines = ['# HELP {} {}'.format(self.name, self.doc),
+                 '# TYPE {} {}'.format(self.name, self.TYPE)]
+        lines.extend(self._samples())
+        return '\n'.join(lines) + '\n'
+
+    def _samples(self):
+        raise NotImplementedError
+
+# class Metric
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing counter. Values are either incremented
+    explicitly or, if `fn` is defined, collected when exposed.
+
+    :param fn: Optional callable returning the current value
+    """
+
+    TYPE = 'counter'
+
+    def __init__(self, name, doc, labelnames=(), fn=None):
+        super().__init__(name, doc, labelnames=labelnames)
+        self._fn = fn
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        if self._fn is not None:
+            return ['{} {}'.format(self.name, _fmt(self._fn()))]
+        with self._lock:
+            values = sorted(self._values.items())
+        return ['{}{} {}'.format(self.name, self._labels(k), _fmt(v))
+                for k, v in values]
+
+# class Counter
+
+
+class Gauge(Metric):
+    """
+    Gauge. Values are either set explicitly or, if `fn` is defined,
+    collected when exposed.
+
+    :param fn: Optional callable returning the current value
+    """
+
+    TYPE = 'gauge'
+
+    def __init__(self, name, doc, labelnames=(), fn=None):
+        super().__init__(name, doc, labelnames=labelnames)
+        self._fn = fn
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self):
+        if self._fn is not None:
+            return ['{} {}'.format(self.name, _fmt(self._fn()))]
+        with self._lock:
+            values = sorted(self._values.items())
+        return ['{}{} {}'.format(self.name, self._labels(k), _fmt(v))
+                for k, v in values]
+
+# class Gauge
+
+
+class Histogram(Metric):
+    """
+    Histogram with fixed buckets.
+
+    :param tuple buckets: Upper bounds of the buckets (in ascending order)
+    """
+
+    TYPE = 'histogram'
+
+    def __init__(self, name, doc, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, doc, labelnames=labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # bucket counts (the last bucket is +Inf), sum
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1),
+                                             0.]
+            entry[0][i] += 1
+            entry[1] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """
+        Context manager observing the duration of the block in seconds.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    # time ()
+
+    def _samples(self):
+        with self._lock:
+            values = sorted((k, (list(v[0]), v[1]))
+                            for k, v in self._values.items())
+
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'), ),
+                                    counts):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(
+                    self.name, self._labels(key, [('le', _fmt(bound))]),
+                    cumulative))
+            lines.append('{}_sum{} {}'.format(
+                self.name, self._labels(key), _fmt(total)))
+            lines.append('{}_count{} {}'.format(
+                self.name, self._labels(key), cumulative))
+        return lines
+
+    # _samples ()
+
+# class Histogram
+
+
+class MetricsRegistry(object):
+    """
+    Registry of metrics.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, doc, labelnames=()):
+        return self.register(Counter(name, doc, labelnames=labelnames))
+
+    def histogram(self, name, doc, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, doc, labelnames=labelnames,
+                                       buckets=buckets))
+
+    def expose(self, extra=()):
+        """
+        :param extra: Additional (e.g. collected on demand) metrics
+        :returns: All metrics in Prometheus text format
+        :rtype: str
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+        return ''.join(m.expose() for m in metrics + list(extra))
+
+    # expose ()
+
+# class MetricsRegistry
+
+
+def _fmt(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, bool):
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('\n', '\\n')
+            .replace('"', '\\"'))
+
+
+# -----------------------------------------------------------------------------
+# worker metrics
+REGISTRY = MetricsRegistry()
+
+STAGE_LATENCY = REGISTRY.histogram(
+    'ramsis_worker_stage_duration_seconds',
+    'Duration of run processing stages (parse, configure, queue, execute, '
+    'serialize).', labelnames=('stage', ))
+RUNS = REGISTRY.counter(
+    'ramsis_worker_runs_total', 'Finished runs by outcome.',
+    labelnames=('outcome', ))
+RUNS_COALESCED = REGISTRY.counter(
+    'ramsis_worker_runs_coalesced_total',
+    'Runs coalesced with an identical run in flight.')
+PRELOADS = REGISTRY.counter(
+    'ramsis_worker_preloads_total',
+    'Static data variables (re)loaded into engine workspaces.')
+RESULT_SIZE = REGISTRY.histogram(
+    'ramsis_worker_result_size_bytes', 'Size of serialized results.',
+    labelnames=('mimetype', ), buckets=SIZE_BUCKETS)
+
+# ---- END OF <metrics.py> ----
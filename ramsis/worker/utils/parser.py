@@ -12,19 +12,29 @@
 Error handling facilities for worker webservices.
 """
 
+import functools
+
+from http import HTTPStatus
 
 from webargs.flaskparser import abort
 from webargs.flaskparser import parser as _parser
 
 from ramsis.utils.protocol import StatusCode
+from ramsis.worker.utils.payload import (CHUNK_SIZE, PayloadDecoder,
+                                         PayloadError, PayloadTooLarge,
+                                         UnsupportedEncoding)
+from ramsis.worker.utils.schema import compiled_schema
 
 
 # This error handler is necessary for usage with Flask-RESTful
 @_parser.error_handler
-def handle_request_parsing_error(err):
+def handle_request_parsing_error(err, *args, **kwargs):
     """
     Webargs error handler that uses Flask-RESTful's abort function
     to return a JSON error response to the client.
+
+    Additional arguments (passed by more recent `webargs` versions) are
+    ignored.
     """
     abort(StatusCode.UnprocessableEntity.value,
           errors=err.messages)
@@ -36,4 +46,45 @@ parser = _parser
 
 # parser_factory ()
 
+
+def parse_json(schema_class, request, max_bytes=None):
+    """
+    Parse and validate the JSON body of `request` by means of the compiled
+    schema of `schema_class` (see
+    :py:class:`ramsis.worker.utils.schema.CompiledSchema`). Fast replacement
+    for `parser.parse(schema_class(), request, locations=('json', ))`.
+
+    The body is streamed i.e. compressed bodies are decompressed and array
+    fields are decoded incrementally (see
+    :py:mod:`ramsis.worker.utils.payload`).
+
+    :param int max_bytes: Maximum size of the decoded input message in bytes
+    :returns: The validated arguments
+    """
+    schema = compiled_schema(schema_class)
+    try:
+        decoder = PayloadDecoder(
+            encoding=request.headers.get('Content-Encoding'),
+            arrays=schema.arrays, max_bytes=max_bytes)
+        for chunk in iter(functools.partial(request.stream.read, CHUNK_SIZE),
+                          b''):
+            decoder.feed(chunk)
+        message = decoder.close()
+    except UnsupportedEncoding as err:
+        abort(HTTPStatus.UNSUPPORTED_MEDIA_TYPE.value,
+              errors={'json': [str(err)]})
+    except PayloadTooLarge as err:
+        abort(HTTPStatus.REQUEST_ENTITY_TOO_LARGE.value,
+              errors={'json': [str(err)]})
+    except PayloadError as err:
+        abort(StatusCode.UnprocessableEntity.value,
+              errors={'json': [str(err)]})
+
+    args, errors = schema.load(message)
+    if errors:
+        abort(StatusCode.UnprocessableEntity.value, errors=errors)
+    return args
+
+# parse_json ()
+
 # ---- END OF <parser.py> ----
@@ -0,0 +1,505 @@
+# This is <payload.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Streaming input message facilities.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Streaming input message facilities. Request bodies are decoded chunk-wise
+by means of a :py:class:`PayloadDecoder`:
+
+    - `gzip` and `deflate` as well as `zstd` (requires `zstandard`)
+      compressed bodies are decompressed incrementally.
+    - Array fields (see :py:class:`ramsis.worker.utils.schema.Array`) are
+      decoded incrementally into compact :py:class:`numpy.ndarray` objects
+      rather than into lists of Python floats. The remainder of the message
+      is decoded as usual.
+    - The size of the decoded message is bounded. Array fields are
+      accounted for by means of the size of the resulting arrays, the
+      remainder by means of its (decompressed) JSON representation.
+
+`zstandard` and `numpy` are imported lazily, i.e. once used.
+"""
+
+import re
+import zlib
+
+from ramsis.utils.error import Error
+from ramsis.worker.utils import import_optional, is_available
+from ramsis.worker.utils.schema import loads, to_array
+
+
+# size of decompressed chunks in bytes
+CHUNK_SIZE = 64 * 1024
+
+ENCODINGS = ('identity', 'gzip', 'x-gzip', 'deflate') + (
+    ('zstd', ) if is_available('zstandard') else ())
+
+_STRUCT = re.compile(rb'["\[\]{},:]')
+
+_OBJECT = 0
+_ARRAY = 1
+
+# zstd frame format (RFC 8878)
+_ZSTD_MAGIC = 0xFD2FB528
+_ZSTD_SKIPPABLE_MAGIC = 0x184D2A50
+_ZSTD_RLE_BLOCK = 1
+# states of the zstd frame tracker i.e. the field expected next
+_MAGIC, _SKIPPABLE, _DESCRIPTOR, _BLOCK = range(4)
+
+
+# -----------------------------------------------------------------------------
+class PayloadError(Error):
+    """Invalid payload ({})."""
+
+
+class PayloadTooLarge(PayloadError):
+    """Payload too large ({})."""
+
+
+class UnsupportedEncoding(PayloadError):
+    """Unsupported content encoding ({})."""
+
+
+# -----------------------------------------------------------------------------
+class PayloadDecoder(object):
+    """
+    Push-based decoder of a (compressed) JSON input message. Feed the
+    request body chunk-wise by means of :py:meth:`feed` and obtain the
+    decoded message by means of :py:meth:`close`.
+
+    :param str encoding: Content encoding of the payload i.e. the value of
+        the `Content-Encoding` header
+    :param arrays: Paths of array fields to be decoded into
+        :py:class:`numpy.ndarray` objects (see
+        :py:func:`ramsis.worker.utils.schema.array_paths`)
+    :param int max_bytes: Maximum size of the decoded message in bytes.
+        `None` disables the limit.
+
+    :raises UnsupportedEncoding: If `encoding` is not supported
+    """
+
+    def __init__(self, encoding=None, arrays=(), max_bytes=None):
+        self.max_bytes = max_bytes
+        self._decompressor = _decompressor(encoding)
+        self._scanner = _Scanner(arrays) if arrays else None
+        self._data = bytearray()
+
+    @property
+    def size(self):
+        """Size of the message decoded so far in bytes."""
+        if self._scanner is not None:
+            return self._scanner.size
+        return len(self._data)
+
+    def feed(self, data):
+        """
+        Feed a chunk of the payload.
+
+        :raises PayloadTooLarge: If the decoded message exceeds `max_bytes`
+        :raises PayloadError: If the payload is invalid
+        """
+        if self._decompressor is not None:
+            self._decompressor.decompress(data, self._consume)
+        else:
+            self._consume(data)
+
+    # feed ()
+
+    def close(self):
+        """
+        Complete decoding. An empty payload is decoded as an empty message.
+
+        :returns: The decoded message
+        :raises PayloadError: If the payload is invalid
+        """
+        if self._decompressor is not None:
+            self._decompressor.close()
+
+        if self._scanner is not None:
+            return self._scanner.close()
+        if not self._data:
+            return {}
+        try:
+            return loads(self._data)
+        except ValueError as err:
+            raise PayloadError(str(err))
+
+    # close ()
+
+    def _consume(self, chunk):
+        """
+        Consume a chunk of the (decompressed) payload. Decompressors emit
+        chunks of at most :py:data:`CHUNK_SIZE` bytes i.e. the size limit is
+        checked while decompressing.
+        """
+        if self._scanner is not None:
+            self._scanner.feed(chunk)
+        else:
+            self._data += chunk
+
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            raise PayloadTooLarge(
+                'decoded message exceeds {} bytes'.format(self.max_bytes))
+
+    # _consume ()
+
+# class PayloadDecoder
+
+
+class _Scanner(object):
+    """
+    Incremental JSON scanner. Array fields located at `paths` are decoded
+    into :py:class:`numpy.ndarray` objects; the remainder of the document
+    is copied (with array fields replaced by `null`) and decoded once
+    complete.
+
+    Paths are tuples of object keys; `None` matches any array index.
+    """
+
+    def __init__(self, paths):
+        self.paths = tuple(paths)
+        self.arrays = []
+
+        self._skeleton = bytearray()
+        # data not consumed yet
+        self._buf = bytearray()
+        # offset (relative to the string's start) the search for the end of
+        # an incomplete string is resumed at
+        self._resume = 0
+        # frames of the form [_OBJECT, key, expecting_key] or [_ARRAY, index]
+        self._stack = []
+        # chunks of the array field currently decoded
+        self._chunks = None
+        self._path = None
+        self._nbytes = 0
+
+    @property
+    def size(self):
+        return len(self._skeleton) + len(self._buf) + self._nbytes
+
+    def feed(self, data):
+        # NOTE(damb): Deleting from the front of a bytearray does not copy
+        # the remainder i.e. consumed data is released in O(1).
+        self._buf += data
+        del self._buf[:self._scan(self._buf)]
+
+    def close(self):
+        if self._chunks is not None:
+            raise PayloadError('unterminated array {!r}'.format(
+                _format(self._path)))
+
+        self._skeleton += self._buf
+        self._buf = bytearray()
+        if not self._skeleton and not self.arrays:
+            return {}
+        try:
+            message = loads(self._skeleton)
+        except ValueError as err:
+            raise PayloadError(str(err))
+
+        for path, arr in self.arrays:
+            try:
+                container = message
+                for key in path[:-1]:
+                    container = container[key]
+                container[path[-1]] = arr
+            except (IndexError, KeyError, TypeError):
+                raise PayloadError('malformed array {!r}'.format(
+                    _format(path)))
+        return message
+
+    # close ()
+
+    def _scan(self, buf):
+        """
+        Scan `buf`.
+
+        :returns: The position up to which `buf` was consumed; the
+            remainder requires further data
+        """
+        pos = 0
+        end = len(buf)
+        while pos < end:
+            if self._chunks is not None:
+                pos = self._scan_array(buf, pos)
+                if self._chunks is not None:
+                    break
+                continue
+
+            m = _STRUCT.search(buf, pos)
+            if m is None:
+                self._skeleton += buf[pos:]
+                pos = end
+                break
+
+            i = m.start()
+            c = buf[i:i + 1]
+            if c == b'"':
+                j = _string_end(buf, i + 1, i + self._resume)
+                if j < 0:
+                    # incomplete string; continue searching the end of the
+                    # string with the next chunk
+                    self._skeleton += buf[pos:i]
+                    self._resume = len(buf) - i
+                    pos = i
+                    break
+                self._resume = 0
+                frame = self._stack[-1] if self._stack else None
+                if frame is not None and frame[0] == _OBJECT and frame[2]:
+                    try:
+                        frame[1] = loads(buf[i:j + 1])
+                    except ValueError as err:
+                        raise PayloadError(str(err))
+                    frame[2] = False
+                self._skeleton += buf[pos:j + 1]
+                pos = j + 1
+                continue
+
+            self._skeleton += buf[pos:i]
+            pos = i + 1
+            if c == b'[':
+                path = tuple(f[1] for f in self._stack)
+                if self._match(path):
+                    self._chunks = []
+                    self._path = path
+                    self._skeleton += b'null'
+                    continue
+                self._stack.append([_ARRAY, 0])
+            elif c == b'{':
+                self._stack.append([_OBJECT, None, True])
+            elif c == b']' or c == b'}':
+                if not self._stack:
+                    raise PayloadError('unexpected {!r}'.format(c.decode()))
+                self._stack.pop()
+            elif c == b',' and self._stack:
+                frame = self._stack[-1]
+                if frame[0] == _OBJECT:
+                    frame[1] = None
+                    frame[2] = True
+                else:
+                    frame[1] += 1
+            self._skeleton += c
+
+        return pos
+
+    # _scan ()
+
+    def _scan_array(self, buf, pos):
+        """
+        Decode the elements of the array field currently scanned. Elements
+        are decoded up to the closing bracket or, if not available yet, up
+        to the last complete element.
+
+        :returns: The position up to which `buf` was consumed
+        """
+        j = buf.find(b']', pos)
+        final = j >= 0
+        if not final:
+            j = buf.rfind(b',', pos)
+            if j < 0:
+                return pos
+
+        piece = buf[pos:j]
+        try:
+            arr = to_array(loads(b'[' + piece + b']'))
+        except (TypeError, ValueError):
+            raise PayloadError('malformed array {!r}'.format(
+                _format(self._path)))
+        # empty pieces are valid for empty arrays, only
+        if not arr.size and (self._chunks or not final):
+            raise PayloadError('malformed array {!r}'.format(
+                _format(self._path)))
+
+        self._chunks.append(arr)
+        self._nbytes += arr.nbytes
+        if final:
+            import numpy as np
+
+            arr = (self._chunks[0] if len(self._chunks) == 1 else
+                   np.concatenate(self._chunks))
+            self.arrays.append((self._path, arr))
+            self._chunks = None
+            self._path = None
+        return j + 1
+
+    # _scan_array ()
+
+    def _match(self, path):
+        for pattern in self.paths:
+            if len(pattern) == len(path) and all(
+                    isinstance(k, int) if p is None else p == k
+                    for p, k in zip(pattern, path)):
+                return True
+        return False
+
+# class _Scanner
+
+
+class _ZlibDecompressor(object):
+
+    def __init__(self, wbits):
+        self._obj = zlib.decompressobj(wbits)
+
+    def decompress(self, data, consume):
+        while data:
+            try:
+                chunk = self._obj.decompress(data, CHUNK_SIZE)
+            except zlib.error as err:
+                raise PayloadError(str(err))
+            consume(chunk)
+            data = self._obj.unconsumed_tail
+
+    def close(self):
+        if not self._obj.eof:
+            raise PayloadError('truncated compressed data')
+
+# class _ZlibDecompressor
+
+
+class _ZstdDecompressor(object):
+    """
+    zstd decompressor. zstandard's decompression objects do not bound their
+    output (a few bytes of input may expand to megabytes); hence, data is
+    decompressed by means of a stream writer emitting chunks of at most
+    :py:data:`CHUNK_SIZE` bytes to the consumer while decompressing.
+
+    Stream writers do not report the end of frames. In order to detect
+    truncated data the frame structure (i.e. frame headers and block
+    headers) is tracked.
+    """
+
+    def __init__(self):
+        self._zstd = import_optional('zstandard')
+        self._writer = self._zstd.ZstdDecompressor().stream_writer(
+            self, write_size=CHUNK_SIZE)
+        self._consume = None
+
+        # frame tracking
+        self._state = _MAGIC
+        self._pending = bytearray()
+        self._skip = 0
+        self._checksum = False
+        self._frames = 0
+
+    def decompress(self, data, consume):
+        self._consume = consume
+        try:
+            self._writer.write(data)
+        except self._zstd.ZstdError as err:
+            raise PayloadError(str(err))
+        finally:
+            self._consume = None
+        self._track(data)
+
+    def write(self, chunk):
+        # called back by the stream writer
+        self._consume(chunk)
+        return len(chunk)
+
+    def close(self):
+        complete = self._state == _MAGIC and not self._skip
+        if not (self._frames and complete and not self._pending):
+            raise PayloadError('truncated compressed data')
+
+    def _track(self, data):
+        """
+        Track the frame structure of `data`. Frame contents are skipped.
+        """
+        self._pending += data
+        while True:
+            if self._skip:
+                n = min(self._skip, len(self._pending))
+                del self._pending[:n]
+                self._skip -= n
+                if self._skip:
+                    return
+
+            size = 1 if self._state == _DESCRIPTOR else (
+                3 if self._state == _BLOCK else 4)
+            if len(self._pending) < size:
+                return
+            field = int.from_bytes(self._pending[:size], 'little')
+            del self._pending[:size]
+
+            if self._state == _MAGIC:
+                if field == _ZSTD_MAGIC:
+                    self._frames += 1
+                    self._state = _DESCRIPTOR
+                elif field & 0xFFFFFFF0 == _ZSTD_SKIPPABLE_MAGIC:
+                    self._state = _SKIPPABLE
+                else:
+                    raise PayloadError('invalid zstd frame')
+            elif self._state == _SKIPPABLE:
+                self._skip = field
+                self._state = _MAGIC
+            elif self._state == _DESCRIPTOR:
+                # remainder of the frame header: window descriptor,
+                # dictionary identifier and frame content size
+                single_segment = field >> 5 & 1
+                window = 0 if single_segment else 1
+                dictionary_id = (0, 1, 2, 4)[field & 3]
+                content_size = (single_segment, 2, 4, 8)[field >> 6]
+                self._skip = window + dictionary_id + content_size
+                self._checksum = bool(field >> 2 & 1)
+                self._state = _BLOCK
+            else:
+                last, block_type, block_size = (
+                    field & 1, field >> 1 & 3, field >> 3)
+                self._skip = 1 if block_type == _ZSTD_RLE_BLOCK else (
+                    block_size)
+                if last:
+                    self._skip += 4 if self._checksum else 0
+                    self._state = _MAGIC
+
+# class _ZstdDecompressor
+
+
+def _decompressor(encoding):
+    """
+    :returns: Decompressor for `encoding` or `None` if the payload is not
+        compressed
+    :raises UnsupportedEncoding: If `encoding` is not supported
+    """
+    encoding = (encoding or 'identity').strip().lower()
+    if encoding not in ENCODINGS:
+        raise UnsupportedEncoding(encoding)
+    if encoding in ('gzip', 'x-gzip'):
+        return _ZlibDecompressor(16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        return _ZlibDecompressor(zlib.MAX_WBITS)
+    if encoding == 'zstd':
+        return _ZstdDecompressor()
+    return None
+
+# _decompressor ()
+
+
+def _string_end(buf, start, pos=None):
+    """
+    :param int pos: Position to search the terminating quote from
+        (default: `start`)
+    :returns: Position of the quote terminating the string starting at
+        `start` or `-1` if the string is incomplete
+    """
+    pos = start if pos is None else max(start, pos)
+    while True:
+        j = buf.find(b'"', pos)
+        if j < 0:
+            return -1
+        k = j - 1
+        while k >= start and buf[k] == 0x5c:
+            k -= 1
+        # the quote is escaped by an odd number of backslashes
+        if (j - 1 - k) % 2 == 0:
+            return j
+        pos = j + 1
+
+# _string_end ()
+
+
+def _format(path):
+    return '.'.join('*' if k is None else str(k) for k in path)
+
+# ---- END OF <payload.py> ----
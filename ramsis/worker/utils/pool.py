@@ -0,0 +1,374 @@
+# This is <pool.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Resource pool facilities.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Pool facilities for expensive to create resources e.g. MATLAB engines.
+"""
+
+import concurrent.futures
+import contextlib
+import logging
+import queue
+import threading
+import time
+
+from ramsis.utils.error import Error
+
+
+# -----------------------------------------------------------------------------
+class PoolError(Error):
+    """Base pool error ({})."""
+
+class PoolExhausted(PoolError):
+    """No pooled resource available (timeout={})."""
+
+class PoolUnavailable(PoolError):
+    """Pool provides no resources ({})."""
+
+class UnhealthyResource(PoolError):
+    """Pooled resource failed health check ({})."""
+
+
+# -----------------------------------------------------------------------------
+class Pool(object):
+    """
+    A fixed size pool of reusable resources. Resources are created and health
+    checked in advance (i.e. they are *warm*) by means of :py:meth:`start`.
+    Clients lease resources either by means of :py:meth:`acquire` /
+    :py:meth:`release` or with the :py:meth:`lease` context manager.
+
+    When started in the background, resources become available one after
+    another. Meanwhile, :py:meth:`acquire` blocks such that clients are
+    queued rather than rejected.
+
+    An idle resource failing its health check when being acquired is
+    destroyed and replaced by a newly created one. Resources which failed
+    to be created (either at startup or when being replaced) are *lost*;
+    lost resources are recreated in the background (with exponential
+    backoff). If the pool provides no resources at all (and none is being
+    created) :py:meth:`acquire` fails immediately.
+
+    :param factory: Callable creating a new resource
+    :param int size: Number of pooled resources
+    :param health_check: Optional callable taking a resource and returning
+        `True` if the resource is healthy.
+    :param destroy: Optional callable taking a resource and releasing it
+    """
+
+    LOGGER = 'ramsis.worker.pool'
+
+    # interval (in seconds) waiting clients check the pool's capacity with
+    POLL_INTERVAL = 0.5
+    # initial and maximum delay (in seconds) between attempts to recreate a
+    # lost resource
+    RETRY_DELAY = 1.
+    MAX_RETRY_DELAY = 60.
+
+    def __init__(self, factory, size=1, health_check=None, destroy=None,
+                 logger=None):
+        if size < 1:
+            raise PoolError('Invalid pool size: {!r}'.format(size))
+
+        self._factory = factory
+        self._size = size
+        self._health_check = health_check
+        self._destroy = destroy
+
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._num_resources = 0
+        # number of resources being created
+        self._num_pending = 0
+        # number of resources failed to be created
+        self._num_lost = 0
+        self._started = False
+        self._closed = threading.Event()
+        self._ready = threading.Event()
+        self._startup_thread = None
+        self._startup_error = None
+        self._error = None
+
+        self.logger = (logging.getLogger(logger) if logger else
+                       logging.getLogger(self.LOGGER))
+
+    # __init__ ()
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def idle(self):
+        """Number of idle resources."""
+        return self._idle.qsize()
+
+    @property
+    def busy(self):
+        """Number of leased resources."""
+        with self._lock:
+            return self._num_resources - self._idle.qsize()
+
+    @property
+    def is_ready(self):
+        """`True` if at least one resource was created successfully."""
+        return self._ready.is_set()
+
+    @property
+    def lost(self):
+        """Number of resources failed to be created (being recreated)."""
+        with self._lock:
+            return self._num_lost
+
+    @property
+    def is_healthy(self):
+        """
+        `False` if resources failed to be created and the pool provides no
+        resource at all.
+        """
+        with self._lock:
+            return not self._num_lost or self._num_resources > 0
+
+    @property
+    def error(self):
+        """The most recent error creating a resource (if any is lost)."""
+        return self._error
+
+    @property
+    def startup_error(self):
+        return self._startup_error
+
+    def wait_ready(self, timeout=None):
+        """
+        Block until the pool is ready or `timeout` (in seconds) expired.
+
+        :returns: `True` if the pool is ready, else `False`
+        """
+        return self._ready.wait(timeout=timeout)
+
+    def wait_started(self, timeout=None):
+        """
+        Block until the startup (see :py:meth:`start`) finished or `timeout`
+        (in seconds) expired.
+
+        :returns: `True` if the startup finished, else `False`
+        """
+        if self._startup_thread is None:
+            return True
+        self._startup_thread.join(timeout=timeout)
+        return not self._startup_thread.is_alive()
+
+    # wait_started ()
+
+    def start(self, background=False):
+        """
+        Create and warm up the pooled resources. Resources are created
+        concurrently.
+
+        :param bool background: Create the resources in a background thread
+            and return immediately.
+        """
+        with self._lock:
+            self._started = True
+            self._num_pending = self._size - self._num_resources
+        if background:
+            self._startup_thread = threading.Thread(
+                target=self._start, name='ramsis-pool-startup', daemon=True)
+            self._startup_thread.start()
+        else:
+            self._start()
+
+    # start ()
+
+    def _start(self):
+        with self._lock:
+            missing = self._size - self._num_resources
+
+        self.logger.info('Starting {} pooled resource(s) ...'.format(missing))
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=max(missing, 1)) as executor:
+            # NOTE(damb): pending resources are accounted for by start ()
+            futures = [executor.submit(self._create, reserved=True)
+                       for _ in range(missing)]
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    resource = future.result()
+                except Exception as err:
+                    self.logger.error(
+                        'Failed to start pooled resource ({}).'.format(err))
+                    self._startup_error = err
+                    self._lose(err)
+                else:
+                    self.release(resource)
+
+        self.logger.info('Pool started ({}/{} resource(s)).'.format(
+            self.idle, self._size))
+
+    # _start ()
+
+    def acquire(self, timeout=None):
+        """
+        Lease a resource from the pool.
+
+        :param timeout: Timeout in seconds to wait for an idle resource.
+            `None` blocks until a resource is available.
+        :raises PoolExhausted: If no resource became available within
+            `timeout`.
+        :raises PoolUnavailable: If the pool provides no resources at all
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                capacity = self._num_resources + self._num_pending
+                if self._started and not capacity:
+                    raise PoolUnavailable(self._error)
+
+            wait = self.POLL_INTERVAL
+            if deadline is not None:
+                wait = min(wait, max(deadline - time.monotonic(), 0))
+            try:
+                resource = self._idle.get(timeout=wait)
+            except queue.Empty:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise PoolExhausted(timeout)
+                continue
+
+            if self._is_healthy(resource):
+                return resource
+
+            self.logger.warning(
+                'Replacing unhealthy resource {!r} ...'.format(resource))
+            self._discard(resource)
+            try:
+                return self._create()
+            except Exception as err:
+                self.logger.error(
+                    'Failed to replace pooled resource ({}).'.format(err))
+                self._lose(err)
+
+    # acquire ()
+
+    def release(self, resource):
+        """
+        Return a leased resource to the pool.
+        """
+        self._idle.put(resource)
+        self._ready.set()
+
+    @contextlib.contextmanager
+    def lease(self, timeout=None):
+        resource = self.acquire(timeout=timeout)
+        try:
+            yield resource
+        finally:
+            self.release(resource)
+
+    # lease ()
+
+    def close(self):
+        """
+        Destroy all idle resources. Lost resources are not recreated
+        anymore.
+        """
+        self._closed.set()
+        while True:
+            try:
+                resource = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(resource)
+
+    # close ()
+
+    def _create(self, reserved=False):
+        if not reserved:
+            with self._lock:
+                self._num_pending += 1
+        try:
+            resource = self._factory()
+            if not self._is_healthy(resource):
+                self._discard(resource, registered=False)
+                raise UnhealthyResource(resource)
+
+            with self._lock:
+                self._num_resources += 1
+        finally:
+            with self._lock:
+                self._num_pending -= 1
+
+        self.logger.debug('Created pooled resource {!r}.'.format(resource))
+        return resource
+
+    # _create ()
+
+    def _lose(self, error):
+        """
+        Account for a resource failed to be created and recreate it in the
+        background.
+        """
+        with self._lock:
+            self._num_lost += 1
+            self._error = error
+        threading.Thread(target=self._recreate,
+                         name='ramsis-pool-recreate', daemon=True).start()
+
+    # _lose ()
+
+    def _recreate(self):
+        delay = self.RETRY_DELAY
+        while not self._closed.wait(delay):
+            try:
+                resource = self._create()
+            except Exception as err:
+                self.logger.warning(
+                    'Failed to recreate pooled resource ({}).'.format(err))
+                self._error = err
+                delay = min(delay * 2, self.MAX_RETRY_DELAY)
+                continue
+
+            with self._lock:
+                self._num_lost -= 1
+                if not self._num_lost:
+                    self._error = None
+            self.logger.info(
+                'Recreated pooled resource {!r}.'.format(resource))
+            if self._closed.is_set():
+                self._discard(resource)
+            else:
+                self.release(resource)
+            return
+
+    # _recreate ()
+
+    def _discard(self, resource, registered=True):
+        if registered:
+            with self._lock:
+                self._num_resources -= 1
+        if self._destroy is not None:
+            try:
+                self._destroy(resource)
+            except Exception as err:
+                self.logger.warning(
+                    'Failed to destroy resource {!r} ({}).'.format(
+                        resource, err))
+
+    # _discard ()
+
+    def _is_healthy(self, resource):
+        if self._health_check is None:
+            return True
+        try:
+            return bool(self._health_check(resource))
+        except Exception as err:
+            self.logger.debug(
+                'Health check failed for {!r} ({}).'.format(resource, err))
+            return False
+
+    # _is_healthy ()
+
+# class Pool
+
+# ---- END OF <pool.py> ----
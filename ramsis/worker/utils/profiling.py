@@ -0,0 +1,286 @@
+# This is <profiling.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Profiling facilities.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Sampled, opt-in profiling facilities. A configurable fraction of requests
+and run executions is profiled either by means of :py:mod:`cProfile` or by
+means of a wall-clock stack sampler. Profiles are written per run to a
+directory:
+
+* ``<run_id>.<kind>.<timestamp>.pstats`` (:py:mod:`pstats` format, e.g.
+  ``python -m pstats`` or `snakeviz`)
+* ``<run_id>.<kind>.<timestamp>.folded`` (collapsed stacks, e.g.
+  `flamegraph.pl` or `speedscope`)
+
+.. note::
+
+    With Python>=3.12 :py:mod:`cProfile` profiles all threads of a process
+    i.e. at most one `cprofile` session is active at a time; blocks sampled
+    meanwhile are not profiled. Profiling coroutines additionally records the
+    coroutines interleaved on the same event loop.
+"""
+
+import collections
+import contextlib
+import contextvars
+import cProfile
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+from marshmallow import Schema, fields, validate
+
+from ramsis.utils.error import Error
+
+
+MODE_CPROFILE = 'cprofile'
+MODE_SAMPLE = 'sample'
+MODES = (MODE_CPROFILE, MODE_SAMPLE)
+
+# cProfile is implemented by means of sys.monitoring i.e. a single profiler
+# is active per process
+EXCLUSIVE_CPROFILE = sys.version_info >= (3, 12)
+
+_sample = contextvars.ContextVar('profiling_sample', default=None)
+
+
+# -----------------------------------------------------------------------------
+class ProfilingError(Error):
+    """Base profiling error ({})."""
+
+
+# -----------------------------------------------------------------------------
+class Profiler(object):
+    """
+    Sampling profiler. Both `rate` and `mode` may be reconfigured at
+    runtime by means of :py:meth:`configure`.
+
+    :param str path: Directory profiles are written to
+    :param float rate: Fraction (between 0 and 1) of requests and runs
+        profiled. `0` disables profiling.
+    :param str mode: Either `cprofile` (deterministic profiling) or `sample`
+        (wall-clock stack sampling)
+    :param float interval: Sampling interval in seconds of the stack sampler
+    """
+
+    LOGGER = 'ramsis.worker.profiling'
+
+    def __init__(self, path, rate=0., mode=MODE_CPROFILE, interval=0.005,
+                 logger=None):
+        self.path = path
+        self.rate = 0.
+        self.mode = MODE_CPROFILE
+        self.interval = interval
+
+        self.logger = (logging.getLogger(logger) if logger else
+                       logging.getLogger(self.LOGGER))
+
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+        self.configure(rate=rate, mode=mode, interval=interval)
+
+    # __init__ ()
+
+    def configure(self, rate=None, mode=None, interval=None):
+        """
+        Reconfigure the profiler. Arguments being `None` are left
+        unchanged.
+
+        :raises ProfilingError: If an argument is invalid
+        """
+        if rate is not None and not 0 <= rate <= 1:
+            raise ProfilingError('Invalid rate: {!r}'.format(rate))
+        if mode is not None and mode not in MODES:
+            raise ProfilingError('Invalid mode: {!r}'.format(mode))
+        if interval is not None and interval <= 0:
+            raise ProfilingError('Invalid interval: {!r}'.format(interval))
+
+        if rate is not None:
+            self.rate = rate
+        if mode is not None:
+            self.mode = mode
+        if interval is not None:
+            self.interval = interval
+        self.logger.info('Profiling configured (rate={}, mode={}).'.format(
+            self.rate, self.mode))
+
+    # configure ()
+
+    def config(self):
+        """
+        :returns: The profiler's configuration
+        :rtype: dict
+        """
+        return {'rate': self.rate, 'mode': self.mode,
+                'interval': self.interval, 'path': self.path}
+
+    @contextlib.contextmanager
+    def profile(self, kind, run_id=None):
+        """
+        Context manager profiling the block if sampled.
+
+        :param str kind: Kind of the profiled block (e.g. `get`, `post`,
+            `run`)
+        :param run_id: Identifier of the run the block belongs to. If
+            unknown, the identifier may be defined later on by means of
+            :py:func:`tag`.
+        """
+        if not self.rate or random.random() >= self.rate:
+            yield None
+            return
+
+        mode = self.mode
+        exclusive = mode == MODE_CPROFILE and EXCLUSIVE_CPROFILE
+        if exclusive and not self._lock.acquire(blocking=False):
+            # another session is active
+            yield None
+            return
+
+        sample = _Sample(kind, run_id, mode, self.interval)
+        token = _sample.set(sample)
+        try:
+            sample.start()
+            try:
+                yield sample
+            finally:
+                sample.stop()
+        finally:
+            _sample.reset(token)
+            if exclusive:
+                self._lock.release()
+
+        try:
+            fname = sample.dump(self.path)
+        except Exception as err:
+            self.logger.warning('Failed to dump profile ({}).'.format(err))
+        else:
+            self.logger.debug('Profile written to {!r}.'.format(fname))
+
+    # profile ()
+
+# class Profiler
+
+
+class _Sample(object):
+    """
+    A single profiling session.
+    """
+
+    def __init__(self, kind, run_id, mode, interval):
+        self.kind = kind
+        self.run_id = run_id
+        self.mode = mode
+        self.interval = interval
+        self.timestamp = time.time()
+
+        self._profile = None
+        self._stacks = collections.Counter()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.mode == MODE_CPROFILE:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._thread = threading.Thread(
+                target=self._sample, args=(threading.get_ident(), ),
+                name='ramsis-profiler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._profile is not None:
+            self._profile.disable()
+        else:
+            self._stopped.set()
+            self._thread.join()
+
+    def dump(self, path):
+        """
+        Write the profile to `path`.
+
+        :returns: The profile's filename
+        :rtype: str
+        """
+        fname = os.path.join(path, '{}.{}.{}.{}'.format(
+            self.run_id or uuid.uuid4(), self.kind,
+            int(self.timestamp * 1000),
+            'pstats' if self._profile is not None else 'folded'))
+
+        if self._profile is not None:
+            self._profile.dump_stats(fname)
+        else:
+            with open(fname, 'w') as ofd:
+                for stack, count in self._stacks.most_common():
+                    ofd.write('{} {}\n'.format(stack, count))
+        return fname
+
+    # dump ()
+
+    def _sample(self, ident):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(ident)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{} ({}:{})'.format(
+                    code.co_name, os.path.basename(code.co_filename),
+                    code.co_firstlineno))
+                frame = frame.f_back
+            self._stacks[';'.join(reversed(stack))] += 1
+            del frame
+
+    # _sample ()
+
+# class _Sample
+
+
+class ProfilingConfigSchema(Schema):
+    """
+    Schema of a profiler (re)configuration.
+    """
+    rate = fields.Float(validate=validate.Range(min=0, max=1))
+    mode = fields.Str(validate=validate.OneOf(MODES))
+    interval = fields.Float(validate=validate.Range(min=0.0001))
+
+    class Meta:
+        # NOTE(damb): marshmallow<3 only; invokes the parser's error handler
+        strict = True
+
+# class ProfilingConfigSchema
+
+
+def session(profiler, kind, run_id=None):
+    """
+    :returns: :py:meth:`Profiler.profile` context manager or a no-op context
+        manager if `profiler` is `None`
+    """
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.profile(kind, run_id=run_id)
+
+# session ()
+
+
+def tag(run_id):
+    """
+    Define the run identifier of the profiling session currently active
+    within the calling context (if any).
+    """
+    sample = _sample.get()
+    if sample is not None and sample.run_id is None:
+        sample.run_id = run_id
+
+# tag ()
+
+# ---- END OF <profiling.py> ----
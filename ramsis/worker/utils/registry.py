@@ -0,0 +1,684 @@
+# This is <registry.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Run registry facilities.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Run registry facilities. A *run* wraps a single :py:class:`Task` instance
+together with its explicit state. The registry keeps track of all runs
+currently known to a worker. Identical runs in flight are coalesced by means
+of a :py:class:`SingleFlight` index.
+"""
+
+import asyncio
+import collections
+import datetime
+import enum
+import functools
+import logging
+import threading
+import time
+import uuid
+
+from ramsis.utils.error import Error
+from ramsis.worker.utils.metrics import RUNS
+
+
+# -----------------------------------------------------------------------------
+class RegistryError(Error):
+    """Base registry error ({})."""
+
+class InvalidStateTransition(RegistryError):
+    """Invalid run state transition ({})."""
+
+
+class RunState(enum.Enum):
+    ACCEPTED = 'accepted'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+# class RunState
+
+
+# valid state transitions
+_TRANSITIONS = {
+    RunState.ACCEPTED: (RunState.RUNNING, RunState.FAILED),
+    RunState.RUNNING: (RunState.DONE, RunState.FAILED),
+    RunState.DONE: (),
+    RunState.FAILED: (), }
+
+
+# -----------------------------------------------------------------------------
+class Run(object):
+    """
+    A single model run. A run owns its task and implements the state
+    machine
+
+    ..code::
+
+        ACCEPTED -> RUNNING -> DONE
+            |          |
+            +----------+----> FAILED
+
+    :param task: Configured task instance
+    :type task: :py:class:`ramsis.worker.utils.task.Task`
+    :param str run_id: Optional run identifier
+    :param timeout: Optional wall-clock deadline in seconds of the run's
+        execution
+    """
+
+    LOGGER = 'ramsis.worker.run'
+
+    def __init__(self, task, run_id=None, timeout=None, logger=None):
+        self.id = run_id if run_id else str(uuid.uuid4())
+        self.task = task
+        self.timeout = timeout
+        self.cancelled = False
+        self.created = datetime.datetime.utcnow()
+        self.updated = self.created
+        self.error = None
+
+        self._state = RunState.ACCEPTED
+        # the run's task is being started
+        self._starting = False
+        self._lock = threading.RLock()
+        self._cv = threading.Condition(self._lock)
+        self._callbacks = []
+        self._listeners = []
+        # runs following the run
+        self._followers = []
+
+        self.logger = (logging.getLogger(logger) if logger else
+                       logging.getLogger(self.LOGGER))
+
+    # __init__ ()
+
+    @property
+    def state(self):
+        return self._state
+
+    @property
+    def is_finished(self):
+        return self._state in (RunState.DONE, RunState.FAILED)
+
+    def transition(self, state, error=None):
+        """
+        Transition the run into `state`.
+
+        :param state: Target state
+        :type state: :py:class:`RunState`
+        :param error: Optional error causing the transition
+        :raises InvalidStateTransition: If the transition is not allowed.
+        """
+        with self._lock:
+            if state not in _TRANSITIONS[self._state]:
+                raise InvalidStateTransition(
+                    '{} -> {}'.format(self._state.value, state.value))
+
+            self.logger.debug('Run {}: {} -> {}'.format(
+                self.id, self._state.value, state.value))
+            self._state = state
+            self.updated = datetime.datetime.utcnow()
+            if error is not None:
+                self.error = str(error)
+            self._cv.notify_all()
+            for fn in list(self._listeners):
+                self._invoke_callback(fn)
+
+            if self.is_finished:
+                callbacks, self._callbacks = self._callbacks, []
+                for fn in callbacks:
+                    self._invoke_callback(fn)
+
+    # transition ()
+
+    def wait(self, timeout=None):
+        """
+        Block until the run finished or `timeout` (in seconds) expired.
+
+        :returns: The current state of the run
+        :rtype: :py:class:`RunState`
+        """
+        with self._cv:
+            self._cv.wait_for(lambda: self.is_finished, timeout=timeout)
+            return self._state
+
+    # wait ()
+
+    def wait_for_transition(self, state, timeout=None):
+        """
+        Block until the run left `state` or `timeout` (in seconds) expired.
+
+        :returns: The current state of the run
+        :rtype: :py:class:`RunState`
+        """
+        with self._cv:
+            self._cv.wait_for(lambda: self._state is not state,
+                              timeout=timeout)
+            return self._state
+
+    # wait_for_transition ()
+
+    async def wait_async(self, timeout=None):
+        """
+        Awaitable variant of :py:meth:`wait`. Waiting does not occupy a
+        thread.
+
+        :returns: The current state of the run
+        :rtype: :py:class:`RunState`
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        state = self._state
+        while state not in (RunState.DONE, RunState.FAILED):
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                break
+            state = await self.wait_for_transition_async(
+                state, timeout=remaining)
+        return state
+
+    # wait_async ()
+
+    async def wait_for_transition_async(self, state, timeout=None):
+        """
+        Awaitable variant of :py:meth:`wait_for_transition`.
+
+        :returns: The current state of the run
+        :rtype: :py:class:`RunState`
+        """
+        loop = asyncio.get_running_loop()
+        transitioned = loop.create_future()
+
+        def listener(run):
+            # NOTE(damb): Transitions happen on executor threads.
+            loop.call_soon_threadsafe(_set_done, transitioned)
+
+        self.add_listener(listener)
+        try:
+            if self._state is state:
+                await asyncio.wait_for(transitioned, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.remove_listener(listener)
+
+        return self._state
+
+    # wait_for_transition_async ()
+
+    def add_listener(self, fn):
+        """
+        Attach the callable `fn` to the run. `fn` is called with the run as
+        its only argument on every state transition. Listeners are called
+        with the run's lock held and must not block.
+        """
+        with self._lock:
+            self._listeners.append(fn)
+
+    def remove_listener(self, fn):
+        with self._lock:
+            try:
+                self._listeners.remove(fn)
+            except ValueError:
+                pass
+
+    # remove_listener ()
+
+    def add_done_callback(self, fn):
+        """
+        Attach the callable `fn` to the run. `fn` is called with the run as
+        its only argument as soon as the run finished. If the run is already
+        finished `fn` is called immediately.
+        """
+        with self._lock:
+            if not self.is_finished:
+                self._callbacks.append(fn)
+                return
+
+        self._invoke_callback(fn)
+
+    # add_done_callback ()
+
+    def _invoke_callback(self, fn):
+        try:
+            fn(self)
+        except Exception as err:
+            self.logger.exception(
+                'Run {}: callback {!r} raised ({}).'.format(self.id, fn, err))
+
+    # _invoke_callback ()
+
+    def start(self, timeout=None):
+        """
+        Execute the run's task.
+
+        :param timeout: Maximum time in seconds to block while the task is
+            started (e.g. while leasing a pooled MATLAB engine)
+
+        The run's lock is not held while the task is started since starting
+        a task may block (e.g. while leasing a pooled MATLAB engine). A run
+        cancelled meanwhile has its task cancelled as soon as the task was
+        started.
+        """
+        with self._lock:
+            self.transition(RunState.RUNNING)
+            self._starting = True
+
+        try:
+            self.task(timeout=timeout)
+        except Exception as err:
+            with self._lock:
+                self._starting = False
+            self.fail(err)
+            raise
+
+        with self._lock:
+            self._starting = False
+            if self.cancelled:
+                self._cancel_task()
+
+    # start ()
+
+    def fail(self, error=None):
+        """
+        Mark the run as failed unless it is already finished.
+        """
+        with self._lock:
+            if not self.is_finished:
+                self.transition(RunState.FAILED, error=error)
+
+    # fail ()
+
+    def cancel(self, error='Run cancelled.'):
+        """
+        Cancel the run unless it is already finished. If running, the
+        run's task is cancelled such that leased resources (e.g. a pooled
+        MATLAB engine) are freed.
+
+        :returns: `False` if the run is already finished, else `True`
+        """
+        with self._lock:
+            if self.is_finished:
+                return False
+
+            # NOTE(damb): A task being started is cancelled as soon as it
+            # was started (see start ()).
+            if self._state is RunState.RUNNING and not self._starting:
+                self._cancel_task()
+
+            self.cancelled = True
+            self.transition(RunState.FAILED, error=error)
+            return True
+
+    # cancel ()
+
+    def _cancel_task(self):
+        try:
+            if not self.task.cancel():
+                self.logger.warning(
+                    'Run {}: failed to cancel task {!r}.'.format(
+                        self.id, self.task))
+        except Exception as err:
+            self.logger.warning(
+                'Run {}: failed to cancel task {!r} ({}).'.format(
+                    self.id, self.task, err))
+
+    # _cancel_task ()
+
+    def follow(self, run):
+        """
+        Follow the identical run `run` (single-flight) i.e. mirror its state
+        transitions and share its result rather than executing the own task.
+        The run's task must be a
+        :py:class:`ramsis.worker.utils.task.SharedTask`.
+
+        If `run` fails the run fails, too, unless `run` was cancelled (see
+        :py:class:`SingleFlight`). Cancelling the run does not affect `run`.
+
+        :returns: `False` if `run` is already finished (i.e. its result
+            might already be released), else `True`
+        """
+        with run._lock:
+            if run.is_finished:
+                return False
+            run.add_listener(self._mirror)
+            run._followers.append(self)
+            self._mirror(run)
+        return True
+
+    # follow ()
+
+    @property
+    def followers(self):
+        """Unfinished runs following the run."""
+        with self._lock:
+            return [run for run in self._followers if not run.is_finished]
+
+    def promote(self, task):
+        """
+        Promote a run following a cancelled run such that it is executed
+        itself by means of `task`. The run is reset to `accepted`.
+
+        :returns: `False` if the run is already finished, else `True`
+        """
+        with self._lock:
+            if self.is_finished:
+                return False
+
+            self.logger.debug('Run {}: promoted ({} -> {})'.format(
+                self.id, self._state.value, RunState.ACCEPTED.value))
+            self.task = task
+            self._state = RunState.ACCEPTED
+            self.updated = datetime.datetime.utcnow()
+            self._cv.notify_all()
+            for fn in list(self._listeners):
+                self._invoke_callback(fn)
+            return True
+
+    # promote ()
+
+    def _mirror(self, run):
+        """
+        Listener mirroring the state of the run followed.
+        """
+        with self._lock:
+            if self.is_finished:
+                return
+
+            state = run.state
+            started = state in (RunState.RUNNING, RunState.DONE)
+            if self._state is RunState.ACCEPTED and started:
+                self.transition(RunState.RUNNING)
+            if state is RunState.DONE:
+                self.task.resolve(run.task.result)
+                self.transition(RunState.DONE)
+            elif state is RunState.FAILED:
+                if run.cancelled:
+                    # NOTE(damb): A cancelled run does not take the runs
+                    # following it down (see SingleFlight).
+                    return
+                self.task.resolve(returncode=1)
+                self.transition(
+                    RunState.FAILED,
+                    error='Coalesced run {} failed ({}).'.format(
+                        run.id, run.error))
+
+    # _mirror ()
+
+    def poll(self):
+        """
+        Poll the run's task and update the state accordingly.
+
+        :returns: The current state of the run
+        :rtype: :py:class:`RunState`
+        """
+        with self._lock:
+            if self._state is RunState.RUNNING:
+                try:
+                    return_code = self.task.poll()
+                except Exception as err:
+                    self.transition(RunState.FAILED, error=err)
+                else:
+                    if return_code == 0:
+                        self.transition(RunState.DONE)
+                    elif return_code is not None:
+                        self.transition(RunState.FAILED)
+
+            return self._state
+
+    # poll ()
+
+    def __repr__(self):
+        return '<{}(id={}, state={})>'.format(
+            type(self).__name__, self.id, self._state.value)
+
+# class Run
+
+
+def _count_outcome(run):
+    RUNS.inc(outcome='cancelled' if run.cancelled else run.state.value)
+
+
+def _set_done(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class RunRegistry(object):
+    """
+    Thread-safe registry of runs. Finished runs are retained until removed
+    explicitly (e.g. when fetched) or evicted: runs finished longer than
+    `retention` ago are evicted, and if more than `max_finished` runs are
+    finished the runs finished first are evicted.
+
+    :param retention: Retention period of finished runs in seconds. `None`
+        retains finished runs until removed.
+    :param max_finished: Maximum number of finished runs retained. `None`
+        means unbounded.
+    """
+
+    LOGGER = 'ramsis.worker.registry'
+
+    # minimum interval between evictions in seconds
+    EVICTION_INTERVAL = 60
+
+    def __init__(self, retention=None, max_finished=None, logger=None):
+        self.retention = retention
+        self.max_finished = max_finished
+
+        self._runs = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._last_eviction = time.monotonic()
+
+        self.logger = (logging.getLogger(logger) if logger else
+                       logging.getLogger(self.LOGGER))
+
+    def create(self, task, run_id=None, timeout=None):
+        """
+        Create and register a new run for `task`.
+
+        :returns: The newly registered run
+        :rtype: :py:class:`Run`
+        """
+        self.evict()
+
+        run = Run(task, run_id=run_id, timeout=timeout)
+        run.add_done_callback(_count_outcome)
+        with self._lock:
+            self._runs[run.id] = run
+        return run
+
+    # create ()
+
+    def evict(self, force=False):
+        """
+        Evict finished runs according to the retention policy. The tasks of
+        evicted runs are reset i.e. their results and streams are released.
+        Unless `force` is set or more than `max_finished` runs are
+        registered, eviction is performed at most every `EVICTION_INTERVAL`
+        seconds.
+
+        :returns: The runs evicted
+        :rtype: list
+        """
+        if self.retention is None and self.max_finished is None:
+            return []
+
+        now = time.monotonic()
+        with self._lock:
+            exceeded = False
+            if self.max_finished is not None:
+                exceeded = len(self._runs) > self.max_finished
+            elapsed = now - self._last_eviction
+            if not (force or exceeded or elapsed >= self.EVICTION_INTERVAL):
+                return []
+            self._last_eviction = now
+
+            finished = sorted((run for run in self._runs.values()
+                               if run.is_finished),
+                              key=lambda run: run.updated)
+            evicted = []
+            if self.retention is not None:
+                retention = datetime.timedelta(seconds=self.retention)
+                threshold = datetime.datetime.utcnow() - retention
+                evicted = [run for run in finished if run.updated < threshold]
+            if self.max_finished is not None:
+                num_evicted = max(len(finished) - self.max_finished,
+                                  len(evicted))
+                evicted = finished[:num_evicted]
+
+            for run in evicted:
+                self._runs.pop(run.id, None)
+
+        for run in evicted:
+            try:
+                run.task.reset()
+            except Exception as err:
+                self.logger.warning(
+                    'Failed to reset task of run {!r} ({}).'.format(run, err))
+        if evicted:
+            self.logger.debug('Evicted {} run(s).'.format(len(evicted)))
+
+        return evicted
+
+    # evict ()
+
+    def get(self, run_id):
+        """
+        :returns: The run identified by `run_id` or `None`
+        """
+        with self._lock:
+            return self._runs.get(run_id)
+
+    def remove(self, run_id):
+        """
+        Remove the run identified by `run_id` from the registry.
+
+        :returns: The removed run or `None`
+        """
+        with self._lock:
+            return self._runs.pop(run_id, None)
+
+    def runs(self):
+        """
+        :returns: Snapshot of the runs currently registered
+        :rtype: list
+        """
+        with self._lock:
+            return list(self._runs.values())
+
+    def __contains__(self, run_id):
+        with self._lock:
+            return run_id in self._runs
+
+    def __len__(self):
+        with self._lock:
+            return len(self._runs)
+
+# class RunRegistry
+
+
+class SingleFlight(object):
+    """
+    Thread-safe index of the runs in flight keyed on a canonical hash of
+    their input message (see
+    :py:func:`ramsis.worker.utils.cache.canonical_hash`). Identical runs
+    submitted while a run is in flight are coalesced i.e. they follow the
+    run in flight (see :py:meth:`Run.follow`) rather than being executed
+    themselves.
+
+    Coalescing is best-effort: identical runs submitted at the very same
+    time may both be executed.
+
+    If a run in flight is cancelled (either by its client or due to its
+    deadline) the runs following it are not affected: the first of them is
+    promoted i.e. it is executed itself and the remaining runs follow the
+    promoted run.
+    """
+
+    LOGGER = 'ramsis.worker.single_flight'
+
+    def __init__(self, logger=None):
+        # key: run
+        self._runs = {}
+        self._lock = threading.Lock()
+
+        self.logger = (logging.getLogger(logger) if logger else
+                       logging.getLogger(self.LOGGER))
+
+    def get(self, key):
+        """
+        :returns: The run in flight for `key` or `None`
+        """
+        with self._lock:
+            return self._runs.get(key)
+
+    def lead(self, key, run, promote=None):
+        """
+        Register `run` as the run in flight for `key`. The run is
+        unregistered as soon as it finished.
+
+        :param promote: Callable taking a run which follows `run` as its
+            only argument. The callable promotes (see :py:meth:`Run.promote`)
+            and submits the run if `run` is cancelled. If `None` the runs
+            following a cancelled run fail.
+        """
+        with self._lock:
+            self._runs[key] = run
+        run.add_done_callback(functools.partial(self._land, key, promote))
+
+    # lead ()
+
+    def discard(self, run):
+        """
+        Unregister `run` which was not submitted. Runs following `run` fail.
+        """
+        with self._lock:
+            for key in [k for k, v in self._runs.items() if v is run]:
+                del self._runs[key]
+        run.fail('Run not submitted.')
+
+    # discard ()
+
+    def _land(self, key, promote, run):
+        with self._lock:
+            if self._runs.get(key) is run:
+                del self._runs[key]
+
+        followers = run.followers
+        if not (run.cancelled and followers):
+            return
+
+        error = 'Coalesced run {} cancelled.'.format(run.id)
+        if promote is None:
+            for follower in followers:
+                follower.fail(error)
+            return
+
+        promoted = followers[0]
+        for follower in followers[1:]:
+            if not follower.follow(promoted):
+                follower.fail(error)
+        try:
+            promote(promoted)
+        except Exception as err:
+            self.logger.warning(
+                'Failed to promote run {!r} ({}).'.format(promoted, err))
+            promoted.fail(error)
+        else:
+            self.logger.info('Run {!r} promoted (run {} cancelled).'.format(
+                promoted, run.id))
+
+    # _land ()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._runs)
+
+# class SingleFlight
+
+# ---- END OF <registry.py> ----
@@ -12,18 +12,36 @@
 Resource facilities for worker webservices.
 """
 
+import functools
+import json
 import logging
+import threading
 
-from flask import request
+from http import HTTPStatus
+
+from flask import Response, request, url_for
 from flask_restful import Resource
 from werkzeug.exceptions import HTTPException
 
 
 from ramsis.utils.error import Error
 from ramsis.utils.protocol import StatusCode, WorkerInputMessageSchema
-from ramsis.worker.utils import escape_newline
-from ramsis.worker.utils.parser import parser
-from ramsis.worker.utils.task import TaskError
+from ramsis.worker.utils import escape_newline, profiling
+from ramsis.worker.utils.cache import canonical_hash
+from ramsis.worker.utils.executor import QueueFull
+from ramsis.worker.utils.metrics import (CONTENT_TYPE, REGISTRY, RESULT_SIZE,
+                                         RUNS_COALESCED, STAGE_LATENCY,
+                                         Counter, Gauge)
+from ramsis.worker.utils.parser import parse_json, parser
+from ramsis.worker.utils.profiling import (ProfilingConfigSchema,
+                                           ProfilingError, session)
+from ramsis.worker.utils.registry import RunState
+from ramsis.worker.utils.response import (conditional, negotiate_encoding,
+                                          represent)
+from ramsis.worker.utils.serializer import (DTYPES, SerializationError,
+                                            mimetypes, negotiate_mimetype,
+                                            serialize, to_ndarray)
+from ramsis.worker.utils.task import CompletedTask, SharedTask, TaskError
 
 
 class WorkerError(Error):
@@ -37,44 +55,89 @@ class WorkerError(Error):
 # -----------------------------------------------------------------------------
 class AbstractWorkerResource(Resource):
     """
-    Abstract base class for a worker resource
+    Abstract base class for a worker resource. The resource is intended to
+    be registered both for the collection and the item URL i.e.
+
+    ..code::
+
+        api.add_resource(Resource, '/runs', '/runs/<run_id>',
+                         resource_class_kwargs={'task': ...,
+                                                'registry': ...,
+                                                'executor': ...})
+
+    :param task: Task factory i.e. a callable returning a new, unconfigured
+        :py:class:`ramsis.worker.utils.task.Task` instance per run.
+    :param registry: Registry keeping track of the runs
+    :type registry: :py:class:`ramsis.worker.utils.registry.RunRegistry`
+    :param executor: Executor the runs are executed with
+    :type executor: :py:class:`ramsis.worker.utils.executor.RunExecutor`
+    :param cache: Optional result cache
+    :type cache: :py:class:`ramsis.worker.utils.cache.ResultCache`
+    :param store: Optional persistent result store
+    :type store: :py:class:`ramsis.worker.utils.store.ResultStore`
+    :param profiler: Optional profiler sampling requests
+    :type profiler: :py:class:`ramsis.worker.utils.profiling.Profiler`
+    :param int max_payload_size: Maximum size of a decoded input message in
+        bytes. `None` disables the limit.
+    :param response_cache: Optional cache of result representations
+    :type response_cache:
+        :py:class:`ramsis.worker.utils.response.ResponseCache`
+    :param single_flight: Optional index of the runs in flight; identical
+        runs submitted while a run is in flight are coalesced
+    :type single_flight:
+        :py:class:`ramsis.worker.utils.registry.SingleFlight`
     """
     LOGGER = 'ramsis.worker_resource'
-    TASK = None
 
-    # state storage - this variable is intended to be accessed by means of the
-    # corresponding classmethods
-    # TODO(damb): Check if the state is handled properly if two workers are
-    # running using this base class.
-    _STATE = None
+    def __init__(self, task=None, registry=None, executor=None, cache=None,
+                 store=None, profiler=None, max_payload_size=None,
+                 response_cache=None, single_flight=None, logger=None):
+        self._task = task
+        self._registry = registry
+        self._executor = executor
+        self._cache = cache
+        self._store = store
+        self._profiler = profiler
+        self._response_cache = response_cache
+        self._single_flight = single_flight
+        self.max_payload_size = max_payload_size
 
-    def __init__(self, logger=None):
         self.logger = (logging.getLogger(logger) if logger else
                        logging.getLogger(self.LOGGER))
 
     # __init__ ()
 
-    @classmethod
-    def state(cls):
-        return cls._STATE
+    def registry(self):
+        if self._registry is None:
+            raise WorkerError('Registry undefined.')
+        return self._registry
 
-    @classmethod
-    def update_state(cls, val):
-        cls._STATE = val
+    def executor(self):
+        if self._executor is None:
+            raise WorkerError('Executor undefined.')
+        return self._executor
 
-    @classmethod
-    def task(cls):
-        if cls.TASK is None:
-            raise WorkerError('TASK undefined.')
-        return cls.TASK
+    def create_task(self):
+        """
+        :returns: A new task instance
+        :rtype: :py:class:`ramsis.worker.utils.task.Task`
+        """
+        if self._task is None:
+            raise WorkerError('Task undefined.')
+        return self._task()
 
-    def get(self):
+    def dispatch_request(self, *args, **kwargs):
+        with session(self._profiler, request.method.lower(),
+                     run_id=kwargs.get('run_id')):
+            return super().dispatch_request(*args, **kwargs)
+
+    def get(self, run_id=None):
         return 'Method not allowed.', StatusCode.HTTPMethodNotAllowed.value
 
-    def delete(self):
+    def delete(self, run_id=None):
         return 'Method not allowed.', StatusCode.HTTPMethodNotAllowed.value
 
-    def post(self):
+    def post(self, run_id=None):
         return 'Method not allowed.', StatusCode.HTTPMethodNotAllowed.value
 
     def _parse(self, request, locations=('json',)):
@@ -91,6 +154,9 @@ class AbstractWorkerResource(Resource):
         overloading this template function and using a model specific schema
         allows the validation of `model_parameters`.
         """
+        if tuple(locations) == ('json', ):
+            return parse_json(WorkerInputMessageSchema, request,
+                              max_bytes=self.max_payload_size)
         return parser.parse(WorkerInputMessageSchema(), request,
                             locations=locations)
 
@@ -103,110 +169,170 @@ class AsyncWorkerResource(AbstractWorkerResource):
     """
     LOGGER = 'ramsis.worker_resource_async'
 
-    def __init__(self, logger=None):
+    # upper bound for long-polling in seconds
+    MAX_WAIT = 60
+
+    def __init__(self, task=None, registry=None, executor=None, cache=None,
+                 store=None, profiler=None, max_payload_size=None,
+                 response_cache=None, single_flight=None, logger=None):
         logger = logger if logger else self.LOGGER
-        super().__init__(logger=logger)
+        super().__init__(task=task, registry=registry, executor=executor,
+                         cache=cache, store=store, profiler=profiler,
+                         max_payload_size=max_payload_size,
+                         response_cache=response_cache,
+                         single_flight=single_flight, logger=logger)
 
     # __init__ ()
 
-    def get(self):
+    def get(self, run_id=None):
         """
         HTTP GET method of the async worker webservice API.
 
-        If available returns results else HTTP status code 204.
-        """
-        if self.state() is None:
-            self.logger.debug('No model task currently running.')
-            return '', StatusCode.CurrentlyNoTask.value
+        Without `run_id` a listing of the runs currently known is returned.
+        Else, if available returns the results of the run identified by
+        `run_id`.
+
+        If a persistent result store is configured results are served from
+        the store until evicted. Otherwise, results are retained by the
+        response cache (if configured) until evicted; without a response
+        cache results are delivered once.
 
-        return_code = self.state().poll()
-        if return_code is None:
-            self.logger.debug('Task {0!r} is still running ...'.format(
-                self.state()))
+        Results carry an ETag; conditional (`If-None-Match`) and partial
+        (`Range`) requests are supported. Large results are compressed
+        depending on the request's `Accept-Encoding` header.
+
+        The optional `wait` query parameter enables long-polling i.e. the
+        request blocks until the run finished or `wait` seconds (at most
+        `MAX_WAIT`) expired.
+        """
+        if run_id is None:
             # TODO(damb): Standardize ramsis client return values
-            return ({'message': StatusCode.TaskCurrentlyProcessing.name,
-                     'result': []}, StatusCode.TaskCurrentlyProcessing.value)
+            return ({'message': HTTPStatus.OK.phrase,
+                     'result': [{'run_id': run.id,
+                                 'state': run.poll().value}
+                                for run in self.registry().runs()]},
+                    HTTPStatus.OK.value)
 
-        elif return_code == 0:
-            self.logger.debug('Collecting results from task {0!r} ...'.format(
-                self.state()))
-            if self.state().stdout:
+        run = self.registry().get(run_id)
+        if run is not None:
+            state = run.poll()
+            wait = min(request.args.get('wait', 0, type=float),
+                       self.MAX_WAIT)
+            if not run.is_finished and wait > 0:
+                # long-polling
+                state = run.wait(timeout=wait)
+            if not run.is_finished:
                 self.logger.debug(
-                    'Task {!r} STDOUT: {}'.format(
-                        self.state(),
-                        escape_newline(str(self.state().stdout))))
-            try:
-                # NOTE(damb): Results are assigned during the first GET call
-                # after the task finished.
-                # TODO(damb): serialize results
-                result = self.state().result
-
-            except Exception as err:
-                msg = 'Failed to serialize results ({})'.format(err)
-                self.logger.warning(msg)
+                    'Run {0!r} is still running ...'.format(run))
                 # TODO(damb): Standardize ramsis client return values
-                return ({'message': msg,
-                         'result': []}, StatusCode.WorkerError.value)
+                return ({'message': StatusCode.TaskCurrentlyProcessing.name,
+                         'run_id': run.id,
+                         'state': state.value,
+                         'queue_position': self.executor().position(run.id),
+                         'result': []},
+                        StatusCode.TaskCurrentlyProcessing.value)
 
-            # reset and prepare for the next run
-            self.state().reset()
-            self.update_state(None)
+        if self._store is not None:
+            # NOTE(damb): Results of finished runs are served from the store
+            # until evicted by the retention policy.
+            record = self._store.get(run_id)
+            if run is None and record is not None and record.finished is None:
+                # the run is executed by another worker process sharing the
+                # store
+                wait = min(request.args.get('wait', 0, type=float),
+                           self.MAX_WAIT)
+                if wait > 0:
+                    record = self._store.wait(run_id, timeout=wait)
+                if record is not None and record.finished is None:
+                    # TODO(damb): Standardize ramsis client return values
+                    return ({'message':
+                             StatusCode.TaskCurrentlyProcessing.name,
+                             'run_id': run_id,
+                             'state': record.state.value,
+                             'queue_position': None,
+                             'result': []},
+                            StatusCode.TaskCurrentlyProcessing.value)
+            if record is not None and record.finished is not None:
+                return self._finished(record.run_id, record.state,
+                                      record.result, record.error,
+                                      record.stdout, record.stderr,
+                                      batch_size=record.batch_size)
 
-        else:
-            self.logger.warning('Task {!r} execution failed.'.format(
-                self.state()))
-            if self.state().stderr:
-                self.logger.debug(
-                    'Task {!r} STDERR: {}'.format(
-                        self.state(),
-                        escape_newline(str(self.state().stderr))))
-            self.state().reset()
-            self.update_state(None)
-            return ({'message': StatusCode.TaskProcessingError.name,
-                     'result': []}, StatusCode.TaskProcessingError.value)
+        if run is None:
+            retained = self._retained(run_id)
+            if retained is not None:
+                return self._finished(run_id, RunState.DONE, retained[0],
+                                      None, None, None,
+                                      batch_size=retained[1])
 
-        # TODO(damb): Standardize ramsis client return values
-        return ({'message': StatusCode.TaskCompleted.name,
-                 'result': [{'rate_prediction': result}]},
-                StatusCode.TaskCompleted.value)
+            self.logger.debug('No such run: {!r}'.format(run_id))
+            return ({'message': HTTPStatus.NOT_FOUND.phrase,
+                     'result': []}, HTTPStatus.NOT_FOUND.value)
+
+        try:
+            result = run.task.result if state is RunState.DONE else None
+        except Exception as err:
+            msg = 'Failed to fetch results ({})'.format(err)
+            self.logger.warning(msg)
+            # TODO(damb): Standardize ramsis client return values
+            return ({'message': msg,
+                     'run_id': run.id,
+                     'result': []}, StatusCode.WorkerError.value)
+
+        # without a store the run is dropped; the result is retained by the
+        # response cache (if configured)
+        self.registry().remove(run.id)
+        retval = self._finished(run.id, state, result, run.error,
+                                run.task.stdout, run.task.stderr,
+                                batch_size=run.task.batch_size)
+        if state is RunState.DONE:
+            self._retain(run.id, result, batch_size=run.task.batch_size)
+        run.task.reset()
+        return retval
 
     # get ()
 
-    def post(self):
-        """
-        HTTP PUT method of the async worker webservice API.
+    def post(self, run_id=None):
         """
+        HTTP POST method of the async worker webservice API. Creates a new
+        run and returns its identifier.
 
-        self.logger.debug('Received HTTP PUT request ({}).'.format(
-                          self.task()))
-        if self.state():
-            if self.state().poll() is None:
-                msg = 'Previous task has not finished yet.'
-            elif self.state().poll() == 0 and self.state().result:
-                msg = 'Previous results not fetched yet.'
+        If a result cache is configured and the result of an identical
+        input message is cached, the run is served from the cache i.e. it is
+        completed immediately. If single-flight coalescing is configured and
+        an identical run is in flight, the run follows the run in flight
+        i.e. it shares the run's execution and result.
 
-            self.logger.warning(msg)
-            # TODO(damb): Standardize ramsis client return values
-            return ({'message': msg,
-                     'result': []}, StatusCode.PreviousTaskNotCompleted.value)
+        Runs are admitted to the executor's bounded queue. The optional
+        `priority` query parameter defines the run's priority (lower values
+        are executed first). If the queue is full HTTP status code 503
+        including a `Retry-After` header is returned.
 
+        The optional `timeout` query parameter defines the run's wall-clock
+        deadline in seconds (overriding the executor's default). Runs
+        exceeding their deadline are cancelled.
+        """
+        if run_id is not None:
+            return 'Method not allowed.', StatusCode.HTTPMethodNotAllowed.value
+
+        self.logger.debug('Received HTTP POST request.')
         try:
             # parse arguments
-            args = self._parse(request, locations=('json',))
-            self.logger.debug(
-                'Configuring task {!r} with parameters {!r} ...'.format(
-                    self.task(), args))
-            self.task().configure(**args['model_parameters'])
-            self.logger.info('Executing task {0!r} ...'.format(self.task()))
-            # execute the task
-            # XXX(damb): The task itself must be implemented in a way such that
-            # it can be executed asynchronously.
-            self.task()()
-            self.update_state(self.task())
+            with STAGE_LATENCY.time(stage='parse'):
+                args = self._parse(request, locations=('json',))
+            priority = request.args.get('priority', 0, type=int)
+            timeout = request.args.get('timeout', None, type=float)
+            return self._submit(args, priority=priority, timeout=timeout)
 
+        except QueueFull as err:
+            retry_after = self.executor().retry_after()
+            self.logger.warning('{} (Retry-After: {}s)'.format(
+                err, retry_after))
+            return ({'message': str(err),
+                     'result': []}, HTTPStatus.SERVICE_UNAVAILABLE.value,
+                    {'Retry-After': str(retry_after)})
         except TaskError as err:
             self.logger.warning('{}'.format(err))
-            self.update_state(None)
             return ({'message': str(err),
                      'result': []}, StatusCode.WorkerError.value)
         except HTTPException as err:
@@ -215,16 +341,843 @@ class AsyncWorkerResource(AbstractWorkerResource):
             raise err
         except Exception as err:
             self.logger.error('{}'.format(err))
-            self.update_state(None)
             return ({'message': str(err),
                      'result': []}, StatusCode.WorkerError.value)
 
+    # post ()
+
+    def _submit(self, args, priority=0, timeout=None):
+        """
+        Create a run from the parsed input message `args` and submit it.
+        """
+        run, pending = self._create_run(args, timeout=timeout)
+        if not pending:
+            return self._accepted(run)
+
+        self.logger.info('Submitting run {0!r} ...'.format(run))
+        # XXX(damb): The task itself must be implemented in a way such that
+        # it can be executed asynchronously.
+        try:
+            queue_position = self.executor().submit(run, priority=priority)
+        except Exception:
+            self._discard(run)
+            raise
+
+        return self._accepted(run, queue_position=queue_position)
+
+    # _submit ()
+
+    def _create_run(self, args, batch=False, timeout=None):
+        """
+        Create a run from the parsed input message `args`. If possible, the
+        run is served from the result cache or follows an identical run in
+        flight.
+
+        :param bool batch: The input message's `model_parameters` is a list
+            of parameter sets
+        :param timeout: Optional wall-clock deadline of the run in seconds
+        :returns: Tuple of the form `(run, pending)` where `pending`
+            indicates that the run still needs to be submitted.
+        :rtype: tuple
+        """
+        batch_size = len(args['model_parameters']) if batch else None
+
+        key = None
+        if self._cache is not None or self._single_flight is not None:
+            key = canonical_hash(args)
+
+        if self._cache is not None:
+            hit, result = self._cache.get(key)
+            if hit:
+                run = self.registry().create(
+                    CompletedTask(result, batch_size=batch_size))
+                profiling.tag(run.id)
+                self._persist(run)
+                run.start()
+                run.poll()
+                self.logger.info(
+                    'Serving run {!r} from cache ({}).'.format(run, key))
+                return run, False
+
+        if self._single_flight is not None:
+            run = self._follow(key, batch_size=batch_size, timeout=timeout)
+            if run is not None:
+                return run, False
+
+        run = self.registry().create(self._configure_task(args, batch),
+                                     timeout=timeout)
+        profiling.tag(run.id)
+        self._lead(key, run, args, batch)
+        self._persist(run)
+        return run, True
+
+    # _create_run ()
+
+    def _configure_task(self, args, batch=False):
+        """
+        :returns: A new task configured with the input message `args`
+        """
+        task = self.create_task()
+        self.logger.debug(
+            'Configuring task {!r} with parameters {!r} ...'.format(
+                task, args))
+        with STAGE_LATENCY.time(stage='configure'):
+            if batch:
+                task.configure_batch(args['model_parameters'])
+            else:
+                task.configure(**args['model_parameters'])
+        return task
+
+    # _configure_task ()
+
+    def _lead(self, key, run, args, batch=False):
+        """
+        Attach the run `run` executing the input message `args` to the
+        result cache and register it as the run in flight for `key`.
+        """
+        if self._cache is not None:
+            run.add_done_callback(
+                functools.partial(_cache_result, self._cache, key))
+        if self._single_flight is not None:
+            self._single_flight.lead(
+                key, run, promote=functools.partial(
+                    self._promote, key, args=args, batch=batch))
+
+    # _lead ()
+
+    def _promote(self, key, run, args, batch=False):
+        """
+        Promote the run `run` following a cancelled run and submit it.
+        """
+        task = self._configure_task(args, batch)
+        if not run.promote(task):
+            return
+        self._lead(key, run, args, batch)
+        self.executor().submit(run)
+
+    # _promote ()
+
+    def _follow(self, key, batch_size=None, timeout=None):
+        """
+        Create a run following the identical run in flight for `key` (if
+        any). The run is cancelled if it exceeds its deadline `timeout`
+        (counted from now on).
+
+        :returns: The run or `None`
+        """
+        leader = self._single_flight.get(key)
+        if leader is None:
+            return None
+
+        run = self.registry().create(SharedTask(batch_size=batch_size),
+                                     timeout=timeout)
+        if not run.follow(leader):
+            # the run in flight finished meanwhile
+            self.registry().remove(run.id)
+            return None
+
+        if timeout is not None:
+            _start_deadline(run, timeout)
+        RUNS_COALESCED.inc()
+        profiling.tag(run.id)
+        self._persist(run)
+        self.logger.info('Run {!r} follows run {!r} ({}).'.format(
+            run, leader, key))
+        return run
+
+    # _follow ()
+
+    def delete(self, run_id=None):
+        """
+        HTTP DELETE method of the async worker webservice API. Cancels a
+        queued or running run; leased resources (e.g. a pooled MATLAB
+        engine) are freed immediately. The results of a finished run are
+        discarded.
+
+        A run executed by another worker process sharing the result store
+        is cancelled by its worker process (HTTP status code 202).
+        """
+        if run_id is None:
+            return 'Method not allowed.', StatusCode.HTTPMethodNotAllowed.value
+
+        return self._delete(run_id)
+
+    # delete ()
+
+    def _delete(self, run_id):
+        run = self.registry().get(run_id)
+        if run is not None:
+            self.executor().cancel(run.id)
+            if run.cancel('Run cancelled by client.'):
+                self.logger.info('Cancelled run {!r}.'.format(run))
+                # TODO(damb): Standardize ramsis client return values
+                return ({'message': HTTPStatus.OK.phrase,
+                         'run_id': run.id,
+                         'state': run.state.value,
+                         'result': []}, HTTPStatus.OK.value)
+
+            self.registry().remove(run.id)
+            run.task.reset()
+
+        if self._store is not None:
+            record = self._store.get(run_id)
+            if run is None and record is not None and record.finished is None:
+                if self._store.request_cancel(run_id):
+                    self.logger.info(
+                        'Requested cancellation of run {}.'.format(run_id))
+                    return ({'message': 'Cancellation requested.',
+                             'run_id': run_id,
+                             'result': []}, HTTPStatus.ACCEPTED.value)
+                # finished meanwhile
+                record = self._store.get(run_id)
+            if record is not None:
+                self._store.remove(run_id)
+                run = run or record
+
+        retained = self._retained(run_id)
+        if self._response_cache is not None:
+            self._response_cache.discard(run_id)
+
+        if run is None and retained is None:
+            return ({'message': HTTPStatus.NOT_FOUND.phrase,
+                     'result': []}, HTTPStatus.NOT_FOUND.value)
+
+        self.logger.info('Deleted run {}.'.format(run_id))
+        return ({'message': HTTPStatus.OK.phrase,
+                 'run_id': run_id,
+                 'result': []}, HTTPStatus.OK.value)
+
+    # _delete ()
+
+    def _discard(self, run):
+        """
+        Discard a run which was not submitted.
+        """
+        if self._single_flight is not None:
+            self._single_flight.discard(run)
+        self.registry().remove(run.id)
+        if self._store is not None:
+            self._store.remove(run.id)
+
+    # _discard ()
+
+    def _finished(self, run_id, state, result, error, stdout, stderr,
+                  batch_size=None):
+        """
+        Create the response for a finished run.
+        """
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        if state is RunState.DONE:
+            self.logger.debug(
+                'Collecting results from run {} ...'.format(run_id))
+            if debug and stdout:
+                self.logger.debug('Run {} STDOUT: {}'.format(
+                    run_id, escape_newline(str(stdout))))
+
+            try:
+                return self._serialize(run_id, state, result,
+                                       batch_size=batch_size)
+            except SerializationError as err:
+                msg = 'Failed to serialize results ({})'.format(err)
+                self.logger.warning(msg)
+                # TODO(damb): Standardize ramsis client return values
+                return ({'message': msg,
+                         'run_id': run_id,
+                         'result': []}, StatusCode.WorkerError.value)
+
+        self.logger.warning('Run {} execution failed ({}).'.format(
+            run_id, error))
+        if debug and stderr:
+            self.logger.debug('Run {} STDERR: {}'.format(
+                run_id, escape_newline(str(stderr))))
+        return ({'message': StatusCode.TaskProcessingError.name,
+                 'run_id': run_id,
+                 'state': state.value,
+                 'result': []}, StatusCode.TaskProcessingError.value)
+
+    # _finished ()
+
+    def _serialize(self, run_id, state, result, batch_size=None):
+        """
+        Serialize a run's result. The media type is negotiated by means of
+        the request's `Accept` header, the content coding by means of the
+        `Accept-Encoding` header. The optional `dtype` query parameter
+        allows casting the result (e.g. `float32`). If none of the media
+        types available is acceptable the response's status is 406.
+
+        Batch results are split along the first axis into one result per
+        parameter set. Raw array formats return the stacked array.
+
+        :rtype: :py:class:`flask.Response`
+        """
+        mimetype = negotiate_mimetype(request.headers.get('Accept'))
+        if mimetype is None:
+            return ({'message': HTTPStatus.NOT_ACCEPTABLE.phrase,
+                     'result': mimetypes()}, HTTPStatus.NOT_ACCEPTABLE.value)
+        dtype = request.args.get('dtype')
+        if dtype is not None and dtype not in DTYPES:
+            return ({'message': 'Invalid dtype: {!r}'.format(dtype),
+                     'result': list(DTYPES)}, HTTPStatus.BAD_REQUEST.value)
+
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+        rep = self._represent(run_id, state, result, mimetype, dtype=dtype,
+                              encoding=encoding, batch_size=batch_size)
+        status, body, headers = conditional(rep, request.headers)
+        headers.update({'X-Run-Id': run_id, 'X-Run-State': state.value})
+        return Response(body, status=status, mimetype=mimetype,
+                        headers=headers)
+
+    # _serialize ()
+
+    def _represent(self, run_id, state, result, mimetype, dtype=None,
+                   encoding=None, batch_size=None):
+        """
+        Create the representation of a run's result. Representations are
+        served from the response cache (if configured) i.e. results are
+        serialized and compressed once.
+
+        :rtype: :py:class:`ramsis.worker.utils.response.Representation`
+        :raises SerializationError: If the result cannot be serialized
+        """
+        cache = self._response_cache
+        if cache is not None:
+            rep = cache.get(run_id, mimetype, dtype=dtype, encoding=encoding)
+            if rep is not None:
+                return rep
+
+        try:
+            arr = to_ndarray(result, dtype=dtype)
+        except Exception as err:
+            raise SerializationError(err)
+
+        with STAGE_LATENCY.time(stage='serialize'):
+            payload = result_payload(run_id, state, arr,
+                                     batch_size=batch_size)
+            body = serialize(mimetype, payload, arr)
+            RESULT_SIZE.observe(len(body), mimetype=mimetype)
+            rep = represent(body, mimetype, encoding=encoding)
+
+        if cache is not None:
+            cache.put(run_id, mimetype, dtype, encoding, rep)
+        return rep
+
+    # _represent ()
+
+    def _retain(self, run_id, result, batch_size=None):
+        """
+        Retain the result of a delivered run by means of the response cache
+        (if configured).
+        """
+        if self._response_cache is None:
+            return
+        try:
+            arr = to_ndarray(result)
+        except Exception:
+            return
+        self._response_cache.put_result(run_id, arr, batch_size=batch_size)
+
+    # _retain ()
+
+    def _retained(self, run_id):
+        """
+        :returns: Tuple of the form `(result, batch_size)` of a delivered
+            run retained by the response cache or `None`
+        """
+        if self._response_cache is None:
+            return None
+        return self._response_cache.get_result(run_id)
+
+    # _retained ()
+
+    def _persist(self, run):
+        """
+        Record `run` in the persistent store (if configured). Once finished
+        the run is written to the store and dropped from the registry.
+        """
+        if self._store is None:
+            return
+
+        self._store.add(run)
+        run.add_done_callback(
+            functools.partial(_store_run, self._store, self.registry()))
+
+    # _persist ()
+
+    def _accepted(self, run, queue_position=None):
         return ({'message': StatusCode.TaskAccepted.name,
-                 'result': []}, StatusCode.TaskAccepted.value)
+                 'run_id': run.id,
+                 'state': run.state.value,
+                 'queue_position': queue_position,
+                 'result': []}, StatusCode.TaskAccepted.value,
+                {'Location': url_for(request.endpoint, run_id=run.id)})
 
-    # post ()
+    # _accepted ()
 
 # class AsyncWorkerResource
 
 
+class AsyncBatchWorkerResource(AsyncWorkerResource):
+    """
+    Abstract resource base class for the batch submission of runs. The input
+    message's `model_parameters` is a list of parameter sets which is
+    validated as a whole. Parameter sets are split into chunks of at most
+    `chunk_size` parameter sets; each chunk is executed as a single run by
+    means of a vectorized task call (see
+    :py:meth:`ramsis.worker.utils.task.Task.configure_batch`).
+
+    The results of a chunk run contain one entry per parameter set.
+
+    :param int chunk_size: Maximum number of parameter sets per run. If `0`
+        the whole batch is executed as a single run.
+    """
+    LOGGER = 'ramsis.worker_resource_async_batch'
+
+    def __init__(self, chunk_size=0, **kwargs):
+        kwargs.setdefault('logger', self.LOGGER)
+        super().__init__(**kwargs)
+        self._chunk_size = chunk_size
+
+    # __init__ ()
+
+    def get(self, run_id=None):
+        return 'Method not allowed.', StatusCode.HTTPMethodNotAllowed.value
+
+    def _submit(self, args, priority=0, timeout=None):
+        params = args['model_parameters']
+        chunk_size = self._chunk_size or len(params)
+
+        runs = []
+        pending = []
+        try:
+            for i in range(0, len(params), chunk_size):
+                run, _pending = self._create_run(
+                    dict(args, model_parameters=params[i:i + chunk_size]),
+                    batch=True, timeout=timeout)
+                runs.append(run)
+                if _pending:
+                    pending.append(run)
+
+            self.logger.info('Submitting batch {!r} ...'.format(pending))
+            positions = dict(zip(
+                [run.id for run in pending],
+                self.executor().submit_many(pending, priority=priority)))
+        except Exception:
+            for run in pending:
+                self._discard(run)
+            raise
+
+        # TODO(damb): Standardize ramsis client return values
+        return ({'message': StatusCode.TaskAccepted.name,
+                 'runs': [{'run_id': run.id,
+                           'state': run.state.value,
+                           'queue_position': positions.get(run.id),
+                           'batch_size': run.task.batch_size}
+                          for run in runs],
+                 'result': [{'run_id': run.id, 'index': j}
+                            for run in runs
+                            for j in range(run.task.batch_size)]},
+                StatusCode.TaskAccepted.value)
+
+    # _submit ()
+
+# class AsyncBatchWorkerResource
+
+
+def result_payload(run_id, state, arr, batch_size=None):
+    """
+    Create the response envelope of a finished run. Batch results are split
+    along the first axis into one result per parameter set.
+
+    :param arr: Result array
+    :type arr: :py:class:`numpy.ndarray`
+    :rtype: dict
+    :raises SerializationError: If the result does not match `batch_size`
+    """
+    if batch_size is None:
+        items = [{'rate_prediction': arr}]
+    elif arr.ndim and arr.shape[0] == batch_size:
+        items = [{'rate_prediction': item} for item in arr]
+    else:
+        raise SerializationError(
+            'Batch result of shape {} does not match batch size '
+            '{}'.format(arr.shape, batch_size))
+
+    # TODO(damb): Standardize ramsis client return values
+    return {'message': StatusCode.TaskCompleted.name,
+            'run_id': run_id,
+            'state': state.value,
+            'result': items}
+
+# result_payload ()
+
+
+def _start_deadline(run, timeout):
+    """
+    Cancel `run` unless finished within `timeout` seconds.
+    """
+    timer = threading.Timer(
+        timeout, run.cancel,
+        kwargs={'error': 'Deadline exceeded ({}s).'.format(timeout)})
+    timer.daemon = True
+    timer.start()
+    run.add_done_callback(lambda run: timer.cancel())
+
+# _start_deadline ()
+
+
+def _cache_result(cache, key, run):
+    """
+    Callback caching the result of a successfully completed run.
+    """
+    if run.state is RunState.DONE:
+        cache.put(key, run.task.result)
+
+# _cache_result ()
+
+
+def _store_run(store, registry, run):
+    """
+    Callback persisting a finished run. The run is removed from the registry
+    afterwards such that results are not kept in memory.
+    """
+    store.put(run)
+    registry.remove(run.id)
+
+# _store_run ()
+
+
+# -----------------------------------------------------------------------------
+class RunEventsResource(Resource):
+    """
+    Server-sent events (SSE) stream of a run's state transitions. The stream
+    is closed as soon as the run finished.
+
+    :param registry: Registry keeping track of the runs
+    :type registry: :py:class:`ramsis.worker.utils.registry.RunRegistry`
+    :param store: Optional persistent result store
+    :type store: :py:class:`ramsis.worker.utils.store.ResultStore`
+    """
+    LOGGER = 'ramsis.worker_resource_events'
+
+    # interval in seconds keep-alive comments are sent with
+    KEEPALIVE = 15
+
+    def __init__(self, registry=None, store=None, logger=None):
+        self._registry = registry
+        self._store = store
+        self.logger = (logging.getLogger(logger) if logger else
+                       logging.getLogger(self.LOGGER))
+
+    def get(self, run_id):
+        run = self._registry.get(run_id) if self._registry else None
+        if run is None:
+            record = (self._store.get(run_id) if self._store is not None
+                      else None)
+            if record is None:
+                return ({'message': HTTPStatus.NOT_FOUND.phrase,
+                         'result': []}, HTTPStatus.NOT_FOUND.value)
+            events = self._stored_events(record)
+        else:
+            events = self._events(run)
+
+        return Response(events, mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache',
+                                 'X-Accel-Buffering': 'no'})
+
+    # get ()
+
+    def _events(self, run):
+        state = run.state
+        yield _sse(run.id, state, run.error)
+        while state not in (RunState.DONE, RunState.FAILED):
+            _state = run.wait_for_transition(state, timeout=self.KEEPALIVE)
+            if _state is state:
+                yield ': keep-alive\n\n'
+                continue
+            state = _state
+            yield _sse(run.id, state, run.error)
+
+    # _events ()
+
+    def _stored_events(self, record):
+        """
+        Events of a run recorded in the store. If the run is executed by
+        another worker process sharing the store, the store is polled until
+        the run finished.
+        """
+        yield _sse(record.run_id, record.state, record.error)
+        while record is not None and record.finished is None:
+            state = record.state
+            record = self._store.wait(record.run_id, timeout=self.KEEPALIVE)
+            if record is None:
+                break
+            if record.state is state:
+                yield ': keep-alive\n\n'
+                continue
+            yield _sse(record.run_id, record.state, record.error)
+
+    # _stored_events ()
+
+# class RunEventsResource
+
+
+def _sse(run_id, state, error=None):
+    """
+    Format a state transition as server-sent event.
+    """
+    data = {'run_id': run_id, 'state': state.value}
+    if error:
+        data['error'] = error
+    return 'event: state\ndata: {}\n\n'.format(json.dumps(data))
+
+# _sse ()
+
+
+class RunLogResource(Resource):
+    """
+    Incremental access to a run's stdout/stderr. Returns the bytes starting
+    at the `offset` query parameter (default: 0) of the stream selected by
+    the `stream` query parameter (either `stdout` (default) or `stderr`).
+    The offset to continue reading from is returned by means of the
+    `X-Log-Offset` header.
+
+    For runs served from the persistent store only the retained tail of the
+    stream is available.
+
+    :param registry: Registry keeping track of the runs
+    :type registry: :py:class:`ramsis.worker.utils.registry.RunRegistry`
+    :param store: Optional persistent result store
+    :type store: :py:class:`ramsis.worker.utils.store.ResultStore`
+    """
+    LOGGER = 'ramsis.worker_resource_log'
+
+    # maximum number of bytes returned per request
+    MAX_BYTES = 1024**2
+
+    def __init__(self, registry=None, store=None, logger=None):
+        self._registry = registry
+        self._store = store
+        self.logger = (logging.getLogger(logger) if logger else
+                       logging.getLogger(self.LOGGER))
+
+    def get(self, run_id):
+        name = request.args.get('stream', 'stdout')
+        offset = request.args.get('offset', 0, type=int)
+        if name not in ('stdout', 'stderr'):
+            return ({'message': 'Invalid stream: {!r}'.format(name),
+                     'result': []}, HTTPStatus.BAD_REQUEST.value)
+
+        run = self._registry.get(run_id) if self._registry else None
+        if run is not None:
+            state = run.state
+            data, next_offset = run.task.read_stream(
+                name, offset=offset, max_bytes=self.MAX_BYTES)
+        else:
+            record = (self._store.get(run_id) if self._store is not None
+                      else None)
+            if record is None:
+                return ({'message': HTTPStatus.NOT_FOUND.phrase,
+                         'result': []}, HTTPStatus.NOT_FOUND.value)
+            state = record.state
+            data = (getattr(record, name) or '').encode('utf-8')
+            data = data[offset:offset + self.MAX_BYTES]
+            next_offset = offset + len(data)
+
+        return Response(data, mimetype='text/plain',
+                        headers={'X-Log-Offset': str(next_offset),
+                                 'X-Run-State': state.value})
+
+    # get ()
+
+# class RunLogResource
+
+
+# -----------------------------------------------------------------------------
+class MetricsResource(Resource):
+    """
+    Metrics in Prometheus text format. Besides the metrics recorded while
+    processing runs, the state of the optional collaborators (e.g. pool
+    utilization, cache hit ratio) is collected when scraped.
+
+    :param pool: Pool the worker's tasks are executed with
+    :type pool: :py:class:`ramsis.worker.utils.pool.Pool`
+    :param executor: Executor the runs are executed with
+    :type executor: :py:class:`ramsis.worker.utils.executor.RunExecutor`
+    :param cache: Optional result cache
+    :type cache: :py:class:`ramsis.worker.utils.cache.ResultCache`
+    :param response_cache: Optional cache of result representations
+    :type response_cache:
+        :py:class:`ramsis.worker.utils.response.ResponseCache`
+    """
+    LOGGER = 'ramsis.worker_resource_metrics'
+
+    def __init__(self, pool=None, executor=None, cache=None,
+                 response_cache=None, logger=None):
+        self._pool = pool
+        self._executor = executor
+        self._cache = cache
+        self._response_cache = response_cache
+        self.logger = (logging.getLogger(logger) if logger else
+                       logging.getLogger(self.LOGGER))
+
+    def get(self):
+        return Response(self.render(), content_type=CONTENT_TYPE)
+
+    def render(self):
+        """
+        :returns: Metrics in Prometheus text format
+        :rtype: str
+        """
+        gauges = []
+        if self._pool is not None:
+            pool = self._pool
+            gauges.extend([
+                Gauge('ramsis_worker_pool_size', 'Number of pooled engines.',
+                      fn=lambda: pool.size),
+                Gauge('ramsis_worker_pool_busy', 'Number of leased engines.',
+                      fn=lambda: pool.busy),
+                Gauge('ramsis_worker_pool_idle', 'Number of idle engines.',
+                      fn=lambda: pool.idle)])
+        if self._executor is not None:
+            executor = self._executor
+            gauges.extend([
+                Gauge('ramsis_worker_runs_queued', 'Number of queued runs.',
+                      fn=lambda: executor.num_queued),
+                Gauge('ramsis_worker_runs_running',
+                      'Number of runs executed.',
+                      fn=lambda: executor.num_running)])
+        if self._cache is not None:
+            cache = self._cache
+            gauges.extend([
+                Counter('ramsis_worker_cache_hits_total',
+                        'Number of cache hits.', fn=lambda: cache.hits),
+                Counter('ramsis_worker_cache_misses_total',
+                        'Number of cache misses.', fn=lambda: cache.misses),
+                Gauge('ramsis_worker_cache_hit_ratio', 'Cache hit ratio.',
+                      fn=lambda: cache.hit_ratio),
+                Gauge('ramsis_worker_cache_size_bytes',
+                      'Size of the in-memory cache tier.',
+                      fn=lambda: cache.num_bytes)])
+        if self._response_cache is not None:
+            response_cache = self._response_cache
+            gauges.extend([
+                Counter('ramsis_worker_response_cache_hits_total',
+                        'Number of result representations served from the '
+                        'response cache.', fn=lambda: response_cache.hits),
+                Counter('ramsis_worker_response_cache_misses_total',
+                        'Number of result representations created.',
+                        fn=lambda: response_cache.misses),
+                Gauge('ramsis_worker_response_cache_size_bytes',
+                      'Size of the response cache.',
+                      fn=lambda: response_cache.num_bytes)])
+
+        return REGISTRY.expose(extra=gauges)
+
+    # render ()
+
+# class MetricsResource
+
+
+class ProfilingResource(Resource):
+    """
+    Admin resource (re)configuring the profiler at runtime i.e. without
+    restarting the worker. `GET` returns the profiler's configuration; `PUT`
+    updates the `rate`, `mode` and/or `interval` (see
+    :py:class:`ramsis.worker.utils.profiling.Profiler`).
+
+    :param profiler: Profiler to be configured
+    :type profiler: :py:class:`ramsis.worker.utils.profiling.Profiler`
+    """
+    LOGGER = 'ramsis.worker_resource_profiling'
+
+    def __init__(self, profiler=None, logger=None):
+        self._profiler = profiler
+        self.logger = (logging.getLogger(logger) if logger else
+                       logging.getLogger(self.LOGGER))
+
+    def get(self):
+        return ({'message': HTTPStatus.OK.phrase,
+                 'result': self._profiler.config()}, HTTPStatus.OK.value)
+
+    def put(self):
+        return self._configure(parse_json(ProfilingConfigSchema, request))
+
+    def _configure(self, args):
+        try:
+            self._profiler.configure(**args)
+        except ProfilingError as err:
+            return ({'message': str(err), 'result': []},
+                    StatusCode.UnprocessableEntity.value)
+        return self.get()
+
+    # _configure ()
+
+# class ProfilingResource
+
+
+class HealthResource(Resource):
+    """
+    Liveness probe. Returns HTTP status code 200 unless the worker's pool
+    provides no resources since they failed to be created. The resource is
+    cheap i.e. no task is involved.
+
+    Besides the pool's utilization (including the number of resources lost
+    i.e. being recreated) the number of queued and running runs is
+    reported if the executor is defined (e.g. for load balancing).
+
+    :param pool: Pool the worker's tasks are executed with
+    :type pool: :py:class:`ramsis.worker.utils.pool.Pool`
+    :param executor: Executor the runs are executed with
+    :type executor: :py:class:`ramsis.worker.utils.executor.RunExecutor`
+    """
+    LOGGER = 'ramsis.worker_resource_health'
+
+    def __init__(self, pool=None, executor=None, logger=None):
+        self._pool = pool
+        self._executor = executor
+        self.logger = (logging.getLogger(logger) if logger else
+                       logging.getLogger(self.LOGGER))
+
+    def get(self):
+        if self._pool is None or self._pool.is_healthy:
+            return self._status(HTTPStatus.OK)
+
+        return self._status(HTTPStatus.SERVICE_UNAVAILABLE,
+                            error=str(self._pool.error))
+
+    def _status(self, status, **kwargs):
+        retval = {'message': status.phrase}
+        if self._pool is not None:
+            retval['pool'] = {'size': self._pool.size,
+                              'idle': self._pool.idle,
+                              'busy': self._pool.busy,
+                              'lost': self._pool.lost}
+        if self._executor is not None:
+            retval['runs'] = {'queued': self._executor.num_queued,
+                              'running': self._executor.num_running}
+        retval.update(kwargs)
+        return retval, status.value
+
+    # _status ()
+
+# class HealthResource
+
+
+class ReadinessResource(HealthResource):
+    """
+    Readiness probe. Returns HTTP status code 200 as soon as the worker's
+    pool provides at least one resource, else 503. Runs submitted before the
+    worker is ready are queued.
+    """
+    LOGGER = 'ramsis.worker_resource_ready'
+
+    def get(self):
+        if self._pool is None or self._pool.is_ready:
+            return self._status(HTTPStatus.OK)
+
+        return self._status(HTTPStatus.SERVICE_UNAVAILABLE)
+
+# class ReadinessResource
+
+
 # ---- END OF <resource.py> ----
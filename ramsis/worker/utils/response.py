@@ -0,0 +1,266 @@
+# This is <response.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Result response facilities.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Result response facilities. A run's result is delivered as a
+:py:class:`Representation` i.e. the serialized (and optionally compressed)
+result:
+
+    - Representations carry a strong ETag computed from their content.
+      Conditional (`If-None-Match`) and partial (`Range`, `If-Range`)
+      requests are evaluated by means of :py:func:`conditional`.
+    - Large representations are compressed depending on the request's
+      `Accept-Encoding` header (`gzip` or, if `zstandard` is installed,
+      `zstd`). `zstandard` is imported lazily, i.e. once used.
+    - Representations are cached by means of a :py:class:`ResponseCache`
+      such that results are serialized and compressed once.
+"""
+
+import collections
+import gzip
+import hashlib
+import logging
+import threading
+
+from http import HTTPStatus
+
+from werkzeug.http import (parse_accept_header, parse_etags,
+                           parse_range_header, quote_etag, unquote_etag)
+
+from ramsis.worker.utils import import_optional, is_available
+
+
+# representations smaller than MIN_COMPRESS_SIZE bytes are not compressed
+MIN_COMPRESS_SIZE = 1024
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# content codings in order of preference
+CODINGS = (('zstd', ) if is_available('zstandard') else ()) + ('gzip', )
+
+Representation = collections.namedtuple(
+    'Representation', ['body', 'mimetype', 'encoding', 'etag'])
+
+
+# -----------------------------------------------------------------------------
+class ResponseCache(object):
+    """
+    Thread-safe LRU cache of result representations bounded by the total
+    size of the entries. Representations are keyed on the run, the media
+    type, the dtype and the content coding negotiated.
+
+    Additionally, the results of delivered runs are retained (see
+    :py:meth:`put_result`) such that results may be fetched repeatedly
+    even without a persistent result store.
+
+    :param int max_bytes: Maximum size of the cache in bytes
+    """
+
+    LOGGER = 'ramsis.worker.response_cache'
+
+    def __init__(self, max_bytes=64 * 1024**2, logger=None):
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+
+        # key: (value, size)
+        self._entries = collections.OrderedDict()
+        # run_id: keys
+        self._keys = collections.defaultdict(set)
+        self._num_bytes = 0
+        self._lock = threading.Lock()
+
+        self.logger = (logging.getLogger(logger) if logger else
+                       logging.getLogger(self.LOGGER))
+
+    # __init__ ()
+
+    @property
+    def num_bytes(self):
+        return self._num_bytes
+
+    def stats(self):
+        """
+        :returns: Cache statistics
+        :rtype: dict
+        """
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'entries': len(self._entries),
+                    'bytes': self._num_bytes}
+
+    # stats ()
+
+    def get(self, run_id, mimetype, dtype=None, encoding=None):
+        """
+        :returns: The cached representation or `None`
+        :rtype: :py:class:`Representation`
+        """
+        value = self._get((run_id, mimetype, dtype, encoding))
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    # get ()
+
+    def put(self, run_id, mimetype, dtype, encoding, rep):
+        """
+        Cache the representation `rep`.
+        """
+        self._put((run_id, mimetype, dtype, encoding), rep, len(rep.body))
+
+    def get_result(self, run_id):
+        """
+        :returns: Tuple of the form `(result, batch_size)` or `None`
+        """
+        return self._get((run_id, ))
+
+    def put_result(self, run_id, result, batch_size=None):
+        """
+        Retain the result of the delivered run `run_id`.
+
+        :param result: Result array
+        :type result: :py:class:`numpy.ndarray`
+        """
+        self._put((run_id, ), (result, batch_size), result.nbytes)
+
+    def discard(self, run_id):
+        """
+        Discard all entries of the run `run_id`.
+        """
+        with self._lock:
+            for key in self._keys.pop(run_id, ()):
+                self._pop(key)
+
+    # discard ()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def _put(self, key, value, size):
+        with self._lock:
+            self._pop(key)
+            if size > self.max_bytes:
+                return
+
+            self._entries[key] = (value, size)
+            self._keys[key[0]].add(key)
+            self._num_bytes += size
+            # LRU eviction
+            while self._num_bytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    # _put ()
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._num_bytes -= entry[1]
+            keys = self._keys.get(key[0])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys[key[0]]
+
+    # _pop ()
+
+# class ResponseCache
+
+
+# -----------------------------------------------------------------------------
+def negotiate_encoding(accept_encoding):
+    """
+    Negotiate the content coding of a representation.
+
+    :param str accept_encoding: Value of the `Accept-Encoding` header
+    :returns: The content coding or `None` (i.e. `identity`)
+    """
+    return parse_accept_header(accept_encoding).best_match(CODINGS)
+
+# negotiate_encoding ()
+
+
+def represent(body, mimetype, encoding=None):
+    """
+    Create the representation of a serialized result. The body is
+    compressed if `encoding` is set and the body is at least
+    :py:data:`MIN_COMPRESS_SIZE` bytes large.
+
+    :param bytes body: Serialized result
+    :param str encoding: Content coding negotiated (see
+        :py:func:`negotiate_encoding`)
+    :rtype: :py:class:`Representation`
+    """
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    if encoding is None or len(body) < MIN_COMPRESS_SIZE:
+        return Representation(body, mimetype, None, etag)
+
+    if encoding == 'zstd':
+        zstandard = import_optional('zstandard')
+        body = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    else:
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    # NOTE(damb): Representations differing in their content coding must
+    # not share a strong ETag.
+    return Representation(body, mimetype, encoding,
+                          '{}-{}'.format(etag, encoding))
+
+# represent ()
+
+
+def conditional(rep, headers):
+    """
+    Evaluate the conditional (`If-None-Match`) and partial (`Range`,
+    `If-Range`) request headers against the representation `rep`. Only
+    single byte ranges are served partially; otherwise the full
+    representation is returned.
+
+    :param headers: Request headers (case-insensitive mapping)
+    :returns: Tuple of the form `(status, body, headers)`
+    """
+    retval = {'ETag': quote_etag(rep.etag),
+              'Accept-Ranges': 'bytes',
+              'Vary': 'Accept, Accept-Encoding'}
+    if rep.encoding is not None:
+        retval['Content-Encoding'] = rep.encoding
+
+    if_none_match = headers.get('If-None-Match')
+    if if_none_match and parse_etags(if_none_match).contains_weak(rep.etag):
+        return HTTPStatus.NOT_MODIFIED.value, b'', retval
+
+    rng = parse_range_header(headers.get('Range'))
+    if_range = headers.get('If-Range')
+    # the representation changed since the client requested it
+    changed = bool(if_range) and unquote_etag(if_range) != (rep.etag, False)
+    if rng is None or len(rng.ranges) != 1 or changed:
+        return HTTPStatus.OK.value, rep.body, retval
+
+    length = len(rep.body)
+    span = rng.range_for_length(length)
+    if span is None:
+        retval['Content-Range'] = 'bytes */{}'.format(length)
+        return (HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE.value, b'',
+                retval)
+
+    retval['Content-Range'] = rng.to_content_range_header(length)
+    return (HTTPStatus.PARTIAL_CONTENT.value, rep.body[span[0]:span[1]],
+            retval)
+
+# conditional ()
+
+# ---- END OF <response.py> ----
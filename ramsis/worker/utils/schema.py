@@ -0,0 +1,386 @@
+# This is <schema.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Schema facilities.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Fast input message validation facilities. Input messages are validated by
+means of :py:class:`CompiledSchema` objects:
+
+    - Schemas are instantiated once (per thread, since `marshmallow<3`
+      schema instances keep state while loading) rather than per request.
+    - Simple schemas (e.g. flat model parameter schemas made up of numbers
+      and strings) are compiled into plain Python validators. Messages the
+      compiled validator cannot decide on (e.g. invalid messages) are
+      validated by means of `marshmallow` such that results and error
+      messages are unchanged.
+    - JSON is decoded by means of `orjson
+      <https://github.com/ijl/orjson>`_ if installed. `orjson` and `numpy`
+      are imported lazily, i.e. once used.
+
+Large numeric arrays are declared by means of :py:class:`Array` fields.
+Streamed input messages (see :py:mod:`ramsis.worker.utils.payload`) decode
+array fields incrementally into :py:class:`numpy.ndarray` objects.
+"""
+
+import json
+import math
+import threading
+
+import marshmallow
+from marshmallow import fields
+
+from ramsis.worker.utils import import_optional
+
+
+_LOCK = threading.Lock()
+_SCHEMAS = {}
+
+
+# -----------------------------------------------------------------------------
+class _Fallback(Exception):
+    """The compiled validator cannot decide on a message."""
+
+
+class Array(fields.Field):
+    """
+    One-dimensional array of numbers. Values are deserialized into
+    :py:class:`numpy.ndarray` objects (`float64`) and serialized as lists.
+    """
+
+    default_error_messages = {
+        'invalid': 'Not a valid one-dimensional array of numbers.'}
+
+    def _serialize(self, value, attr, obj, **kwargs):
+        if value is None:
+            return None
+        import numpy as np
+
+        return np.asarray(value).tolist()
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        try:
+            return to_array(value)
+        except (TypeError, ValueError):
+            self.fail('invalid')
+
+# class Array
+
+
+class CompiledSchema(object):
+    """
+    Thread-safe wrapper of a :py:class:`marshmallow.Schema` class providing a
+    compiled fast path. Use :py:func:`compiled_schema` in order to obtain
+    shared instances.
+
+    :param schema_class: :py:class:`marshmallow.Schema` class
+    """
+
+    def __init__(self, schema_class):
+        self.schema_class = schema_class
+        self._local = threading.local()
+        schema = schema_class()
+        self._validator = compile_schema(schema)
+        self.arrays = array_paths(schema)
+
+    @property
+    def is_compiled(self):
+        """`True` if a compiled validator is available."""
+        return self._validator is not None
+
+    def schema(self):
+        """
+        :returns: Schema instance owned by the calling thread
+        :rtype: :py:class:`marshmallow.Schema`
+        """
+        schema = getattr(self._local, 'schema', None)
+        if schema is None:
+            schema = self._local.schema = self.schema_class()
+        return schema
+
+    def load(self, message):
+        """
+        Load and validate a message.
+
+        :returns: Tuple of the form `(data, errors)`
+        """
+        if self._validator is not None:
+            try:
+                return self._validator(message), {}
+            except _Fallback:
+                pass
+
+        try:
+            result = self.schema().load(message)
+        except marshmallow.ValidationError as err:
+            # marshmallow>=3 and strict schemas
+            return None, err.messages
+
+        if hasattr(result, 'errors'):
+            return result.data, result.errors
+        return result, {}
+
+    # load ()
+
+    def loads(self, data):
+        """
+        Decode and validate a JSON message. An empty body is loaded as an
+        empty message.
+
+        :param data: JSON document
+        :type data: bytes or str
+        :returns: Tuple of the form `(data, errors)`
+        """
+        if not data:
+            return self.load({})
+        try:
+            message = loads(data)
+        except ValueError as err:
+            return None, {'json': [str(err)]}
+        return self.load(message)
+
+    # loads ()
+
+# class CompiledSchema
+
+
+def compiled_schema(schema_class):
+    """
+    :returns: The (shared) compiled schema of `schema_class`
+    :rtype: :py:class:`CompiledSchema`
+    """
+    try:
+        return _SCHEMAS[schema_class]
+    except KeyError:
+        with _LOCK:
+            if schema_class not in _SCHEMAS:
+                _SCHEMAS[schema_class] = CompiledSchema(schema_class)
+            return _SCHEMAS[schema_class]
+
+# compiled_schema ()
+
+
+def loads(data):
+    """
+    Decode a JSON document. Uses `orjson` if available.
+
+    :raises ValueError: If `data` is not a valid JSON document
+    """
+    orjson = import_optional('orjson')
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# loads ()
+
+
+def to_array(values):
+    """
+    Convert `values` into a one-dimensional `float64` array.
+
+    :raises ValueError: If `values` is not a one-dimensional sequence of
+        numbers
+    """
+    import numpy as np
+
+    arr = np.asarray(values)
+    if arr.ndim != 1 or arr.dtype.kind not in 'biuf':
+        raise ValueError('Not a one-dimensional array of numbers.')
+    return arr.astype(np.float64, copy=False)
+
+# to_array ()
+
+
+def array_paths(schema, prefix=()):
+    """
+    :returns: Paths (tuples of field names) of the :py:class:`Array` fields
+        of `schema` including nested schemas. `None` denotes the items of
+        nested lists.
+    :rtype: list
+    """
+    paths = []
+    for name, field in getattr(schema, 'load_fields', schema.fields).items():
+        if isinstance(field, Array):
+            paths.append(prefix + (name, ))
+        elif isinstance(field, fields.Nested):
+            paths.extend(array_paths(
+                field.schema,
+                prefix + (name, ) + ((None, ) if field.many else ())))
+    return paths
+
+# array_paths ()
+
+
+# -----------------------------------------------------------------------------
+def compile_schema(schema):
+    """
+    Compile `schema` into a plain Python validator. The validator takes a
+    decoded message and returns the loaded data; it raises
+    :py:class:`_Fallback` if the message is to be validated by means of
+    `marshmallow` (e.g. if the message is invalid).
+
+    Supported are schemas without processors (e.g. `post_load` hooks)
+    consisting of :py:class:`marshmallow.fields.Boolean`,
+    :py:class:`marshmallow.fields.Integer`,
+    :py:class:`marshmallow.fields.Float`,
+    :py:class:`marshmallow.fields.String`,
+    :py:class:`marshmallow.fields.Dict` (without value validation),
+    :py:class:`marshmallow.fields.Raw`,
+    :py:class:`marshmallow.fields.Nested` and :py:class:`Array` fields.
+
+    :param schema: Schema instance
+    :type schema: :py:class:`marshmallow.Schema`
+    :returns: The validator or `None` if the schema is not supported
+    """
+    try:
+        return _compile_schema(schema)
+    except NotImplementedError:
+        return None
+
+# compile_schema ()
+
+
+def _compile_schema(schema):
+    hooks = getattr(schema, '_hooks', None)
+    if not hooks:
+        hooks = getattr(schema, '__processors__', None) or {}
+    restricted = any(getattr(schema, attr, None)
+                     for attr in ('only', 'exclude'))
+    if any(hooks.values()) or restricted:
+        raise NotImplementedError
+
+    dict_class = getattr(schema, 'dict_class', dict)
+    compiled = [(name, field, _compile_field(field))
+                for name, field in getattr(schema, 'load_fields',
+                                           schema.fields).items()]
+    names = frozenset(name for name, _, _ in compiled)
+
+    def validate(message):
+        if type(message) is not dict or not names.issuperset(message):
+            raise _Fallback
+        retval = dict_class()
+        for name, field, fn in compiled:
+            try:
+                value = message[name]
+            except KeyError:
+                if field.required:
+                    raise _Fallback
+                continue
+            retval[name] = fn(value)
+        return retval
+
+    return validate
+
+# _compile_schema ()
+
+
+def _compile_field(field):
+    # marshmallow>=3 renamed missing to load_default
+    default = (field.load_default if hasattr(field, 'load_default') else
+               field.missing)
+    renamed = any(getattr(field, attr, None)
+                  for attr in ('load_from', 'data_key', 'attribute'))
+    if renamed or field.dump_only or default is not marshmallow.missing:
+        raise NotImplementedError
+
+    convert = _compile_type(field)
+    validators = tuple(field.validators)
+    if not validators:
+        return convert
+
+    def validate(value):
+        value = convert(value)
+        for validator in validators:
+            try:
+                if validator(value) is False:
+                    raise _Fallback
+            except marshmallow.ValidationError:
+                raise _Fallback
+        return value
+
+    return validate
+
+# _compile_field ()
+
+
+def _compile_type(field):
+    if isinstance(field, fields.Boolean):
+        def convert(value):
+            if type(value) is not bool:
+                raise _Fallback
+            return value
+    elif isinstance(field, fields.Integer):
+        def convert(value):
+            if type(value) is not int:
+                raise _Fallback
+            return value
+    elif type(field) is fields.Float:
+        def convert(value):
+            if type(value) not in (int, float):
+                raise _Fallback
+            try:
+                value = float(value)
+            except OverflowError:
+                # integers exceeding the range of floats
+                raise _Fallback
+            if not math.isfinite(value):
+                raise _Fallback
+            return value
+    elif type(field) is fields.String:
+        def convert(value):
+            if type(value) is not str:
+                raise _Fallback
+            return value
+    elif type(field) is fields.Dict:
+        if any(getattr(field, attr, None)
+               for attr in ('value_container', 'value_field')):
+            raise NotImplementedError
+        key_field = getattr(field, 'key_container', None)
+        if key_field is None:
+            key_field = getattr(field, 'key_field', None)
+        if key_field is not None and type(key_field) is not fields.String:
+            raise NotImplementedError
+
+        def convert(value):
+            if type(value) is not dict:
+                raise _Fallback
+            return dict(value)
+    elif isinstance(field, Array):
+        import numpy as np
+
+        def convert(value):
+            # arrays decoded from streamed messages
+            if type(value) is not np.ndarray:
+                raise _Fallback
+            if value.ndim != 1 or value.dtype != np.float64:
+                raise _Fallback
+            return value
+    elif type(field) is fields.Raw:
+        def convert(value):
+            return value
+    elif type(field) is fields.Nested:
+        if field.only or field.exclude:
+            raise NotImplementedError
+        nested = _compile_schema(field.schema)
+        if field.many:
+            def convert(value):
+                if type(value) is not list:
+                    raise _Fallback
+                return [nested(v) for v in value]
+        else:
+            convert = nested
+    else:
+        raise NotImplementedError
+
+    def convert_or_none(value):
+        if value is None:
+            raise _Fallback
+        return convert(value)
+
+    return convert_or_none
+
+# _compile_type ()
+
+# ---- END OF <schema.py> ----
@@ -0,0 +1,199 @@
+# This is <serializer.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Result serialization facilities.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Result serialization facilities. Results are converted to
+:py:class:`numpy.ndarray` and serialized depending on the media type
+negotiated with the client. Available media types:
+
+    - `application/json` (uses `orjson <https://github.com/ijl/orjson>`_ if
+      installed)
+    - `application/x-msgpack` (requires `msgpack`)
+    - `application/x-npy` (raw ``.npy`` format)
+    - `application/vnd.apache.arrow.stream` (requires `pyarrow`)
+
+Optional serialization libraries as well as `numpy` are imported lazily,
+i.e. once used.
+"""
+
+import io
+import json
+
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+from ramsis.utils.error import Error
+from ramsis.worker.utils import import_optional, is_available
+
+
+MIMETYPE_JSON = 'application/json'
+MIMETYPE_MSGPACK = 'application/x-msgpack'
+MIMETYPE_NPY = 'application/x-npy'
+MIMETYPE_ARROW = 'application/vnd.apache.arrow.stream'
+
+# dtypes results may be cast to
+DTYPES = ('float32', 'float64')
+
+
+# -----------------------------------------------------------------------------
+class SerializationError(Error):
+    """Serialization error ({})."""
+
+
+def to_ndarray(obj, dtype=None):
+    """
+    Convert `obj` to a :py:class:`numpy.ndarray` without iterating over
+    elements in Python.
+
+    MATLAB arrays (e.g. :py:class:`matlab.double`) either implement the
+    buffer protocol (MATLAB >= R2022a) or keep their data as a flat,
+    column-major :py:class:`array.array` accessible by means of the private
+    `_data` attribute.
+
+    :param obj: Object to be converted
+    :param dtype: Optional dtype the array is cast to
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    import numpy as np
+
+    if isinstance(obj, np.ndarray):
+        # NOTE(damb): drops subclasses e.g. numpy.memmap
+        arr = np.asarray(obj)
+    elif hasattr(obj, '_data') and hasattr(obj, 'size'):
+        try:
+            arr = np.asarray(memoryview(obj))
+        except TypeError:
+            arr = np.ascontiguousarray(
+                np.frombuffer(obj._data, dtype=obj._data.typecode).reshape(
+                    tuple(obj.size), order='F'))
+    else:
+        arr = np.asarray(obj)
+
+    if dtype is not None and arr.dtype != dtype:
+        arr = arr.astype(dtype)
+    return arr
+
+# to_ndarray ()
+
+
+def _json_default(obj):
+    import numpy as np
+
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(repr(obj))
+
+
+def _serialize_json(payload, arr):
+    orjson = import_optional('orjson')
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload, default=_json_default,
+                                option=orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:
+            pass
+    return json.dumps(payload, default=_json_default).encode('utf-8')
+
+
+def _msgpack_default(obj):
+    import numpy as np
+
+    if isinstance(obj, np.ndarray):
+        arr = np.ascontiguousarray(obj)
+        return {'dtype': arr.dtype.str, 'shape': list(arr.shape),
+                'data': arr.tobytes()}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(repr(obj))
+
+
+def _serialize_msgpack(payload, arr):
+    msgpack = import_optional('msgpack')
+    return msgpack.packb(payload, default=_msgpack_default,
+                         use_bin_type=True)
+
+
+def _serialize_npy(payload, arr):
+    import numpy as np
+
+    buf = io.BytesIO()
+    np.save(buf, arr, allow_pickle=False)
+    return buf.getvalue()
+
+
+def _serialize_arrow(payload, arr):
+    import numpy as np
+
+    pyarrow = import_optional('pyarrow')
+    import_optional('pyarrow.ipc')
+    arr = np.ascontiguousarray(arr)
+    table = pyarrow.Table.from_arrays(
+        [pyarrow.array(arr.reshape(-1))], names=['rate_prediction'],
+        metadata={'shape': json.dumps(list(arr.shape))})
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+# media type, serializer, optional module required
+_SERIALIZERS = [(MIMETYPE_JSON, _serialize_json, None),
+                (MIMETYPE_MSGPACK, _serialize_msgpack, 'msgpack'),
+                (MIMETYPE_NPY, _serialize_npy, None),
+                (MIMETYPE_ARROW, _serialize_arrow, 'pyarrow')]
+
+
+def mimetypes():
+    """
+    :returns: Media types available; the default media type comes first.
+    :rtype: list
+    """
+    return [mimetype for mimetype, _, module in _SERIALIZERS
+            if module is None or is_available(module)]
+
+
+def negotiate_mimetype(accept):
+    """
+    Negotiate the media type of a result.
+
+    :param str accept: Value of the `Accept` header
+    :returns: The media type or `None` if none of the media types available
+        is acceptable. Without `accept` the default media type is returned.
+    """
+    if not accept:
+        return MIMETYPE_JSON
+    return parse_accept_header(accept, MIMEAccept).best_match(mimetypes())
+
+# negotiate_mimetype ()
+
+
+def serialize(mimetype, payload, arr):
+    """
+    Serialize a result.
+
+    :param str mimetype: Media type
+    :param dict payload: Response envelope containing `arr`. Used by
+        container formats i.e. JSON and msgpack.
+    :param arr: Result array. Used by the raw array formats i.e. `.npy`
+        and Arrow.
+    :type arr: :py:class:`numpy.ndarray`
+    :rtype: bytes
+    """
+    for _mimetype, fn, module in _SERIALIZERS:
+        if _mimetype == mimetype and (module is None or is_available(module)):
+            try:
+                return fn(payload, arr)
+            except Exception as err:
+                raise SerializationError(err)
+
+    raise SerializationError('Unsupported media type: {!r}'.format(mimetype))
+
+# serialize ()
+
+# ---- END OF <serializer.py> ----
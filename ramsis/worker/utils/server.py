@@ -0,0 +1,144 @@
+# This is <server.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Production server facilities.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Production server facilities. WSGI worker webservices are served by means
+of a prefork multi-process server (`gunicorn <https://gunicorn.org>`_). Each
+worker process creates its own application instance (including pooled
+resources) after being forked. ASGI worker webservices are served by means
+of `uvicorn <https://www.uvicorn.org>`_.
+
+.. note::
+
+    Requires the `production` and the `asgi` extra, respectively.
+"""
+
+import logging
+
+from ramsis.utils.error import Error
+
+
+# -----------------------------------------------------------------------------
+class ServerError(Error):
+    """Base server error ({})."""
+
+
+# -----------------------------------------------------------------------------
+def serve(app_factory, bind, workers=1, threads=1, keepalive=5, timeout=30,
+          graceful_timeout=30, on_exit=None, logger=None):
+    """
+    Serve a WSGI application by means of a prefork multi-process server.
+
+    Requests are handled by threaded worker processes such that long-polling
+    and event streams do not block a whole process. On `SIGTERM` the server
+    stops accepting connections and waits up to `graceful_timeout` seconds
+    for pending requests to complete.
+
+    :param app_factory: Callable returning the WSGI application; called once
+        per worker process after being forked
+    :param str bind: Address the server binds to (e.g. `0.0.0.0:5000`)
+    :param int workers: Number of worker processes
+    :param int threads: Number of request handling threads per worker
+        process
+    :param int keepalive: Number of seconds to wait for requests on a
+        keep-alive connection
+    :param int timeout: Number of seconds after which a silent worker
+        process is killed and restarted
+    :param int graceful_timeout: Number of seconds worker processes are
+        granted to finish pending requests when shutting down
+    :param on_exit: Optional callable invoked without arguments within a
+        worker process when it exits e.g. to release pooled resources
+    :raises ServerError: If `gunicorn` is not available
+    """
+    # NOTE(damb): Server implementations are imported lazily in order to
+    # keep the worker's startup cheap.
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise ServerError(
+            "Production server requires 'gunicorn' "
+            "(install the 'production' extra).")
+
+    logger = logging.getLogger(logger) if logger else logging.getLogger(
+        'ramsis.worker.server')
+
+    def worker_exit(server, worker):
+        if on_exit is not None:
+            on_exit()
+
+    options = {
+        'bind': bind,
+        'workers': workers,
+        'worker_class': 'gthread',
+        'threads': threads,
+        'keepalive': keepalive,
+        'timeout': timeout,
+        'graceful_timeout': graceful_timeout,
+        # NOTE(damb): Applications must not be preloaded i.e. created within
+        # the master process. Pooled resources (e.g. MATLAB engines) cannot
+        # be shared across forked processes.
+        'preload_app': False,
+        'worker_exit': worker_exit, }
+
+    class _Application(BaseApplication):
+        """
+        Embedded `gunicorn` application.
+        """
+
+        def load_config(self):
+            for k, v in options.items():
+                self.cfg.set(k, v)
+
+        def load(self):
+            return app_factory()
+
+    # class _Application
+
+    logger.info(
+        'Serving with prefork WSGI server (bind={}, workers={}, '
+        'threads={}).'.format(bind, workers, threads))
+    _Application().run()
+
+# serve ()
+
+
+def serve_asgi(app, host, port, keepalive=5, graceful_timeout=30,
+               on_exit=None, logger=None):
+    """
+    Serve an ASGI application within a single process by means of an
+    asyncio event loop.
+
+    :param app: ASGI application
+    :param str host: Host the server binds to
+    :param int port: Port the server binds to
+    :param int keepalive: Number of seconds to wait for requests on a
+        keep-alive connection
+    :param int graceful_timeout: Number of seconds granted to finish pending
+        requests when shutting down
+    :param on_exit: Optional callable invoked without arguments when the
+        server exits
+    :raises ServerError: If `uvicorn` is not available
+    """
+    try:
+        import uvicorn
+    except ImportError:
+        raise ServerError(
+            "ASGI server requires 'uvicorn' (install the 'asgi' extra).")
+
+    logger = logging.getLogger(logger) if logger else logging.getLogger(
+        'ramsis.worker.server')
+    logger.info('Serving with ASGI server (bind={}:{}).'.format(host, port))
+    try:
+        uvicorn.run(app, host=host, port=port, timeout_keep_alive=keepalive,
+                    timeout_graceful_shutdown=graceful_timeout)
+    finally:
+        if on_exit is not None:
+            on_exit()
+
+# serve_asgi ()
+
+# ---- END OF <server.py> ----
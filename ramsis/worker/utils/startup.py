@@ -0,0 +1,105 @@
+# This is <startup.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Startup profiling facilities.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Startup profiling facilities. Import times are measured within a fresh
+interpreter by means of ``python -X importtime``; initialization phases are
+timed in-process.
+"""
+
+import collections
+import contextlib
+import subprocess
+import sys
+import time
+
+from ramsis.utils.error import Error
+
+
+# -----------------------------------------------------------------------------
+class StartupProfileError(Error):
+    """Startup profiling error ({})."""
+
+
+class StartupProfile(object):
+    """
+    Record the duration of named initialization phases.
+    """
+
+    def __init__(self):
+        self.phases = collections.OrderedDict()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Context manager recording the duration of the block in seconds.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - start
+
+    # phase ()
+
+# class StartupProfile
+
+
+def import_times(module, top=10):
+    """
+    Measure the import time of `module` within a fresh interpreter.
+
+    :param str module: Name of the module to be imported
+    :param int top: Number of direct imports of `module` reported
+    :returns: Mapping with the total import time of `module` in seconds and
+        its `top` slowest direct imports
+    :rtype: dict
+    :raises StartupProfileError: If the import fails
+    """
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True)
+    if proc.returncode:
+        raise StartupProfileError(proc.stderr.strip().splitlines()[-1:])
+
+    # NOTE(damb): Imports are reported after their nested imports i.e. a
+    # top-level import is preceded by its direct imports.
+    total = None
+    imports, children = [], []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        try:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            cumulative = int(cumulative) * 1e-6
+        except ValueError:
+            # header
+            continue
+
+        # indentation reflects the nesting level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        if depth == 1:
+            children.append((cumulative, name))
+        elif depth == 0:
+            if name == module:
+                total = cumulative
+                imports.extend(children)
+            children = []
+
+    # NOTE(damb): Modules imported before (e.g. during the interpreter's
+    # startup) are not accounted for.
+    return {'module': module,
+            'total': total,
+            'imports': [{'module': name, 'cumulative': cumulative}
+                        for cumulative, name in sorted(imports,
+                                                       reverse=True)[:top]]}
+
+# import_times ()
+
+# ---- END OF <startup.py> ----
@@ -0,0 +1,454 @@
+# This is <store.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Persistent result store facilities.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Persistent, restart-safe result store facilities. Run metadata is kept in a
+SQLite database while array results are written to ``.npy`` files which are
+memory-mapped when read. Hence, large results are kept out of the Python
+heap.
+"""
+
+import collections
+import logging
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+
+from ramsis.utils.error import Error
+from ramsis.worker.utils.registry import RunState
+
+
+# -----------------------------------------------------------------------------
+class StoreError(Error):
+    """Base store error ({})."""
+
+
+StoredRun = collections.namedtuple(
+    'StoredRun', ['run_id', 'state', 'created', 'finished', 'error', 'stdout',
+                  'stderr', 'result', 'batch_size'])
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    created REAL NOT NULL,
+    finished REAL,
+    error TEXT,
+    stdout TEXT,
+    stderr TEXT,
+    array_file TEXT,
+    blob BLOB,
+    batch_size INTEGER,
+    owner INTEGER,
+    heartbeat REAL,
+    cancel_requested REAL);
+CREATE INDEX IF NOT EXISTS runs_finished ON runs (finished);
+"""
+
+
+# -----------------------------------------------------------------------------
+class ResultStore(object):
+    """
+    Result store backed by local disk. Results are written once and evicted
+    by means of a retention policy.
+
+    When opened, runs recorded as unfinished (i.e. runs which were in flight
+    while the worker was stopped) are marked as failed.
+
+    The store may be shared by multiple worker processes. In that case,
+    recovery must be performed once (e.g. by the master process) before the
+    worker processes open the store with `recover=False`. Unfinished runs
+    are recorded together with the process executing them (the *owner*)
+    which periodically updates the runs' heartbeat. Runs of an owner which
+    exited (e.g. a worker process killed due to a timeout) or stopped
+    updating the heartbeat are marked as failed when read. Likewise, runs
+    are cancelled by any process by means of :py:meth:`request_cancel`; the
+    owner checks for cancellation requests periodically.
+
+    :param str path: Directory the store is located at
+    :param retention: Retention period in seconds of finished runs. `None`
+        disables eviction.
+    :param bool recover: Mark unfinished runs as failed when opened
+    """
+
+    LOGGER = 'ramsis.worker.store'
+
+    DB = 'results.sqlite'
+    EVICTION_INTERVAL = 60
+    # interval in seconds the store is polled with when waiting for runs
+    POLL_INTERVAL = 0.25
+    # interval in seconds the heartbeat of unfinished runs is updated with
+    HEARTBEAT_INTERVAL = 5
+    # age in seconds of a heartbeat after which a run is orphaned
+    HEARTBEAT_TIMEOUT = 30
+    # interval in seconds the owner checks for cancellation requests
+    CANCEL_INTERVAL = 0.5
+
+    def __init__(self, path, retention=None, recover=True, logger=None):
+        self.path = path
+        self.retention = retention
+
+        self.logger = (logging.getLogger(logger) if logger else
+                       logging.getLogger(self.LOGGER))
+
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._last_eviction = 0
+        self._closed = threading.Event()
+        # pid of the process the watcher thread was started by
+        self._watcher_pid = None
+        # unfinished runs owned by the process; run_id: run
+        self._owned = {}
+        self._conn = sqlite3.connect(os.path.join(self.path, self.DB),
+                                     check_same_thread=False,
+                                     isolation_level=None)
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(_SCHEMA)
+        if recover:
+            self.recover()
+
+    # __init__ ()
+
+    def recover(self):
+        """
+        Mark runs recorded as unfinished as failed.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE runs SET state=?, finished=?, error=? '
+                'WHERE finished IS NULL',
+                (RunState.FAILED.value, time.time(),
+                 'Worker restarted while the run was in flight.'))
+        if cursor.rowcount:
+            self.logger.warning(
+                'Marked {} interrupted run(s) as failed.'.format(
+                    cursor.rowcount))
+
+    # recover ()
+
+    def add(self, run):
+        """
+        Record a newly accepted run.
+
+        :type run: :py:class:`ramsis.worker.utils.registry.Run`
+        """
+        self._start_watcher()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO runs (run_id, state, created, '
+                'owner, heartbeat) VALUES (?, ?, ?, ?, ?)',
+                (run.id, run.state.value, run.created.timestamp(),
+                 os.getpid(), time.time()))
+            self._owned[run.id] = run
+        run.add_done_callback(self._disown)
+
+    # add ()
+
+    def request_cancel(self, run_id):
+        """
+        Request the cancellation of an unfinished run executed by another
+        process sharing the store. The run is cancelled by its owner.
+
+        :returns: `True` if the cancellation was requested, `False` if the
+            run is unknown or already finished
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE runs SET cancel_requested=? '
+                'WHERE run_id=? AND finished IS NULL',
+                (time.time(), run_id))
+        return cursor.rowcount > 0
+
+    # request_cancel ()
+
+    def put(self, run):
+        """
+        Persist a finished run including its results.
+
+        :type run: :py:class:`ramsis.worker.utils.registry.Run`
+        """
+        array_file = blob = None
+        if run.state is RunState.DONE:
+            array_file, blob = self._dump(run.id, run.task.result)
+
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO runs (run_id, state, created, '
+                'finished, error, stdout, stderr, array_file, blob, '
+                'batch_size) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (run.id, run.state.value, run.created.timestamp(),
+                 time.time(), run.error, _to_str(run.task.stdout),
+                 _to_str(run.task.stderr), array_file, blob,
+                 run.task.batch_size))
+
+        self.evict()
+
+    # put ()
+
+    def get(self, run_id):
+        """
+        Look up a run.
+
+        :returns: The stored run or `None` if unknown or evicted. Array
+            results are returned as read-only memory-mapped
+            :py:class:`numpy.ndarray`.
+        :rtype: :py:class:`StoredRun`
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT run_id, state, created, finished, error, stdout, '
+                'stderr, array_file, blob, batch_size, owner, heartbeat '
+                'FROM runs WHERE run_id=?',
+                (run_id, )).fetchone()
+
+        if row is None:
+            return None
+        if row[3] is None and self._is_orphaned(row[10], row[11]):
+            return self._fail_orphaned(run_id, row[10])
+
+        result = None
+        if row[7]:
+            import numpy as np
+
+            try:
+                result = np.load(os.path.join(self.path, row[7]),
+                                 mmap_mode='r')
+            except OSError as err:
+                # NOTE(damb): The array file was removed concurrently i.e.
+                # the run was evicted by another process sharing the store.
+                self.logger.debug(
+                    'Failed to load {} ({}).'.format(row[7], err))
+                return None
+        elif row[8] is not None:
+            result = pickle.loads(row[8])
+
+        return StoredRun(row[0], RunState(row[1]), row[2], row[3], row[4],
+                         row[5], row[6], result, row[9])
+
+    # get ()
+
+    def wait(self, run_id, timeout=None):
+        """
+        Block until the run identified by `run_id` is recorded as finished
+        or `timeout` (in seconds) expired. Used for runs executed by another
+        process sharing the store.
+
+        :returns: The stored run or `None`
+        :rtype: :py:class:`StoredRun`
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            record = self.get(run_id)
+            if record is None or record.finished is not None:
+                return record
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return record
+                time.sleep(min(self.POLL_INTERVAL, remaining))
+            else:
+                time.sleep(self.POLL_INTERVAL)
+
+    # wait ()
+
+    def __contains__(self, run_id):
+        with self._lock:
+            return self._conn.execute(
+                'SELECT 1 FROM runs WHERE run_id=?',
+                (run_id, )).fetchone() is not None
+
+    def remove(self, run_id):
+        """
+        Remove a run from the store.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT array_file FROM runs WHERE run_id=?',
+                (run_id, )).fetchone()
+            self._conn.execute('DELETE FROM runs WHERE run_id=?', (run_id, ))
+
+        if row and row[0]:
+            self._unlink(row[0])
+
+    # remove ()
+
+    def evict(self, force=False):
+        """
+        Evict runs finished longer than the retention period ago. Unless
+        `force` is set, eviction is performed at most every
+        `EVICTION_INTERVAL` seconds.
+        """
+        now = time.time()
+        if self.retention is None:
+            return
+        if not force and now - self._last_eviction < self.EVICTION_INTERVAL:
+            return
+
+        self._last_eviction = now
+        with self._lock:
+            threshold = now - self.retention
+            rows = self._conn.execute(
+                'SELECT array_file FROM runs WHERE finished < ?',
+                (threshold, )).fetchall()
+            self._conn.execute('DELETE FROM runs WHERE finished < ?',
+                               (threshold, ))
+
+        for row in rows:
+            if row[0]:
+                self._unlink(row[0])
+        if rows:
+            self.logger.debug('Evicted {} run(s).'.format(len(rows)))
+
+    # evict ()
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            self._conn.close()
+
+    def _disown(self, run):
+        with self._lock:
+            self._owned.pop(run.id, None)
+
+    def _start_watcher(self):
+        # NOTE(damb): Threads do not survive forking; the watcher is
+        # started by the process recording runs.
+        pid = os.getpid()
+        if self._watcher_pid == pid:
+            return
+        self._watcher_pid = pid
+        threading.Thread(target=self._watch, args=(pid, ),
+                         name='ramsis-store-watcher', daemon=True).start()
+
+    # _start_watcher ()
+
+    def _watch(self, pid):
+        """
+        Update the heartbeat of the runs owned by the process `pid` and
+        cancel runs whose cancellation was requested.
+        """
+        last_heartbeat = time.monotonic()
+        while not self._closed.wait(self.CANCEL_INTERVAL):
+            try:
+                with self._lock:
+                    if time.monotonic() - last_heartbeat >= (
+                            self.HEARTBEAT_INTERVAL):
+                        last_heartbeat = time.monotonic()
+                        self._conn.execute(
+                            'UPDATE runs SET heartbeat=? '
+                            'WHERE owner=? AND finished IS NULL',
+                            (time.time(), pid))
+                    if not self._owned:
+                        continue
+                    rows = self._conn.execute(
+                        'SELECT run_id FROM runs WHERE owner=? AND '
+                        'finished IS NULL AND cancel_requested IS NOT NULL',
+                        (pid, )).fetchall()
+                    runs = [self._owned[row[0]] for row in rows
+                            if row[0] in self._owned]
+            except sqlite3.Error as err:
+                self.logger.warning(
+                    'Failed to watch runs ({}).'.format(err))
+                continue
+
+            for run in runs:
+                if run.cancel('Run cancelled by client.'):
+                    self.logger.info(
+                        'Cancelled run {!r} on request.'.format(run))
+
+    # _watch ()
+
+    def _is_orphaned(self, owner, heartbeat):
+        """
+        :returns: `True` if the run's owner exited or stopped updating the
+            run's heartbeat, else `False`
+        """
+        if owner is None or owner == os.getpid():
+            return False
+        age = time.time() - heartbeat if heartbeat is not None else 0
+        if age > self.HEARTBEAT_TIMEOUT:
+            return True
+        try:
+            # NOTE(damb): The store is located on local disk i.e. worker
+            # processes sharing the store run on the same host.
+            os.kill(owner, 0)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            pass
+        return False
+
+    # _is_orphaned ()
+
+    def _fail_orphaned(self, run_id, owner):
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE runs SET state=?, finished=?, error=? '
+                'WHERE run_id=? AND finished IS NULL',
+                (RunState.FAILED.value, time.time(),
+                 'Worker process {} exited while the run was in '
+                 'flight.'.format(owner), run_id))
+        if cursor.rowcount:
+            self.logger.warning(
+                'Marked run {} of worker process {} as failed.'.format(
+                    run_id, owner))
+        return self.get(run_id)
+
+    # _fail_orphaned ()
+
+    def _dump(self, run_id, result):
+        """
+        Write `result` either as ``.npy`` file or as pickled blob.
+
+        :returns: Tuple of the form `(array_file, blob)`
+        """
+        if result is None:
+            return None, None
+
+        import numpy as np
+
+        try:
+            arr = np.asarray(result)
+        except Exception:
+            arr = None
+
+        if arr is None or arr.dtype.hasobject:
+            return None, pickle.dumps(result,
+                                      protocol=pickle.HIGHEST_PROTOCOL)
+
+        fname = run_id + '.npy'
+        fd, tmp = tempfile.mkstemp(dir=self.path)
+        try:
+            with os.fdopen(fd, 'wb') as ofd:
+                np.save(ofd, arr, allow_pickle=False)
+            os.replace(tmp, os.path.join(self.path, fname))
+        except Exception as err:
+            os.unlink(tmp)
+            raise StoreError(err)
+
+        return fname, None
+
+    # _dump ()
+
+    def _unlink(self, fname):
+        try:
+            os.unlink(os.path.join(self.path, fname))
+        except OSError as err:
+            self.logger.debug('Failed to remove {} ({}).'.format(fname, err))
+
+# class ResultStore
+
+
+def _to_str(stream):
+    return None if stream is None else str(stream)
+
+# ---- END OF <store.py> ----
@@ -12,10 +12,36 @@
 Task facilities.
 """
 
+import asyncio
+import concurrent.futures
+import contextlib
+import functools
+import io
+import json
 import logging
+import multiprocessing
+import os
+import selectors
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
 
 from ramsis.utils.error import Error
 
+try:
+    from multiprocessing.shared_memory import SharedMemory
+except ImportError:
+    # Python < 3.8
+    SharedMemory = None
+
+# signal interrupting a call executed by a process pool worker
+CANCEL_SIGNAL = getattr(signal, 'SIGUSR1', None)
+
 
 # -----------------------------------------------------------------------------
 class TaskError(Error):
@@ -27,14 +53,117 @@ class NotConfigured(TaskError):
 class InvalidConfiguration(TaskError):
     """Invalid configuration ({})."""
 
+class BatchNotSupported(TaskError):
+    """Batch execution not supported ({})."""
+
 
 class TaskStream(object):
     """ABC for stream task stream objects."""
 
+    def read_from(self, offset=0, max_bytes=None):
+        """
+        Incrementally read the stream.
+
+        :param int offset: Byte offset to start reading from
+        :param int max_bytes: Maximum number of bytes to be read
+        :returns: Tuple of the form `(data, next_offset)`
+        :rtype: tuple
+        """
+        data = str(self).encode('utf-8')[offset:]
+        if max_bytes is not None:
+            data = data[:max_bytes]
+        return data, offset + len(data)
+
+    # read_from ()
+
     def __str__(self):
         return ''
 
 
+class RingBufferTaskStream(TaskStream):
+    """
+    Fixed-capacity task stream. The stream keeps the most recent `capacity`
+    bytes in memory. Bytes evicted from the buffer are either dropped or, if
+    `spill_dir` is defined, spilled to an anonymous temporary file located
+    at `spill_dir`.
+
+    :param int capacity: Capacity of the in-memory buffer in bytes
+    :param str spill_dir: Optional directory evicted bytes are spilled to
+    """
+
+    def __init__(self, capacity=1024**2, spill_dir=None):
+        self.capacity = capacity
+        self._buf = bytearray()
+        # number of bytes written in total
+        self._size = 0
+        # number of bytes evicted from the buffer
+        self._evicted = 0
+        self._spill = (tempfile.TemporaryFile(dir=spill_dir)
+                       if spill_dir else None)
+        self._lock = threading.Lock()
+
+    # __init__ ()
+
+    @property
+    def size(self):
+        """Number of bytes written in total."""
+        return self._size
+
+    def write(self, s):
+        data = s.encode('utf-8') if isinstance(s, str) else bytes(s)
+        with self._lock:
+            self._buf += data
+            self._size += len(data)
+            excess = len(self._buf) - self.capacity
+            if excess > 0:
+                if self._spill is not None:
+                    self._spill.seek(0, 2)
+                    self._spill.write(self._buf[:excess])
+                del self._buf[:excess]
+                self._evicted += excess
+        return len(s)
+
+    # write ()
+
+    def flush(self):
+        pass
+
+    def read_from(self, offset=0, max_bytes=None):
+        with self._lock:
+            offset = max(0, min(offset, self._size))
+            if offset < self._evicted and self._spill is None:
+                # NOTE(damb): bytes dropped from the buffer are skipped
+                offset = self._evicted
+            end = (self._size if max_bytes is None else
+                   min(self._size, offset + max_bytes))
+
+            chunks = []
+            if offset < self._evicted:
+                self._spill.flush()
+                self._spill.seek(offset)
+                chunks.append(
+                    self._spill.read(min(self._evicted, end) - offset))
+            start = max(offset, self._evicted)
+            if end > start:
+                chunks.append(bytes(
+                    self._buf[start - self._evicted:end - self._evicted]))
+            return b''.join(chunks), end
+
+    # read_from ()
+
+    def close(self):
+        with self._lock:
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
+
+    def __str__(self):
+        with self._lock:
+            return self._buf.decode('utf-8', errors='replace')
+
+# class RingBufferTaskStream
+
+
 # -----------------------------------------------------------------------------
 class Task(object):
     """
@@ -45,6 +174,8 @@ class Task(object):
 
     def __init__(self, logger=None):
         self.is_configured = False
+        # number of parameter sets of a batch task; None for a single task
+        self.batch_size = None
         self._stdout = None
         self._stderr = None
 
@@ -71,6 +202,25 @@ class Task(object):
     def stderr(self):
         return None
 
+    def read_stream(self, name='stdout', offset=0, max_bytes=None):
+        """
+        Incrementally read a task stream.
+
+        :param str name: Stream name i.e. either `stdout` or `stderr`
+        :param int offset: Byte offset to start reading from
+        :param int max_bytes: Maximum number of bytes to be read
+        :returns: Tuple of the form `(data, next_offset)`
+        :rtype: tuple
+        """
+        stream = {'stdout': self._stdout, 'stderr': self._stderr}[name]
+        if stream is None:
+            return b'', offset
+        if isinstance(stream, TaskStream):
+            return stream.read_from(offset, max_bytes=max_bytes)
+        return TaskStream.read_from(stream, offset, max_bytes=max_bytes)
+
+    # read_stream ()
+
     def poll(self):
         """
         Poll the status of a task. For a synchronous task the function
@@ -78,6 +228,13 @@ class Task(object):
         """
         return None
 
+    def wait(self, timeout=None):
+        """
+        Block until the task has finished or `timeout` (in seconds) expired.
+        For a synchronous task the function returns immediately.
+        """
+        pass
+
     def configure(self, **kwargs):
         """
         Configure a task.
@@ -87,19 +244,52 @@ class Task(object):
         """
         raise NotImplementedError
 
+    def cancel(self):
+        """
+        Cancel a running task and free the resources it holds. A cancelled
+        task reports a non-zero return code. Synchronous tasks cannot be
+        cancelled.
+
+        :returns: `True` if the task was cancelled, else `False`
+        """
+        return False
+
+    def configure_batch(self, params):
+        """
+        Configure a task for the batch execution of multiple parameter sets
+        within a single (vectorized) call. Results are expected to be
+        stacked along the first axis i.e. one entry per parameter set.
+
+        :param list params: List of function keyword argument dictionaries
+        :raises BatchNotSupported: If the task does not support batches
+        """
+        raise BatchNotSupported(type(self).__name__)
+
     def reset(self):
         """
         Reininitialize a task.
         """
         raise NotImplementedError
 
+    def prepare(self, timeout=None):
+        """
+        Prepare the execution of a task (warm-up hook) e.g. lease the
+        resources the task is executed with and make sure static data is
+        loaded. Called right before the task is run. By default a no-op.
+
+        :param timeout: Maximum time in seconds to block e.g. while leasing
+            resources. `None` blocks until the resources are available.
+        """
+        pass
+
     def _run(self):
         """
         Run a task.
         """
         raise NotImplementedError
 
-    def __call__(self):
+    def __call__(self, timeout=None):
+        self.prepare(timeout=timeout)
         self._run()
 
 # class Task
@@ -112,6 +302,8 @@ class AsyncTask(Task):
 
     LOGGER = 'ramsis.worker.asnyc_task'
 
+    POLL_INTERVAL = 0.1
+
     def __init__(self, logger=None):
         self._result = None
         self._process = None
@@ -125,16 +317,857 @@ class AsyncTask(Task):
 
     def reset(self):
         if self.is_configured:
+            for stream in (self._stdout, self._stderr):
+                if hasattr(stream, 'close'):
+                    stream.close()
             self._process = None
             self._result = None
             self._returncode = None
             self._stdout = None
             self._stderr = None
+            self.batch_size = None
             self.is_configured = False
 
     def poll(self):
         raise NotImplementedError
 
+    def wait(self, timeout=None):
+        """
+        Block until the task has finished or `timeout` (in seconds) expired.
+
+        The default implementation polls the task periodically. Concrete
+        implementations should overload this method if a blocking primitive
+        is available.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.poll() is None:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            time.sleep(self.POLL_INTERVAL)
+
+    # wait ()
+
+    async def wait_async(self, timeout=None):
+        """
+        Awaitable variant of :py:meth:`wait`. Polling is performed by a
+        coroutine i.e. waiting does not occupy a thread.
+
+        :returns: The task's return code or `None` if the task has not
+            finished within `timeout`
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            returncode = self.poll()
+            if returncode is not None:
+                return returncode
+            if deadline is not None and loop.time() >= deadline:
+                return None
+            await asyncio.sleep(self.POLL_INTERVAL)
+
+    # wait_async ()
+
 # class AsyncTask
 
+
+class CompletedTask(Task):
+    """
+    A task which is completed right from the beginning, e.g. for serving
+    cached results.
+
+    :param result: Task result
+    :param int batch_size: Number of parameter sets if `result` is a batch
+        result
+    """
+
+    LOGGER = 'ramsis.worker.completed_task'
+
+    def __init__(self, result, batch_size=None, logger=None):
+        super().__init__(logger=logger)
+        self._result = result
+        self.batch_size = batch_size
+        self.is_configured = True
+
+    @property
+    def result(self):
+        return self._result
+
+    @property
+    def returncode(self):
+        return 0
+
+    def poll(self):
+        return self.returncode
+
+    def configure(self, **kwargs):
+        pass
+
+    def reset(self):
+        pass
+
+    def _run(self):
+        pass
+
+# class CompletedTask
+
+
+class SharedTask(Task):
+    """
+    A task sharing the result of an identical run in flight rather than
+    being executed itself (see
+    :py:meth:`ramsis.worker.utils.registry.Run.follow`). The task is
+    completed by means of :py:meth:`resolve` as soon as the run followed
+    finished.
+
+    :param int batch_size: Number of parameter sets if the result is a
+        batch result
+    """
+
+    LOGGER = 'ramsis.worker.shared_task'
+
+    def __init__(self, batch_size=None, logger=None):
+        super().__init__(logger=logger)
+        self._result = None
+        self._returncode = None
+        self.batch_size = batch_size
+        self.is_configured = True
+
+    @property
+    def result(self):
+        return self._result
+
+    @property
+    def returncode(self):
+        return self._returncode
+
+    def poll(self):
+        return self.returncode
+
+    def resolve(self, result=None, returncode=0):
+        """
+        Complete the task with the result of the run followed.
+        """
+        self._result = result
+        self._returncode = returncode
+
+    def configure(self, **kwargs):
+        pass
+
+    def cancel(self):
+        """
+        Detach the task from the run followed. The run followed is not
+        affected.
+        """
+        if self._returncode is not None:
+            return False
+        self._returncode = 1
+        return True
+
+    # cancel ()
+
+    def reset(self):
+        self._result = None
+
+    def _run(self):
+        pass
+
+# class SharedTask
+
+
+class ProcessPoolTask(AsyncTask):
+    """
+    Task executing a Python callable within a process pool (see
+    :py:func:`create_process_pool`) i.e. in parallel and without being
+    limited by the GIL.
+
+    `func` must be picklable (i.e. defined at module level); it is called
+    with the keyword arguments passed to :py:meth:`configure`.
+    :py:class:`numpy.ndarray` arguments and results of at least
+    `shm_threshold` bytes are passed through shared memory rather than being
+    pickled.
+
+    Python level stdout/stderr of `func` is captured per run and available
+    as soon as the task finished.
+
+    Cancelling a task removes a pending call from the pool's queue. A call
+    already executed by a worker process is interrupted (by means of
+    :py:data:`CANCEL_SIGNAL`) such that the worker process is returned to
+    the pool.
+
+    :param func: Callable to be executed
+    :param executor: Process pool the task is executed with
+    :type executor: :py:class:`concurrent.futures.ProcessPoolExecutor`
+    :param int stream_capacity: Capacity in bytes of the stdout/stderr
+        buffers
+    :param str spill_dir: Optional directory stdout/stderr evicted from the
+        buffers is spilled to
+    :param int shm_threshold: Minimum size in bytes of arrays passed through
+        shared memory
+    """
+
+    LOGGER = 'ramsis.worker.process_pool_task'
+
+    SHM_THRESHOLD = 1024**2
+    # time in seconds to wait for an interrupted call to return
+    CANCEL_TIMEOUT = 1.
+
+    def __init__(self, func, executor, stream_capacity=1024**2,
+                 spill_dir=None, shm_threshold=SHM_THRESHOLD, logger=None):
+        self._func = func
+        self._executor = executor
+        self._kwargs = None
+        self._shm = []
+        # shared memory block used to interrupt the call
+        self._control = None
+        self._stream_capacity = stream_capacity
+        self._spill_dir = spill_dir
+        self._shm_threshold = shm_threshold
+
+        super().__init__(logger=logger if logger is not None else self.LOGGER)
+
+    @property
+    def result(self):
+        return self._result
+
+    @property
+    def stdout(self):
+        return None if self._stdout is None else str(self._stdout)
+
+    @property
+    def stderr(self):
+        return None if self._stderr is None else str(self._stderr)
+
+    def configure(self, **kwargs):
+        if not self.is_configured:
+            self._kwargs = kwargs
+            self.is_configured = True
+
+    def poll(self):
+        if self._returncode is not None:
+            return self.returncode
+        if self._process is None or not self._process.done():
+            return None
+
+        if self._returncode is None:
+            try:
+                result, stdout, stderr, ok = self._process.result()
+                self._stdout.write(stdout)
+                self._stderr.write(stderr)
+                self._result = _from_shared(result)
+            except Exception as err:
+                self._stderr.write(str(err))
+                self._returncode = 1
+            else:
+                self._returncode = 0 if ok else 1
+            finally:
+                self._release_shm()
+
+        return self.returncode
+
+    # poll ()
+
+    def wait(self, timeout=None):
+        if self._process is None:
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.poll() is None:
+            remaining = (self.POLL_INTERVAL if deadline is None else
+                         min(self.POLL_INTERVAL, deadline - time.monotonic()))
+            if remaining <= 0:
+                break
+            concurrent.futures.wait([self._process], timeout=remaining)
+
+    # wait ()
+
+    def cancel(self):
+        """
+        Cancel the task. A pending call is removed from the pool's queue; a
+        call already executed by a worker process is interrupted. Shared
+        memory is released as soon as the call returned.
+
+        .. note::
+
+            A call blocking within an extension module (i.e. not executing
+            Python code) is interrupted only once it returned to the
+            interpreter.
+        """
+        if self._process is None or self._returncode is not None:
+            return False
+
+        if not self._process.cancel():
+            if self._interrupt():
+                concurrent.futures.wait([self._process],
+                                        timeout=self.CANCEL_TIMEOUT)
+            if not self._process.done():
+                self.logger.warning(
+                    'Abandoning call executed by process pool ...')
+        self._stderr.write('Task cancelled.\n')
+        self._returncode = 1
+
+        # NOTE(damb): The worker process might still use the shared memory.
+        self._process.add_done_callback(
+            functools.partial(_release, self._shm, self._control))
+        self._shm = []
+        self._control = None
+        return True
+
+    # cancel ()
+
+    def reset(self):
+        if self._process is not None:
+            self._process.cancel()
+        self._release_shm()
+        self._kwargs = None
+        super().reset()
+
+    # reset ()
+
+    def _run(self):
+        if not self.is_configured:
+            raise NotConfigured()
+
+        self._stdout = RingBufferTaskStream(capacity=self._stream_capacity,
+                                            spill_dir=self._spill_dir)
+        self._stderr = RingBufferTaskStream(capacity=self._stream_capacity,
+                                            spill_dir=self._spill_dir)
+
+        kwargs = {}
+        for k, v in self._kwargs.items():
+            kwargs[k] = _to_shared(v, self._shm_threshold, self._shm)
+        if SharedMemory is not None and CANCEL_SIGNAL is not None:
+            self._control = SharedMemory(create=True, size=_CONTROL_SIZE)
+        try:
+            self._process = self._executor.submit(
+                _invoke, self._func, kwargs, self._shm_threshold,
+                control=(None if self._control is None else
+                         self._control.name))
+        except Exception as err:
+            self._release_shm()
+            raise TaskError(err)
+
+    # _run ()
+
+    def _interrupt(self):
+        """
+        Request the worker process executing the call to interrupt it.
+
+        :returns: `True` if the worker process was signalled, else `False`
+        """
+        if self._control is None:
+            return False
+
+        control = _control_view(self._control)
+        try:
+            # NOTE(damb): The flag is set first such that the worker process
+            # either is signalled or recognizes the flag before calling
+            # func (see _invoke ()).
+            control[_CANCEL] = 1
+            pid = int(control[_PID])
+        finally:
+            del control
+        if pid <= 0:
+            return False
+
+        try:
+            os.kill(pid, CANCEL_SIGNAL)
+        except OSError as err:
+            self.logger.warning(
+                'Failed to interrupt call executed by process {} '
+                '({}).'.format(pid, err))
+            return False
+        return True
+
+    # _interrupt ()
+
+    def _release_shm(self):
+        for shm in self._shm:
+            _unlink(shm)
+        self._shm = []
+        if self._control is not None:
+            _unlink(self._control)
+            self._control = None
+
+    # _release_shm ()
+
+# class ProcessPoolTask
+
+
+class SubprocessTask(AsyncTask):
+    """
+    Task executing an external (model) binary. The binary is launched
+    without blocking; stdout/stderr are streamed through non-blocking pipes
+    into fixed-capacity buffers (see :py:class:`RingBufferTaskStream`).
+
+    The command is a list of arguments which may contain the following
+    placeholders:
+
+        - `{input}`: path of a JSON file containing the keyword arguments
+          passed to :py:meth:`configure` (arrays are written as nested
+          lists)
+        - `{output}`: path of the file the binary writes its result to
+        - `{params[<key>]}`: keyword argument `<key>` passed to
+          :py:meth:`configure`
+
+    Results are read from the output file by means of memory-mapping i.e.
+    without parsing stdout. ``.npy`` files are loaded with
+    :py:func:`numpy.load`; any other file is interpreted as raw array of
+    `output_dtype`. Each run is executed within a temporary working
+    directory which is removed when the task is reset.
+
+    A non-zero exit code of the binary is reported as `returncode`.
+
+    :param list cmd: Command (including arguments)
+    :param str output: Name of the output file
+    :param str output_dtype: dtype of raw output files
+    :param str workdir: Directory temporary working directories are created
+        in
+    :param dict env: Optional environment of the binary
+    :param int stream_capacity: Capacity in bytes of the stdout/stderr
+        buffers
+    :param str spill_dir: Optional directory stdout/stderr evicted from the
+        buffers is spilled to
+    """
+
+    LOGGER = 'ramsis.worker.subprocess_task'
+
+    # number of bytes read from a pipe at once
+    CHUNK_SIZE = 64 * 1024
+    # seconds granted to a terminated process before being killed
+    KILL_TIMEOUT = 5
+
+    def __init__(self, cmd, output='result.npy', output_dtype='float64',
+                 workdir=None, env=None, stream_capacity=1024**2,
+                 spill_dir=None, logger=None):
+        self._cmd = list(cmd)
+        self._output = output
+        self._output_dtype = output_dtype
+        self._workdir = workdir
+        self._env = env
+        self._stream_capacity = stream_capacity
+        self._spill_dir = spill_dir
+        self._kwargs = None
+        self._rundir = None
+        self._selector = None
+        self._lock = threading.Lock()
+
+        super().__init__(logger=logger if logger is not None else self.LOGGER)
+
+    @property
+    def result(self):
+        return self._result
+
+    @property
+    def stdout(self):
+        return None if self._stdout is None else str(self._stdout)
+
+    @property
+    def stderr(self):
+        return None if self._stderr is None else str(self._stderr)
+
+    def configure(self, **kwargs):
+        if not self.is_configured:
+            self._kwargs = kwargs
+            self.is_configured = True
+
+    def poll(self):
+        return self._poll(timeout=0)
+
+    def wait(self, timeout=None):
+        if self._process is None:
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = (self.POLL_INTERVAL if deadline is None else
+                         min(self.POLL_INTERVAL, deadline - time.monotonic()))
+            if self._poll(timeout=max(remaining, 0)) is not None:
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+
+    # wait ()
+
+    def _poll(self, timeout=0):
+        """
+        Poll the task. Pipes are drained while waiting at most `timeout`
+        seconds for output.
+        """
+        with self._lock:
+            if self._process is None:
+                return None
+
+            if self._returncode is None:
+                if self._selector.get_map():
+                    self._drain(timeout=timeout)
+                elif timeout:
+                    # both pipes closed; wait for the process to exit
+                    try:
+                        self._process.wait(timeout=timeout)
+                    except subprocess.TimeoutExpired:
+                        pass
+
+                if self._process.poll() is None:
+                    return None
+                # read remaining output
+                while self._selector.get_map() and self._drain(timeout=0):
+                    pass
+                self._finish()
+
+            return self.returncode
+
+    # _poll ()
+
+    def cancel(self):
+        """
+        Cancel the task by terminating the process. The process is killed
+        if it did not exit within `KILL_TIMEOUT` seconds.
+        """
+        with self._lock:
+            if self._process is None or self._returncode is not None:
+                return False
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=self.KILL_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+        self.poll()
+        return True
+
+    # cancel ()
+
+    def reset(self):
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                self._process.kill()
+                self._process.wait()
+            self._close_pipes()
+            if self._rundir is not None:
+                shutil.rmtree(self._rundir, ignore_errors=True)
+                self._rundir = None
+            self._kwargs = None
+            super().reset()
+
+    # reset ()
+
+    def _run(self):
+        if not self.is_configured:
+            raise NotConfigured()
+
+        self._rundir = tempfile.mkdtemp(prefix='ramsis-', dir=self._workdir)
+        input_path = os.path.join(self._rundir, 'input.json')
+        with open(input_path, 'w') as ofd:
+            json.dump(self._kwargs, ofd, default=_json_default)
+
+        try:
+            args = [arg.format(input=input_path, output=self._output_path(),
+                               params=self._kwargs) for arg in self._cmd]
+        except (KeyError, IndexError, AttributeError, ValueError) as err:
+            raise InvalidConfiguration(err)
+
+        self._stdout = RingBufferTaskStream(capacity=self._stream_capacity,
+                                            spill_dir=self._spill_dir)
+        self._stderr = RingBufferTaskStream(capacity=self._stream_capacity,
+                                            spill_dir=self._spill_dir)
+        self.logger.debug('Launching {!r} ...'.format(args))
+        try:
+            self._process = subprocess.Popen(
+                args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, cwd=self._rundir, env=self._env)
+        except OSError as err:
+            raise TaskError(err)
+
+        self._selector = selectors.DefaultSelector()
+        for pipe, stream in ((self._process.stdout, self._stdout),
+                             (self._process.stderr, self._stderr)):
+            os.set_blocking(pipe.fileno(), False)
+            self._selector.register(pipe, selectors.EVENT_READ, stream)
+
+    # _run ()
+
+    def _output_path(self):
+        return os.path.join(self._rundir, self._output)
+
+    def _drain(self, timeout=0):
+        """
+        Read available data from the pipes into the task streams.
+
+        :returns: Number of pipes ready for reading
+        :rtype: int
+        """
+        events = self._selector.select(timeout=timeout)
+        for key, _ in events:
+            try:
+                data = os.read(key.fd, self.CHUNK_SIZE)
+            except BlockingIOError:
+                continue
+            if data:
+                key.data.write(data)
+            else:
+                # EOF
+                self._selector.unregister(key.fileobj)
+                key.fileobj.close()
+        return len(events)
+
+    # _drain ()
+
+    def _finish(self):
+        self._close_pipes()
+        returncode = self._process.returncode
+        if returncode != 0:
+            self._stderr.write(
+                'Process exited with code {}.\n'.format(returncode))
+            self._returncode = returncode
+            return
+
+        try:
+            self._result = self._load()
+        except Exception as err:
+            self._stderr.write(
+                'Failed to load result ({}).\n'.format(err))
+            self._returncode = 1
+        else:
+            self._returncode = 0
+
+    # _finish ()
+
+    def _load(self):
+        import numpy as np
+
+        path = self._output_path()
+        if path.endswith('.npy'):
+            return np.load(path, mmap_mode='r')
+        return np.memmap(path, dtype=self._output_dtype, mode='r')
+
+    # _load ()
+
+    def _close_pipes(self):
+        if self._selector is not None:
+            for key in list(self._selector.get_map().values()):
+                self._selector.unregister(key.fileobj)
+                key.fileobj.close()
+            self._selector.close()
+            self._selector = None
+
+    # _close_pipes ()
+
+# class SubprocessTask
+
+
+def _json_default(obj):
+    """
+    Serialize objects not serializable by :py:mod:`json`. Arrays are
+    serialized completely (i.e. as nested lists) rather than by means of
+    their (abbreviated) string representation.
+    """
+    import numpy as np
+
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return str(obj)
+
+# _json_default ()
+
+
+def create_process_pool(max_workers=None, mp_context='forkserver'):
+    """
+    Create a process pool for :py:class:`ProcessPoolTask` instances.
+
+    :param int max_workers: Number of worker processes. By default, the
+        number of CPUs.
+    :param str mp_context: Multiprocessing start method. Worker processes
+        should not be forked from the (multi-threaded) webservice process.
+    :rtype: :py:class:`concurrent.futures.ProcessPoolExecutor`
+    """
+    if mp_context not in multiprocessing.get_all_start_methods():
+        mp_context = 'spawn'
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context(mp_context))
+
+# create_process_pool ()
+
+
+class _SharedArray(object):
+    """
+    Picklable descriptor of a :py:class:`numpy.ndarray` located in shared
+    memory.
+    """
+
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+    def attach(self):
+        """
+        :returns: Tuple of the form `(shm, arr)` where `arr` is a view of
+            the shared memory block `shm`.
+        """
+        import numpy as np
+
+        shm = SharedMemory(name=self.name)
+        return shm, np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf)
+
+# class _SharedArray
+
+
+def _to_shared(obj, threshold, blocks):
+    """
+    Copy `obj` into shared memory if it is a sufficiently large
+    :py:class:`numpy.ndarray`. Created blocks are appended to `blocks`.
+    """
+    import numpy as np
+
+    if SharedMemory is None or not isinstance(obj, np.ndarray):
+        return obj
+    if obj.dtype.hasobject or obj.nbytes < max(threshold, 1):
+        return obj
+
+    shm = SharedMemory(create=True, size=obj.nbytes)
+    blocks.append(shm)
+    np.ndarray(obj.shape, dtype=obj.dtype, buffer=shm.buf)[...] = obj
+    return _SharedArray(shm.name, obj.shape, obj.dtype.str)
+
+# _to_shared ()
+
+
+def _from_shared(obj):
+    """
+    Copy a result out of shared memory and release the memory block.
+    """
+    if not isinstance(obj, _SharedArray):
+        return obj
+
+    shm, arr = obj.attach()
+    try:
+        return arr.copy()
+    finally:
+        del arr
+        _unlink(shm)
+
+# _from_shared ()
+
+
+def _unlink(shm):
+    try:
+        shm.close()
+        shm.unlink()
+    except (BufferError, OSError):
+        pass
+
+# _unlink ()
+
+
+def _release(blocks, control, future):
+    """
+    Release the shared memory of a cancelled call once `future` is done.
+    """
+    for shm in blocks:
+        _unlink(shm)
+    if control is not None:
+        _unlink(control)
+
+    if future.cancelled() or future.exception() is not None:
+        return
+    result = future.result()[0]
+    if isinstance(result, _SharedArray):
+        try:
+            _unlink(SharedMemory(name=result.name))
+        except OSError:
+            pass
+
+# _release ()
+
+
+# layout of the control block of a call (int64): worker process pid, cancel
+# flag
+_PID, _CANCEL = range(2)
+_CONTROL_SIZE = 2 * 8
+
+
+def _control_view(shm):
+    import numpy as np
+
+    return np.ndarray((2, ), dtype=np.int64, buffer=shm.buf)
+
+
+class _Cancelled(BaseException):
+    """
+    Raised within a worker process if the call executed is cancelled.
+    """
+
+
+def _invoke(func, kwargs, threshold, control=None):
+    """
+    Call `func` within a worker process.
+
+    :param str control: Optional name of the shared memory block used to
+        interrupt the call (see :py:meth:`ProcessPoolTask.cancel`)
+    :returns: Tuple of the form `(result, stdout, stderr, ok)`
+    """
+    attached = []
+    for k, v in kwargs.items():
+        if isinstance(v, _SharedArray):
+            shm, kwargs[k] = v.attach()
+            attached.append(shm)
+
+    stdout, stderr = io.StringIO(), io.StringIO()
+    result, ok = None, True
+    running = [False]
+    ctrl_shm = ctrl = None
+    try:
+        if control is not None:
+            ctrl_shm = SharedMemory(name=control)
+            ctrl = _control_view(ctrl_shm)
+
+            def interrupt(signum, frame):
+                if running[0] and ctrl[_CANCEL]:
+                    raise _Cancelled()
+
+            signal.signal(CANCEL_SIGNAL, interrupt)
+            ctrl[_PID] = os.getpid()
+
+        with contextlib.redirect_stdout(stdout), \
+                contextlib.redirect_stderr(stderr):
+            try:
+                running[0] = True
+                if ctrl is not None and ctrl[_CANCEL]:
+                    raise _Cancelled()
+                result = func(**kwargs)
+                running[0] = False
+            except _Cancelled:
+                running[0] = False
+                result, ok = None, False
+                print('Task cancelled.', file=sys.stderr)
+            except Exception:
+                running[0] = False
+                traceback.print_exc()
+                ok = False
+        # NOTE(damb): The memory block of the result is released by the
+        # parent process.
+        result = _to_shared(result, threshold, [])
+    finally:
+        running[0] = False
+        if ctrl is not None:
+            # NOTE(damb): A late signal must not terminate the worker
+            # process.
+            signal.signal(CANCEL_SIGNAL, signal.SIG_IGN)
+            ctrl[_PID] = 0
+            del ctrl
+        if ctrl_shm is not None:
+            ctrl_shm.close()
+        kwargs.clear()
+        for shm in attached:
+            try:
+                shm.close()
+            except BufferError:
+                # the result still references the block
+                pass
+
+    return result, stdout.getvalue(), stderr.getvalue(), ok
+
+# _invoke ()
+
 # ---- END OF <task.py> ----
@@ -49,14 +49,28 @@ _install_requires = [
     'Flask>=0.12.2',
     'Flask-RESTful>=0.3.6',
     'webargs>=2.1',
+    'numpy',
     "ramsis.utils==0.1", ]
 
-_extras_require = {'doc': [
-    "epydoc==3.0.1",
-    "sphinx==1.4.1",
-    "sphinx-rtd-theme==0.1.9", ]}
-
-_tests_require = []
+_extras_require = {
+    'doc': [
+        "epydoc==3.0.1",
+        "sphinx==1.4.1",
+        "sphinx-rtd-theme==0.1.9", ],
+    'asgi': [
+        "starlette",
+        "uvicorn>=0.24", ],
+    'compression': [
+        "zstandard", ],
+    'production': [
+        "gunicorn>=19.9", ],
+    'serialization': [
+        "orjson",
+        "msgpack",
+        "pyarrow", ]}
+
+_tests_require = [
+    "pytest", ]
 
 _dependency_links = [(
     "git+https://gitlab.seismo.ethz.ch/indu/ramsis.utils.git"
@@ -67,7 +81,9 @@ _data_files = [
 
 _entry_points_sass = {
     'console_scripts': [
-        'ramsis-worker-sass = ramsis.worker.SaSS.app:main', ]}
+        'ramsis-worker-sass = ramsis.worker.SaSS.app:main',
+        'ramsis-worker-sass-bench = ramsis.worker.SaSS.bench:main',
+        'ramsis-worker-sass-dispatch = ramsis.worker.SaSS.dispatch:main', ]}
 _entry_points = _entry_points_sass.copy()
 
 _name = 'ramsis.worker'
@@ -131,7 +147,6 @@ setup(
     include_package_data=True,
     zip_safe=False,
     entry_points=_entry_points
-    # TODO(damb): test_suite=unittest.TestCase
 )
 
 # ----- END OF setup.py -----
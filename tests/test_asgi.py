@@ -0,0 +1,345 @@
+# This is <test_asgi.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Tests of the asyncio-native (ASGI) worker resources.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Tests of :py:mod:`ramsis.worker.utils.asgi`.
+"""
+
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from ramsis.utils.protocol import StatusCode
+from ramsis.worker.utils.asgi import (AsgiRunEventsResource,
+                                      AsgiRunLogResource, AsgiWorkerResource,
+                                      create_app)
+from ramsis.worker.utils.executor import RunExecutor
+from ramsis.worker.utils.cache import ResultCache
+from ramsis.worker.utils.registry import RunRegistry, RunState
+from ramsis.worker.utils.store import ResultStore
+from ramsis.worker.utils.task import Task
+
+TestClient = pytest.importorskip('starlette.testclient').TestClient
+
+
+def on_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class SumTask(Task):
+    """
+    Asynchronous task returning the sum of its parameters. The task
+    finishes once the event `done` is set.
+    """
+
+    def __init__(self, done=None):
+        super().__init__()
+        self.cancelled = False
+        self.cancelled_on_loop = None
+        self._done = done
+        self._params = None
+        self._result = None
+        self._returncode = None
+
+    @property
+    def result(self):
+        return self._result
+
+    @property
+    def returncode(self):
+        return self._returncode
+
+    def poll(self):
+        done = self._done is None or self._done.is_set()
+        if self._returncode is None and done:
+            self._result = np.array(sum(self._params.values()), dtype=float)
+            self._returncode = 0
+        return self._returncode
+
+    def wait(self, timeout=None):
+        if self._done is not None:
+            self._done.wait(timeout)
+
+    def configure(self, **kwargs):
+        self._params = kwargs
+        self.is_configured = True
+
+    def cancel(self):
+        self.cancelled = True
+        self.cancelled_on_loop = on_event_loop()
+        self._returncode = 1
+        return True
+
+    def reset(self):
+        self.is_configured = False
+
+    def _run(self):
+        pass
+
+# class SumTask
+
+
+class Store(ResultStore):
+    """
+    Result store recording the operations performed on an event loop.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.blocking = []
+
+    def add(self, run):
+        if on_event_loop():
+            self.blocking.append(('add', run.id))
+        return super().add(run)
+
+    def put(self, run):
+        if on_event_loop():
+            self.blocking.append(('put', run.id))
+        return super().put(run)
+
+    def get(self, run_id):
+        if on_event_loop():
+            self.blocking.append(('get', run_id))
+        return super().get(run_id)
+
+# class Store
+
+
+class Cache(ResultCache):
+    """
+    Result cache recording the operations performed on an event loop.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.blocking = []
+
+    def get(self, key):
+        if on_event_loop():
+            self.blocking.append(('get', key))
+        return super().get(key)
+
+    def put(self, key, result):
+        if on_event_loop():
+            self.blocking.append(('put', key))
+        return super().put(key, result)
+
+# class Cache
+
+
+@pytest.fixture
+def worker():
+    registry = RunRegistry()
+    executor = RunExecutor(max_workers=1)
+    done = threading.Event()
+    done.set()
+
+    def create(store=None, cache=None):
+        resource = AsgiWorkerResource(
+            task=lambda: SumTask(done=done), registry=registry,
+            executor=executor, store=store, cache=cache)
+        events = AsgiRunEventsResource(registry=registry, store=store)
+        log = AsgiRunLogResource(registry=registry, store=store)
+        app = create_app([
+            ('/runs', resource, ('GET', 'POST')),
+            ('/runs/<run_id>', resource, ('GET', 'DELETE')),
+            ('/runs/<run_id>/events', events, ('GET', )),
+            ('/runs/<run_id>/log', log, ('GET', ))])
+        return TestClient(app)
+
+    create.registry = registry
+    create.done = done
+    yield create
+    done.set()
+    executor.shutdown()
+
+
+def submit(client, **params):
+    resp = client.post('/runs', json={'model_parameters': params})
+    assert resp.status_code == StatusCode.TaskAccepted.value
+    return resp.json()['run_id']
+
+
+def test_run_lifecycle(worker):
+    client = worker()
+    run_id = submit(client, a=1, b=2)
+
+    resp = client.get('/runs/{}'.format(run_id), params={'wait': 5})
+    assert resp.status_code == StatusCode.TaskCompleted.value
+    assert resp.headers['X-Run-State'] == 'done'
+    body = resp.json()
+    assert body['run_id'] == run_id
+    assert body['result'] == [{'rate_prediction': 3.}]
+
+    # without a store results are delivered once
+    resp = client.get('/runs/{}'.format(run_id))
+    assert resp.status_code == 404
+
+
+def test_processing(worker):
+    client = worker()
+    worker.done.clear()
+    run_id = submit(client, a=1)
+
+    resp = client.get('/runs/{}'.format(run_id), params={'wait': 0.05})
+    assert resp.status_code == StatusCode.TaskCurrentlyProcessing.value
+    assert resp.json()['state'] in ('accepted', 'running')
+
+    resp = client.get('/runs')
+    assert resp.status_code == 200
+    assert [r['run_id'] for r in resp.json()['result']] == [run_id]
+
+    worker.done.set()
+    resp = client.get('/runs/{}'.format(run_id), params={'wait': 5})
+    assert resp.status_code == StatusCode.TaskCompleted.value
+
+
+def test_invalid_message(worker):
+    client = worker()
+    resp = client.post('/runs', json={'parameters': {}})
+    assert resp.status_code == StatusCode.UnprocessableEntity.value
+    assert 'model_parameters' in resp.json()['errors']
+    assert len(worker.registry) == 0
+
+
+def test_method_not_allowed(worker):
+    client = worker()
+    resp = client.post('/runs', json={'model_parameters': {}})
+    run_id = resp.json()['run_id']
+    resp = client.post('/runs/{}'.format(run_id),
+                       json={'model_parameters': {}})
+    assert resp.status_code == 405
+
+
+def test_cancel(worker):
+    client = worker()
+    worker.done.clear()
+    run_id = submit(client, a=1)
+    task = worker.registry.get(run_id).task
+
+    resp = client.delete('/runs/{}'.format(run_id))
+    assert resp.status_code == 200
+    assert resp.json()['state'] == 'failed'
+    # cancelling does not block the event loop
+    assert task.cancelled
+    assert task.cancelled_on_loop is False
+
+    worker.done.set()
+    resp = client.get('/runs/{}'.format(run_id), params={'wait': 5})
+    assert resp.status_code == StatusCode.TaskProcessingError.value
+
+    resp = client.delete('/runs/{}'.format(run_id))
+    assert resp.status_code == 404
+
+
+def test_events(worker):
+    client = worker()
+    worker.done.clear()
+    run_id = submit(client, a=1)
+    threading.Timer(0.1, worker.done.set).start()
+
+    with client.stream('GET', '/runs/{}/events'.format(run_id)) as resp:
+        assert resp.status_code == 200
+        assert resp.headers['content-type'].startswith('text/event-stream')
+        events = ''.join(resp.iter_text())
+
+    assert events.rstrip().endswith('"state": "done"}')
+
+
+def test_log(worker):
+    client = worker()
+    resp = client.get('/runs/unknown/log')
+    assert resp.status_code == 404
+
+    run_id = submit(client, a=1)
+    resp = client.get('/runs/{}/log'.format(run_id),
+                      params={'stream': 'stdin'})
+    assert resp.status_code == 400
+
+    resp = client.get('/runs/{}/log'.format(run_id))
+    assert resp.status_code == 200
+    assert resp.headers['X-Log-Offset'] == '0'
+
+
+def test_store(worker, tmp_path):
+    store = Store(str(tmp_path))
+    try:
+        client = worker(store=store)
+        run_id = submit(client, a=2, b=3)
+
+        for _ in range(2):
+            # results are delivered until deleted
+            resp = client.get('/runs/{}'.format(run_id), params={'wait': 5})
+            assert resp.status_code == StatusCode.TaskCompleted.value
+            assert resp.json()['result'] == [{'rate_prediction': 5.}]
+
+        resp = client.get('/runs/{}/log'.format(run_id))
+        assert resp.status_code == 200
+        assert resp.headers['X-Run-State'] == 'done'
+
+        resp = client.delete('/runs/{}'.format(run_id))
+        assert resp.status_code == 200
+        assert store.get(run_id) is None
+        # lookups do not block the event loop
+        assert store.blocking == []
+    finally:
+        store.close()
+
+
+def test_cache(worker, tmp_path):
+    store = Store(str(tmp_path / 'store'))
+    cache = Cache(path=str(tmp_path / 'cache'))
+    try:
+        client = worker(store=store, cache=cache)
+        run_ids = []
+        for _ in range(2):
+            run_id = submit(client, a=2, b=3)
+            run_ids.append(run_id)
+            resp = client.get('/runs/{}'.format(run_id), params={'wait': 5})
+            assert resp.status_code == StatusCode.TaskCompleted.value
+            assert resp.json()['result'] == [{'rate_prediction': 5.}]
+
+        # the second run is served from the cache
+        assert cache.stats()['hits'] == 1
+        resp = client.get('/runs')
+        assert resp.status_code == 200
+        # neither the store nor the cache block the event loop
+        assert store.blocking == []
+        assert cache.blocking == []
+    finally:
+        store.close()
+
+
+def test_create_app_wraps_callables():
+    app = create_app([('/health', lambda: ({'status': 'ok'}, 200),
+                       ('GET', ))])
+    resp = TestClient(app).get('/health')
+    assert resp.status_code == 200
+    assert resp.json() == {'status': 'ok'}
+
+
+def test_wait_async():
+    task = SumTask()
+    task.configure(a=1)
+    run = RunRegistry().create(task)
+    assert asyncio.run(run.wait_async(timeout=0.01)) is RunState.ACCEPTED
+
+    def execute():
+        run.start()
+        run.poll()
+
+    threading.Timer(0.05, execute).start()
+    assert asyncio.run(run.wait_async(timeout=5)) is RunState.DONE
+
+# ---- END OF <test_asgi.py> ----
@@ -0,0 +1,150 @@
+# This is <test_cache.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Tests of the result cache.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Tests of :py:mod:`ramsis.worker.utils.cache`.
+"""
+
+import errno
+import os
+import pickle
+import time
+
+import numpy as np
+
+from ramsis.worker.utils.cache import ResultCache, canonical_hash
+
+
+def test_canonical_hash():
+    digest = canonical_hash({'a': 1, 'b': {'c': [1, 2], 'd': None}})
+    assert digest == canonical_hash({'b': {'d': None, 'c': [1, 2]}, 'a': 1})
+    assert canonical_hash({'a': 1}) != canonical_hash({'a': 2})
+
+
+def test_canonical_hash_arrays():
+    arr = np.arange(10000.)
+    changed = arr.copy()
+    changed[5000] = -1
+
+    # arrays are hashed by content rather than by their abbreviated repr
+    assert canonical_hash({'a': arr}) == canonical_hash({'a': arr.copy()})
+    assert canonical_hash({'a': arr}) != canonical_hash({'a': changed})
+    digest = canonical_hash({'a': arr.astype('float32')})
+    assert canonical_hash({'a': arr}) != digest
+
+
+def test_get_put():
+    cache = ResultCache()
+    assert cache.get('key') == (False, None)
+
+    cache.put('key', [1., 2.])
+    assert cache.get('key') == (True, [1., 2.])
+    assert cache.stats()['entries'] == 1
+    assert cache.hits == 1
+    assert cache.misses == 1
+    assert cache.hit_ratio == 0.5
+
+
+def test_lru_eviction():
+    size = len(pickle.dumps(np.zeros(100), protocol=pickle.HIGHEST_PROTOCOL))
+    cache = ResultCache(max_bytes=2 * size)
+    cache.put('a', np.zeros(100))
+    cache.put('b', np.zeros(100))
+    # a becomes the most recently used entry
+    assert cache.get('a')[0]
+
+    cache.put('c', np.zeros(100))
+    assert cache.get('b') == (False, None)
+    assert cache.get('a')[0]
+    assert cache.get('c')[0]
+    assert cache.num_bytes <= 2 * size
+
+
+def test_oversized_entry():
+    cache = ResultCache(max_bytes=10)
+    cache.put('key', np.zeros(100))
+    assert cache.get('key') == (False, None)
+    assert cache.num_bytes == 0
+
+
+def test_ttl():
+    cache = ResultCache(ttl=0.05)
+    cache.put('key', 1)
+    assert cache.get('key') == (True, 1)
+    time.sleep(0.1)
+    assert cache.get('key') == (False, None)
+
+
+def test_disk_tier(tmp_path):
+    path = str(tmp_path / 'cache')
+    ResultCache(path=path).put('key', np.arange(3.))
+
+    # entries survive restarts
+    cache = ResultCache(path=path)
+    hit, result = cache.get('key')
+    assert hit
+    np.testing.assert_array_equal(result, np.arange(3.))
+    # and are promoted to the memory tier
+    assert cache.stats()['entries'] == 1
+
+
+def test_disk_tier_ttl(tmp_path):
+    path = str(tmp_path / 'cache')
+    ResultCache(path=path).put('key', 1)
+    time.sleep(0.1)
+    assert ResultCache(path=path, ttl=0.05).get('key') == (False, None)
+    assert not list((tmp_path / 'cache').iterdir())
+
+
+def test_disk_tier_sweep(tmp_path):
+    path = tmp_path / 'cache'
+    cache = ResultCache(path=str(path), ttl=0.05)
+    cache.put('key', 1)
+    # abandoned temporary files
+    (path / 'stale.tmp').write_bytes(b'')
+    os.utime(str(path / 'stale.tmp'), (0, 0))
+    (path / 'recent.tmp').write_bytes(b'')
+    time.sleep(0.1)
+
+    cache.sweep()
+    assert sorted(f.name for f in path.iterdir()) == ['recent.tmp']
+
+
+def test_disk_tier_bound(tmp_path):
+    path = tmp_path / 'cache'
+    data = np.zeros(1024, dtype=np.uint8)
+    size = len(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+    cache = ResultCache(path=str(path), max_disk_bytes=3 * size)
+    for i in range(3):
+        cache.put(str(i), data)
+        # distinct modification times
+        os.utime(str(path / '{}.pickle'.format(i)), (i, i))
+
+    # the oldest entries are evicted
+    cache.put('3', data)
+    assert sorted(f.name for f in path.iterdir()) == ['2.pickle', '3.pickle']
+
+    # oversized entries are not written to disk
+    cache.put('4', np.zeros(4 * size, dtype=np.uint8))
+    assert not (path / '4.pickle').exists()
+
+
+def test_disk_tier_write_failure(tmp_path, monkeypatch):
+    path = tmp_path / 'cache'
+    cache = ResultCache(path=str(path))
+
+    def replace(src, dst):
+        raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+
+    monkeypatch.setattr(os, 'replace', replace)
+    cache.put('key', 1)
+    # the temporary file is removed
+    assert not list(path.iterdir())
+    # while the memory tier is not affected
+    assert cache.get('key') == (True, 1)
+
+# ---- END OF <test_cache.py> ----
@@ -0,0 +1,257 @@
+# This is <test_dispatch.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Tests of the dispatcher.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Tests of :py:mod:`ramsis.worker.utils.dispatch`.
+"""
+
+import json
+import logging
+import sys
+import time
+
+import pytest
+
+from ramsis.utils.protocol import StatusCode
+from ramsis.worker.utils.dispatch import (Backend, Dispatcher,
+                                          NoBackendAvailable)
+
+
+class StubBackend(Backend):
+    """
+    Backend answering requests with the responses configured per method
+    i.e. either tuples of the form `(status, data)` or exceptions raised.
+    """
+
+    def __init__(self, url, size=2, running=0, queued=0, ready=True,
+                 **responses):
+        super().__init__(url)
+        self.reachable = True
+        self.ready = ready
+        self.size = size
+        self.running = running
+        self.queued = queued
+        self.responses = responses
+        self.requests = []
+
+    def request(self, method, path, body=None, headers=None):
+        self.requests.append((method, path))
+        response = self.responses[method]
+        if isinstance(response, Exception):
+            raise response
+        status, data = response
+        return status, [], json.dumps(data).encode('utf-8')
+
+# class StubBackend
+
+
+def accepted(run_id):
+    return StatusCode.TaskAccepted.value, {'run_id': run_id}
+
+
+def test_select_least_loaded():
+    busy = StubBackend('http://busy', running=2)
+    loaded = StubBackend('http://loaded', running=1)
+    idle = StubBackend('http://idle', size=4, running=1)
+    starting = StubBackend('http://starting', ready=False)
+    dispatcher = Dispatcher([busy, loaded, starting, idle])
+
+    assert dispatcher.select() is idle
+    assert dispatcher.select(exclude=[idle]) is loaded
+    # backends without free engines are selected last among ready ones
+    assert dispatcher.select(exclude=[idle, loaded]) is busy
+    assert dispatcher.select(exclude=[idle, loaded, busy]) is starting
+
+    idle.reachable = False
+    assert dispatcher.select() is loaded
+    with pytest.raises(NoBackendAvailable):
+        dispatcher.select(exclude=[loaded, busy, starting])
+
+
+def test_select_pending():
+    first = StubBackend('http://first', POST=accepted('run-1'))
+    second = StubBackend('http://second', POST=accepted('run-2'))
+    dispatcher = Dispatcher([first, second])
+
+    dispatcher.submit('/runs')
+    # runs routed since the last probe count as load
+    assert first.pending == 1
+    assert dispatcher.select() is second
+
+
+def test_submit_skips_unavailable():
+    full = StubBackend('http://full', POST=(503, {'message': 'full'}))
+    down = StubBackend('http://down', running=1,
+                       POST=ConnectionRefusedError())
+    up = StubBackend('http://up', size=4, running=3, POST=accepted('run'))
+    dispatcher = Dispatcher([full, down, up])
+
+    status, _, _ = dispatcher.submit('/runs', body=b'{}')
+    assert status == StatusCode.TaskAccepted.value
+    assert [len(b.requests) for b in (full, down, up)] == [1, 1, 1]
+    assert not down.reachable
+    assert full.reachable
+    assert up.routed == 1
+    assert dispatcher._candidates('run')[0] is up
+
+
+def test_submit_all_full():
+    backends = [StubBackend('http://{}'.format(i),
+                            POST=(503, {'message': 'full'}))
+                for i in range(2)]
+    dispatcher = Dispatcher(backends)
+    status, _, _ = dispatcher.submit('/runs')
+    assert status == 503
+
+    for backend in backends:
+        backend.reachable = False
+    with pytest.raises(NoBackendAvailable):
+        dispatcher.submit('/runs')
+
+
+def test_forward_pinned():
+    first = StubBackend('http://first', POST=accepted('run'),
+                        GET=(200, {'run_id': 'run'}))
+    second = StubBackend('http://second', GET=(404, {}))
+    dispatcher = Dispatcher([first, second])
+    dispatcher.submit('/runs')
+
+    assert dispatcher.forward('run', 'GET', '/runs/run')[0] == 200
+    assert second.requests == []
+
+
+def test_forward_fallback():
+    first = StubBackend('http://first', POST=accepted('run'))
+    second = StubBackend('http://second', GET=(200, {'run_id': 'run'}))
+    dispatcher = Dispatcher([first, second])
+    dispatcher.submit('/runs')
+
+    # e.g. the pinned worker exited; the runs are kept by a shared store
+    first.responses['GET'] = ConnectionResetError()
+    assert dispatcher.forward('run', 'GET', '/runs/run')[0] == 200
+    assert not first.reachable
+    assert dispatcher._candidates('run') == [second]
+
+    # once reachable again, requests are still forwarded to the backend
+    # answering last
+    first.reachable = True
+    assert dispatcher._candidates('run') == [second, first]
+
+
+def test_forward_unknown_run():
+    backends = [StubBackend('http://{}'.format(i), GET=(404, {}))
+                for i in range(2)]
+    dispatcher = Dispatcher(backends)
+    assert dispatcher.forward('run', 'GET', '/runs/run')[0] == 404
+    assert [len(b.requests) for b in backends] == [1, 1]
+    assert 'run' not in dispatcher._pinned
+
+    for backend in backends:
+        backend.reachable = False
+    assert dispatcher.forward('run', 'GET', '/runs/run') is None
+
+
+def test_pin_eviction():
+    backend = StubBackend('http://backend')
+    dispatcher = Dispatcher([backend], max_pinned=2)
+    dispatcher._pin(backend, ['a', 'b'], routed=True)
+    dispatcher._pin(backend, ['a'])
+    dispatcher._pin(backend, ['c'])
+
+    # the least recently routed runs are forgotten first
+    assert list(dispatcher._pinned) == ['a', 'c']
+    assert backend.pending == 2
+    assert backend.routed == 2
+
+
+def test_submit_batch_pins_runs():
+    backend = StubBackend('http://backend',
+                          POST=(StatusCode.TaskAccepted.value,
+                                {'runs': [{'run_id': 'a'},
+                                          {'run_id': 'b'}]}))
+    dispatcher = Dispatcher([backend])
+    dispatcher.submit('/runs/batch')
+    assert list(dispatcher._pinned) == ['a', 'b']
+    assert backend.pending == 2
+
+
+def test_probe():
+    backend = StubBackend(
+        'http://backend', size=0,
+        GET=(503, {'pool': {'size': 4, 'busy': 1},
+                   'runs': {'running': 2, 'queued': 3}}))
+    backend.reachable = False
+    backend.pending = 5
+    dispatcher = Dispatcher([backend])
+
+    assert dispatcher.probe(backend)
+    assert backend.reachable
+    assert not backend.ready
+    assert (backend.size, backend.running, backend.queued,
+            backend.pending) == (4, 2, 3, 0)
+
+    backend.responses['GET'] = (200, {'pool': {'size': 4, 'busy': 1}})
+    assert dispatcher.probe(backend)
+    assert backend.ready
+    assert backend.running == 1
+    assert dispatcher.is_ready
+
+    backend.responses['GET'] = ConnectionRefusedError()
+    assert not dispatcher.probe(backend)
+    assert not backend.reachable
+    assert not dispatcher.is_ready
+
+
+def test_respawn_backoff(caplog):
+    backend = StubBackend('http://backend',
+                          GET=(200, {'pool': {'size': 1, 'busy': 0}}))
+    backend.cmd = [sys.executable, '-c', 'import sys; sys.exit(3)']
+    dispatcher = Dispatcher([backend])
+
+    def spawn_exiting():
+        backend.spawn()
+        backend.process.wait()
+        assert backend.exited
+
+    def exits():
+        return [r.getMessage() for r in caplog.records
+                if 'exited' in r.getMessage()]
+
+    caplog.set_level(logging.WARNING, logger=Dispatcher.LOGGER)
+    spawn_exiting()
+    dispatcher._respawn(backend)
+    process = backend.process
+    assert backend.respawn_at - time.monotonic() <= Backend.RETRY_DELAY
+    assert backend.retry_delay == 2 * Backend.RETRY_DELAY
+    # the exit is logged once; the process is respawned once due
+    dispatcher._respawn(backend)
+    assert backend.process is process
+    assert len(exits()) == 1
+    assert 'returncode=3' in exits()[0]
+
+    backend.respawn_at = time.monotonic()
+    dispatcher._respawn(backend)
+    assert backend.process is not process
+    assert backend.respawn_at is None
+
+    # processes exiting repeatedly are respawned with an increasing delay
+    backend.process.wait()
+    dispatcher._respawn(backend)
+    assert backend.retry_delay == 4 * Backend.RETRY_DELAY
+    assert len(exits()) == 2
+
+    backend.retry_delay = Backend.MAX_RETRY_DELAY - 1
+    spawn_exiting()
+    dispatcher._respawn(backend)
+    assert backend.retry_delay == Backend.MAX_RETRY_DELAY
+
+    # the delay is reset once the worker is ready
+    dispatcher.probe(backend)
+    assert backend.ready
+    assert backend.retry_delay == Backend.RETRY_DELAY
+
+# ---- END OF <test_dispatch.py> ----
@@ -0,0 +1,247 @@
+# This is <test_executor.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Tests of the run executor.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Tests of :py:mod:`ramsis.worker.utils.executor`.
+"""
+
+import threading
+import time
+
+import pytest
+
+from ramsis.worker.utils.executor import (ExecutorShutdown, QueueFull,
+                                          RunExecutor)
+from ramsis.worker.utils.pool import Pool
+from ramsis.worker.utils.registry import Run, RunState
+from ramsis.worker.utils.task import Task
+
+
+class BlockingTask(Task):
+    """
+    Task finishing after `duration` seconds or once :py:meth:`finish` is
+    called.
+    """
+
+    def __init__(self, duration=None, started=None):
+        super().__init__()
+        self.is_configured = True
+        self.cancelled = False
+        self.prepare_timeout = None
+        self._duration = duration
+        self._started = started
+        self._done = threading.Event()
+
+    @property
+    def result(self):
+        return None
+
+    @property
+    def returncode(self):
+        return self.poll()
+
+    def prepare(self, timeout=None):
+        self.prepare_timeout = timeout
+
+    def poll(self):
+        if not self._done.is_set():
+            return None
+        return 1 if self.cancelled else 0
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+
+    def finish(self):
+        self._done.set()
+
+    def cancel(self):
+        self.cancelled = True
+        self._done.set()
+        return True
+
+    def _run(self):
+        if self._started is not None:
+            self._started.append(self)
+        if self._duration is not None:
+            threading.Timer(self._duration, self._done.set).start()
+
+# class BlockingTask
+
+
+class PooledTask(BlockingTask):
+    """
+    Task leasing a resource from `pool` when being prepared.
+    """
+
+    def __init__(self, pool, duration=None):
+        super().__init__(duration=duration)
+        self._pool = pool
+
+    def prepare(self, timeout=None):
+        super().prepare(timeout=timeout)
+        self._pool.acquire(timeout=timeout)
+
+# class PooledTask
+
+
+@pytest.fixture
+def executor():
+    executor = RunExecutor(max_workers=1, max_queue_size=3)
+    yield executor
+    executor.shutdown(wait=False)
+
+
+def occupy(executor):
+    """
+    Occupy the executor's only worker thread.
+
+    :returns: The task to be finished in order to release the thread
+    """
+    started = []
+    task = BlockingTask(started=started)
+    executor.submit(Run(task))
+    deadline = time.monotonic() + 5
+    while not started and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert started
+    return task
+
+
+def test_positions(executor):
+    occupy(executor)
+    runs = [Run(BlockingTask()) for _ in range(3)]
+
+    assert executor.submit(runs[0], priority=1) == 1
+    assert executor.submit(runs[1], priority=1) == 2
+    # lower values come first
+    assert executor.submit(runs[2], priority=0) == 1
+
+    assert executor.num_queued == 3
+    assert executor.num_running == 1
+    assert [executor.position(r.id) for r in runs] == [2, 3, 1]
+
+
+def test_submit_many_positions():
+    executor = RunExecutor(max_workers=1)
+    try:
+        occupy(executor)
+        executor.submit(Run(BlockingTask()), priority=0)
+        executor.submit(Run(BlockingTask()), priority=2)
+
+        runs = [Run(BlockingTask()) for _ in range(3)]
+        assert executor.submit_many(runs, priority=1) == [2, 3, 4]
+        assert [executor.position(r.id) for r in runs] == [2, 3, 4]
+        assert executor.submit_many([]) == []
+    finally:
+        executor.shutdown(wait=False)
+
+
+def test_queue_full(executor):
+    occupy(executor)
+    for _ in range(3):
+        executor.submit(Run(BlockingTask()))
+
+    with pytest.raises(QueueFull):
+        executor.submit(Run(BlockingTask()))
+    assert executor.retry_after() >= 1
+
+
+def test_submit_many_all_or_nothing(executor):
+    occupy(executor)
+    executor.submit(Run(BlockingTask()))
+
+    with pytest.raises(QueueFull):
+        executor.submit_many([Run(BlockingTask()) for _ in range(3)])
+    assert executor.num_queued == 1
+
+
+def test_cancel_queued(executor):
+    occupy(executor)
+    run = Run(BlockingTask())
+    other = Run(BlockingTask())
+    executor.submit(run)
+    executor.submit(other)
+
+    assert executor.cancel(run.id)
+    assert not executor.cancel(run.id)
+    assert executor.position(run.id) is None
+    assert executor.position(other.id) == 1
+
+
+def test_priority_order(executor):
+    blocker = occupy(executor)
+    started = []
+    runs = [Run(BlockingTask(duration=0, started=started))
+            for _ in range(3)]
+    for run, priority in zip(runs, (2, 0, 1)):
+        executor.submit(run, priority=priority)
+
+    blocker.finish()
+    for run in runs:
+        assert run.wait(timeout=5) is RunState.DONE
+    assert started == [runs[1].task, runs[2].task, runs[0].task]
+
+
+def test_shutdown(executor):
+    blocker = occupy(executor)
+    run = Run(BlockingTask())
+    executor.submit(run)
+
+    executor.shutdown(wait=False)
+    assert run.state is RunState.FAILED
+    assert run.error == 'Worker shut down.'
+    with pytest.raises(ExecutorShutdown):
+        executor.submit(Run(BlockingTask()))
+    blocker.finish()
+
+
+def test_deadline_exceeded():
+    executor = RunExecutor(max_workers=1, run_timeout=0.1)
+    try:
+        task = BlockingTask()
+        run = Run(task)
+        executor.submit(run)
+
+        assert run.wait(timeout=5) is RunState.FAILED
+        assert run.cancelled
+        assert task.cancelled
+        assert run.error == 'Deadline exceeded (0.1s).'
+        assert task.prepare_timeout == 0.1
+    finally:
+        executor.shutdown(wait=False)
+
+
+def test_deadline_per_run():
+    executor = RunExecutor(max_workers=1, run_timeout=0.05)
+    try:
+        run = Run(BlockingTask(duration=0.2), timeout=5)
+        executor.submit(run)
+        assert run.wait(timeout=5) is RunState.DONE
+        assert not run.cancelled
+    finally:
+        executor.shutdown(wait=False)
+
+
+def test_deadline_includes_start():
+    pool = Pool(lambda: object(), size=1)
+    pool.start()
+    executor = RunExecutor(max_workers=2)
+    try:
+        # the only resource is leased
+        resource = pool.acquire()
+        start = time.monotonic()
+        run = Run(PooledTask(pool), timeout=0.1)
+        executor.submit(run)
+
+        assert run.wait(timeout=5) is RunState.FAILED
+        assert time.monotonic() - start < 2
+        assert 'timeout=0.1' in run.error
+        pool.release(resource)
+    finally:
+        executor.shutdown(wait=False)
+
+# ---- END OF <test_executor.py> ----
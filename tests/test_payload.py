@@ -0,0 +1,209 @@
+# This is <test_payload.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Tests of the streaming input message facilities.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Tests of :py:mod:`ramsis.worker.utils.payload`.
+"""
+
+import gzip
+import json
+import zlib
+
+import numpy as np
+import pytest
+
+from marshmallow import Schema, fields
+
+from ramsis.worker.utils import import_optional
+from ramsis.worker.utils.payload import (CHUNK_SIZE, PayloadDecoder,
+                                         PayloadError, PayloadTooLarge,
+                                         UnsupportedEncoding)
+from ramsis.worker.utils.schema import Array, array_paths
+
+
+MESSAGE = {
+    'scenario': 'brackets ] [ } { , : and "quotes" \\ \\" ',
+    'model_parameters': {
+        'x': 1.5,
+        'rates': [0.5, 1, -2e-3, 4.25],
+        'nested': {'rates': [1, 2]},
+        'sets': [{'rates': [3, 4]}, {'rates': []}]}}
+
+PATHS = [('model_parameters', 'rates'),
+         ('model_parameters', 'sets', None, 'rates')]
+
+
+def decode(body, chunk_size=None, **kwargs):
+    decoder = PayloadDecoder(**kwargs)
+    chunk_size = chunk_size or max(len(body), 1)
+    for i in range(0, len(body), chunk_size):
+        decoder.feed(body[i:i + chunk_size])
+    return decoder.close()
+
+
+class ParameterSchema(Schema):
+    rates = Array()
+    sets = fields.Nested('SetSchema', many=True)
+
+
+class SetSchema(Schema):
+    rates = Array()
+
+
+class MessageSchema(Schema):
+    model_parameters = fields.Nested(ParameterSchema)
+
+
+def test_array_paths():
+    assert sorted(array_paths(MessageSchema()), key=len) == PATHS
+
+
+def test_plain():
+    body = json.dumps(MESSAGE).encode('utf-8')
+    assert decode(body, chunk_size=3) == MESSAGE
+    assert decode(b'') == {}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 7, 64, None])
+def test_arrays(chunk_size):
+    body = json.dumps(MESSAGE).encode('utf-8')
+    msg = decode(body, chunk_size=chunk_size, arrays=PATHS)
+
+    params = msg['model_parameters']
+    assert msg['scenario'] == MESSAGE['scenario']
+    assert params['x'] == 1.5
+    assert params['nested'] == {'rates': [1, 2]}
+    assert isinstance(params['rates'], np.ndarray)
+    assert params['rates'].dtype == np.float64
+    np.testing.assert_array_equal(params['rates'], [0.5, 1, -2e-3, 4.25])
+    np.testing.assert_array_equal(params['sets'][0]['rates'], [3, 4])
+    assert params['sets'][1]['rates'].size == 0
+
+
+def test_long_string():
+    msg = {'scenario': 'x\\"' * 100000,
+           'model_parameters': {'rates': list(range(1000))}}
+    body = json.dumps(msg).encode('utf-8')
+    decoded = decode(body, chunk_size=1000, arrays=PATHS)
+    assert decoded['scenario'] == msg['scenario']
+    np.testing.assert_array_equal(decoded['model_parameters']['rates'],
+                                  np.arange(1000))
+
+
+@pytest.mark.parametrize('encoding, compress', [
+    ('gzip', gzip.compress),
+    ('deflate', zlib.compress)])
+def test_encodings(encoding, compress):
+    body = compress(json.dumps(MESSAGE).encode('utf-8'))
+    msg = decode(body, chunk_size=16, encoding=encoding, arrays=PATHS)
+    np.testing.assert_array_equal(msg['model_parameters']['rates'],
+                                  [0.5, 1, -2e-3, 4.25])
+
+
+def test_unsupported_encoding():
+    with pytest.raises(UnsupportedEncoding):
+        PayloadDecoder(encoding='br')
+
+
+@pytest.mark.parametrize('arrays', [(), PATHS])
+def test_too_large(arrays):
+    body = json.dumps(MESSAGE).encode('utf-8')
+    with pytest.raises(PayloadTooLarge):
+        decode(body, chunk_size=8, arrays=arrays, max_bytes=32)
+
+
+def test_too_large_compressed():
+    body = gzip.compress(b'{"scenario": "' + b'x' * 10**6 + b'"}')
+    with pytest.raises(PayloadTooLarge):
+        decode(body, encoding='gzip', max_bytes=1024)
+
+
+@pytest.mark.parametrize('body', [
+    b'{"model_parameters": {"rates": [1, "a"]}}',
+    b'{"model_parameters": {"rates": [1, [2]]}}',
+    b'{"model_parameters": {"rates": [1,, 2]}}',
+    b'{"model_parameters": {"rates": [1, 2}'])
+def test_malformed_array(body):
+    with pytest.raises(PayloadError):
+        decode(body, chunk_size=4, arrays=PATHS)
+
+
+@pytest.mark.parametrize('arrays', [(), PATHS])
+def test_malformed(arrays):
+    with pytest.raises(PayloadError):
+        decode(b'{"scenario": ', arrays=arrays)
+
+
+@pytest.fixture
+def zstandard():
+    zstandard = import_optional('zstandard')
+    if zstandard is None:
+        pytest.skip("requires 'zstandard'")
+    return zstandard
+
+
+@pytest.mark.parametrize('kwargs', [
+    {},
+    {'write_checksum': True},
+    {'write_content_size': False},
+    {'level': 19}])
+def test_zstd(zstandard, kwargs):
+    data = json.dumps(MESSAGE).encode('utf-8')
+    body = zstandard.ZstdCompressor(**kwargs).compress(data)
+    for chunk_size in (1, 16, None):
+        msg = decode(body, chunk_size=chunk_size, encoding='zstd',
+                     arrays=PATHS)
+        np.testing.assert_array_equal(msg['model_parameters']['rates'],
+                                      [0.5, 1, -2e-3, 4.25])
+
+
+def test_zstd_frames(zstandard):
+    # streamed (i.e. without content size) and skippable frames
+    data = json.dumps(MESSAGE).encode('utf-8')
+    compressor = zstandard.ZstdCompressor()
+    chunker = compressor.chunker(chunk_size=32)
+    body = b''.join(chunker.compress(data)) + b''.join(chunker.finish())
+    skippable = b'\x50\x2a\x4d\x18' + (3).to_bytes(4, 'little') + b'abc'
+    assert decode(skippable + body, chunk_size=5, encoding='zstd') == MESSAGE
+
+    # concatenated frames
+    half = len(data) // 2
+    body = compressor.compress(data[:half]) + compressor.compress(data[half:])
+    assert decode(body, chunk_size=3, encoding='zstd') == MESSAGE
+
+
+def test_zstd_truncated(zstandard):
+    body = zstandard.ZstdCompressor(write_checksum=True).compress(
+        json.dumps(MESSAGE).encode('utf-8'))
+    for end in (0, 3, 10, len(body) - 1):
+        with pytest.raises(PayloadError):
+            decode(body[:end], encoding='zstd')
+    with pytest.raises(PayloadError):
+        decode(b'not zstd', encoding='zstd')
+
+
+def test_zstd_bomb(zstandard):
+    body = zstandard.ZstdCompressor().compress(
+        b'{"scenario": "' + b'x' * 32 * 1024**2 + b'"}')
+    assert len(body) < 16 * 1024
+
+    decoder = PayloadDecoder(encoding='zstd', max_bytes=1024)
+    sizes = []
+    consume = decoder._consume
+
+    def record(chunk):
+        sizes.append(len(chunk))
+        consume(chunk)
+
+    decoder._consume = record
+    with pytest.raises(PayloadTooLarge):
+        decoder.feed(body)
+    # decompression stops once the limit is exceeded
+    assert sizes and max(sizes) <= CHUNK_SIZE
+    assert sum(sizes) <= 1024 + CHUNK_SIZE
+
+# ---- END OF <test_payload.py> ----
@@ -0,0 +1,168 @@
+# This is <test_pool.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Tests of the resource pool.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Tests of :py:mod:`ramsis.worker.utils.pool`.
+"""
+
+import itertools
+import threading
+import time
+
+import pytest
+
+from ramsis.worker.utils.pool import (Pool, PoolError, PoolExhausted,
+                                      PoolUnavailable)
+
+
+class Factory(object):
+    """
+    Resource factory failing the first `failures` calls.
+    """
+
+    def __init__(self, failures=0, delay=None):
+        self.failures = failures
+        self.delay = delay
+        self.destroyed = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        if self.delay is not None:
+            time.sleep(self.delay)
+        with self._lock:
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError('engine failed to start')
+            return next(self._counter)
+
+    def destroy(self, resource):
+        self.destroyed.append(resource)
+
+# class Factory
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_invalid_size():
+    with pytest.raises(PoolError):
+        Pool(Factory(), size=0)
+
+
+def test_acquire_release():
+    pool = Pool(Factory(), size=2)
+    pool.start()
+    assert pool.is_ready
+    assert pool.idle == 2
+
+    resource = pool.acquire()
+    assert pool.busy == 1
+    pool.release(resource)
+    assert pool.busy == 0
+
+    with pool.lease() as resource:
+        assert resource in (0, 1)
+        assert pool.idle == 1
+    assert pool.idle == 2
+
+
+def test_exhausted():
+    pool = Pool(Factory(), size=1)
+    pool.start()
+    with pool.lease():
+        with pytest.raises(PoolExhausted):
+            pool.acquire(timeout=0.05)
+
+
+def test_background_start():
+    pool = Pool(Factory(delay=0.1), size=1)
+    pool.start(background=True)
+    # clients are queued while the resources are being created
+    assert pool.acquire(timeout=5) == 0
+    assert pool.wait_started(timeout=5)
+
+
+def test_replace_unhealthy():
+    factory = Factory()
+    unhealthy = set()
+    pool = Pool(factory, size=1, health_check=lambda r: r not in unhealthy,
+                destroy=factory.destroy)
+    pool.start()
+
+    unhealthy.add(0)
+    assert pool.acquire(timeout=1) == 1
+    assert factory.destroyed == [0]
+    assert pool.busy == 1
+
+
+def test_unavailable():
+    factory = Factory(failures=2)
+    pool = Pool(factory, size=2)
+    pool.RETRY_DELAY = 60
+    pool.start()
+
+    assert not pool.is_ready
+    assert not pool.is_healthy
+    assert pool.lost == 2
+    assert isinstance(pool.error, RuntimeError)
+    # fail fast rather than blocking
+    with pytest.raises(PoolUnavailable):
+        pool.acquire()
+    pool.close()
+
+
+def test_recreate_lost():
+    factory = Factory(failures=1)
+    pool = Pool(factory, size=2)
+    pool.RETRY_DELAY = 0.01
+    pool.start()
+
+    # one resource failed to be created; the pool is degraded but healthy
+    assert pool.is_healthy
+    assert pool.acquire(timeout=5) == 0
+    assert wait_for(lambda: pool.lost == 0)
+    assert pool.error is None
+    assert pool.acquire(timeout=5) == 1
+    pool.close()
+
+
+def test_failed_replacement_is_recreated():
+    factory = Factory()
+    unhealthy = set()
+    pool = Pool(factory, size=1, health_check=lambda r: r not in unhealthy,
+                destroy=factory.destroy)
+    pool.RETRY_DELAY = 0.2
+    pool.start()
+
+    unhealthy.add(0)
+    factory.failures = 1
+    with pytest.raises(PoolUnavailable):
+        pool.acquire(timeout=5)
+    assert pool.lost == 1
+
+    # the slot is not lost for good: the replacement is recreated
+    assert wait_for(lambda: pool.lost == 0)
+    assert pool.acquire(timeout=5) == 1
+    pool.close()
+
+
+def test_close():
+    factory = Factory()
+    pool = Pool(factory, size=2, destroy=factory.destroy)
+    pool.start()
+    pool.close()
+    assert sorted(factory.destroyed) == [0, 1]
+    assert pool.idle == 0
+
+# ---- END OF <test_pool.py> ----
@@ -0,0 +1,133 @@
+# This is <test_preload.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Tests of preloading static model data into MATLAB engines.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Tests of :py:class:`ramsis.worker.SaSS.task.Preload`.
+"""
+
+import os
+
+import pytest
+
+from ramsis.worker.SaSS.task import Preload, PreloadError, SaSSTask
+from ramsis.worker.utils.pool import Pool
+
+
+class Engine(object):
+    """
+    Stand-in for a MATLAB engine recording the expressions evaluated.
+    """
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.evaluated = []
+
+    def eval(self, expr, nargout=0):
+        if self.fail:
+            raise RuntimeError('load failed')
+        self.evaluated.append(expr)
+
+# class Engine
+
+
+@pytest.fixture
+def grid(tmp_path):
+    path = tmp_path / 'grid.mat'
+    path.write_bytes(b'grid')
+    return path
+
+
+def test_invalid_name(grid):
+    for name in ('1grid', 'grid-1', 'grid;', 'g' * 64):
+        with pytest.raises(PreloadError):
+            Preload({name: str(grid)})
+
+
+def test_load(grid):
+    preload = Preload({'grid': str(grid)})
+    engine = Engine()
+    assert preload.load(engine) == ['grid']
+    assert engine.evaluated == [
+        "global grid; grid = load('{}');".format(grid)]
+
+    # resident variables are not reloaded
+    assert preload.load(engine) == []
+    assert len(engine.evaluated) == 1
+
+    # variables are loaded per engine
+    assert preload.load(Engine()) == ['grid']
+
+
+def test_reload_on_change(grid):
+    preload = Preload({'grid': str(grid)})
+    engine = Engine()
+    preload.load(engine)
+
+    grid.write_bytes(b'modified grid')
+    assert preload.load(engine) == ['grid']
+    assert preload.load(engine) == []
+
+
+def test_relative_path(grid, monkeypatch):
+    monkeypatch.chdir(str(grid.parent))
+    preload = Preload({'grid': 'grid.mat'})
+    assert preload.variables == {'grid': str(grid)}
+
+
+def test_quoted_path(tmp_path):
+    path = tmp_path / "it's.mat"
+    path.write_bytes(b'grid')
+    engine = Engine()
+    Preload({'grid': str(path)}).load(engine)
+    assert engine.evaluated == [
+        "global grid; grid = load('{}');".format(
+            str(path).replace("'", "''"))]
+
+
+def test_missing_file(tmp_path):
+    preload = Preload({'grid': str(tmp_path / 'missing.mat')})
+    with pytest.raises(PreloadError):
+        preload.signatures()
+    with pytest.raises(PreloadError):
+        preload.load(Engine())
+
+
+def test_load_failure(grid):
+    preload = Preload({'grid': str(grid)})
+    engine = Engine(fail=True)
+    with pytest.raises(PreloadError):
+        preload.load(engine)
+
+    # the variable is loaded next time
+    engine.fail = False
+    assert preload.load(engine) == ['grid']
+
+
+def test_prepare(grid):
+    engine = Engine()
+    pool = Pool(lambda: engine)
+    pool.start()
+    preload = Preload({'grid': str(grid)})
+
+    task = SaSSTask('model', pool, preload=preload)
+    task.configure(a=1)
+    task.prepare(timeout=1)
+    assert task.engine is engine
+    assert len(engine.evaluated) == 1
+    task.reset()
+    assert pool.idle == 1
+
+    # the engine is returned to the pool if preloading failed
+    os.remove(str(grid))
+    task = SaSSTask('model', pool, preload=preload)
+    task.configure(a=1)
+    with pytest.raises(PreloadError):
+        task.prepare(timeout=1)
+    assert task.engine is None
+    assert pool.idle == 1
+
+# ---- END OF <test_preload.py> ----
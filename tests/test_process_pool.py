@@ -0,0 +1,160 @@
+# This is <test_process_pool.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Tests of the process pool task backend.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Tests of :py:class:`ramsis.worker.utils.task.ProcessPoolTask`.
+"""
+
+import time
+
+import numpy as np
+import pytest
+
+from ramsis.worker.utils.executor import RunExecutor
+from ramsis.worker.utils.registry import Run, RunState
+from ramsis.worker.utils.task import (NotConfigured, ProcessPoolTask,
+                                      create_process_pool)
+
+
+# NOTE(damb): Functions executed by the pool must be picklable.
+def add(a, b):
+    print('adding')
+    return a + b
+
+
+def fail():
+    raise ValueError('boom')
+
+
+def scale(arr, factor):
+    return arr * factor
+
+
+def sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+@pytest.fixture
+def pool():
+    pool = create_process_pool(max_workers=1)
+    yield pool
+    pool.shutdown(wait=True)
+
+
+def execute(task, timeout=30, **kwargs):
+    task.configure(**kwargs)
+    task()
+    task.wait(timeout=timeout)
+    return task.poll()
+
+
+def test_result(pool):
+    task = ProcessPoolTask(add, pool)
+    assert execute(task, a=1, b=2) == 0
+    assert task.result == 3
+    assert task.stdout == 'adding\n'
+    assert task.stderr == ''
+
+    task.reset()
+    assert not task.is_configured
+    assert task.result is None
+
+
+def test_failure(pool):
+    task = ProcessPoolTask(fail, pool)
+    assert execute(task) == 1
+    assert task.result is None
+    assert 'ValueError: boom' in task.stderr
+
+
+def test_shared_memory(pool):
+    arr = np.arange(1024, dtype=np.float64)
+    task = ProcessPoolTask(scale, pool, shm_threshold=1)
+    assert execute(task, arr=arr, factor=2) == 0
+    np.testing.assert_array_equal(task.result, arr * 2)
+    # blocks are released as soon as the result was collected
+    assert task._shm == []
+
+
+def test_not_configured(pool):
+    with pytest.raises(NotConfigured):
+        ProcessPoolTask(add, pool)()
+
+
+def test_wait_timeout(pool):
+    task = ProcessPoolTask(sleep, pool)
+    task.configure(seconds=0.5)
+    task()
+    task.wait(timeout=0.01)
+    assert task.poll() is None
+
+    task.wait(timeout=30)
+    assert task.poll() == 0
+    assert task.result == 0.5
+
+
+def test_cancel_pending(pool):
+    running = ProcessPoolTask(sleep, pool)
+    running.configure(seconds=0.5)
+    running()
+
+    task = ProcessPoolTask(add, pool)
+    task.configure(a=1, b=2)
+    task()
+    assert task.cancel()
+    assert task.poll() == 1
+    assert task.stderr == 'Task cancelled.\n'
+    assert not task.cancel()
+
+    running.wait(timeout=30)
+    assert running.poll() == 0
+
+
+def test_cancel_running(pool):
+    task = ProcessPoolTask(sleep, pool)
+    task.configure(seconds=0.5)
+    task()
+    time.sleep(0.2)
+
+    assert task.cancel()
+    assert task.poll() == 1
+    assert task.result is None
+    assert 'Task cancelled.' in task.stderr
+
+
+def test_cancel_interrupts_call(pool):
+    task = ProcessPoolTask(sleep, pool)
+    task.configure(seconds=30)
+    task()
+    time.sleep(0.5)
+
+    start = time.monotonic()
+    assert task.cancel()
+    assert time.monotonic() - start < ProcessPoolTask.CANCEL_TIMEOUT + 1
+
+    # the worker process is returned to the pool
+    other = ProcessPoolTask(add, pool)
+    assert execute(other, timeout=10, a=1, b=2) == 0
+    assert other.result == 3
+
+
+def test_deadline(pool):
+    executor = RunExecutor(max_workers=1)
+    try:
+        task = ProcessPoolTask(sleep, pool)
+        task.configure(seconds=0.5)
+        run = Run(task, timeout=0.1)
+        executor.submit(run)
+
+        assert run.wait(timeout=30) is RunState.FAILED
+        assert run.error == 'Deadline exceeded (0.1s).'
+        assert task.poll() == 1
+    finally:
+        executor.shutdown()
+
+# ---- END OF <test_process_pool.py> ----
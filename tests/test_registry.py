@@ -0,0 +1,243 @@
+# This is <test_registry.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Tests of the run registry.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Tests of :py:mod:`ramsis.worker.utils.registry`.
+"""
+
+import threading
+import time
+
+import pytest
+
+from ramsis.worker.utils.registry import (InvalidStateTransition, Run,
+                                          RunRegistry, RunState)
+from ramsis.worker.utils.task import Task
+
+
+class FakeTask(Task):
+    """
+    Asynchronous task finished by means of :py:meth:`finish`. With `block`
+    starting the task blocks until the event is set.
+    """
+
+    def __init__(self, block=None):
+        super().__init__()
+        self.is_configured = True
+        self.started = threading.Event()
+        self.cancelled = False
+        self.was_reset = False
+        self._block = block
+        self._returncode = None
+
+    @property
+    def result(self):
+        return 42 if self._returncode == 0 else None
+
+    @property
+    def returncode(self):
+        return self._returncode
+
+    def poll(self):
+        return self._returncode
+
+    def finish(self, returncode=0):
+        self._returncode = returncode
+
+    def cancel(self):
+        self.cancelled = True
+        self._returncode = 1
+        return True
+
+    def reset(self):
+        self.was_reset = True
+
+    def _run(self):
+        self.started.set()
+        if self._block is not None:
+            self._block.wait(5)
+
+# class FakeTask
+
+
+class FailingTask(FakeTask):
+
+    def _run(self):
+        raise RuntimeError('boom')
+
+
+def test_run_lifecycle():
+    task = FakeTask()
+    run = Run(task)
+    assert run.state is RunState.ACCEPTED
+
+    run.start()
+    assert run.state is RunState.RUNNING
+    assert run.poll() is RunState.RUNNING
+
+    task.finish()
+    assert run.poll() is RunState.DONE
+    assert run.is_finished
+    assert run.wait(timeout=0) is RunState.DONE
+
+
+def test_run_failed_returncode():
+    task = FakeTask()
+    run = Run(task)
+    run.start()
+    task.finish(returncode=1)
+    assert run.poll() is RunState.FAILED
+
+
+@pytest.mark.parametrize('states', [
+    (RunState.DONE, ),
+    (RunState.RUNNING, RunState.ACCEPTED),
+    (RunState.RUNNING, RunState.DONE, RunState.RUNNING),
+    (RunState.FAILED, RunState.DONE), ])
+def test_invalid_transition(states):
+    run = Run(FakeTask())
+    for state in states[:-1]:
+        run.transition(state)
+    with pytest.raises(InvalidStateTransition):
+        run.transition(states[-1])
+
+
+def test_fail_finished_run():
+    run = Run(FakeTask())
+    run.fail('first')
+    run.fail('second')
+    assert run.state is RunState.FAILED
+    assert run.error == 'first'
+
+
+def test_done_callbacks():
+    run = Run(FakeTask())
+    called = []
+    run.add_done_callback(called.append)
+    run.transition(RunState.RUNNING)
+    assert called == []
+
+    run.transition(RunState.DONE)
+    assert called == [run]
+
+    # finished runs invoke callbacks immediately
+    run.add_done_callback(called.append)
+    assert called == [run, run]
+
+
+def test_listeners():
+    run = Run(FakeTask())
+    states = []
+
+    def listener(r):
+        states.append(r.state)
+
+    run.add_listener(listener)
+    run.transition(RunState.RUNNING)
+    run.remove_listener(listener)
+    run.transition(RunState.DONE)
+    assert states == [RunState.RUNNING]
+
+
+def test_cancel_running():
+    task = FakeTask()
+    run = Run(task)
+    run.start()
+
+    assert run.cancel()
+    assert task.cancelled
+    assert run.cancelled
+    assert run.state is RunState.FAILED
+    assert run.error == 'Run cancelled.'
+    assert not run.cancel()
+
+
+def test_cancel_accepted():
+    task = FakeTask()
+    run = Run(task)
+    assert run.cancel(error='Deadline exceeded.')
+    assert not task.cancelled
+    assert run.state is RunState.FAILED
+    assert run.error == 'Deadline exceeded.'
+
+
+def test_cancel_while_starting():
+    block = threading.Event()
+    task = FakeTask(block=block)
+    run = Run(task)
+    starter = threading.Thread(target=run.start)
+    starter.start()
+    assert task.started.wait(5)
+
+    # the run's lock is not held while the task is started
+    assert run.cancel()
+    assert run.state is RunState.FAILED
+    assert not task.cancelled
+
+    block.set()
+    starter.join(5)
+    assert task.cancelled
+
+
+def test_start_failure():
+    run = Run(FailingTask())
+    with pytest.raises(RuntimeError):
+        run.start()
+    assert run.state is RunState.FAILED
+    assert run.error == 'boom'
+
+
+def test_wait_timeout():
+    run = Run(FakeTask())
+    assert run.wait(timeout=0.01) is RunState.ACCEPTED
+
+
+def test_registry():
+    registry = RunRegistry()
+    runs = [registry.create(FakeTask()) for _ in range(3)]
+    run = registry.create(FakeTask(), run_id='run', timeout=10)
+
+    assert len(registry) == 4
+    assert 'run' in registry
+    assert registry.get('run') is run
+    assert run.timeout == 10
+    assert registry.runs() == runs + [run]
+
+    assert registry.remove('run') is run
+    assert registry.remove('run') is None
+    assert registry.get('run') is None
+    assert len(registry) == 3
+
+
+def test_registry_retention():
+    registry = RunRegistry(retention=0.05)
+    finished = registry.create(FakeTask())
+    finished.fail()
+    pending = registry.create(FakeTask())
+
+    # eviction is rate-limited
+    time.sleep(0.1)
+    assert registry.evict() == []
+
+    assert registry.evict(force=True) == [finished]
+    assert finished.task.was_reset
+    assert not pending.task.was_reset
+    assert registry.runs() == [pending]
+
+
+def test_registry_max_finished():
+    registry = RunRegistry(max_finished=2)
+    runs = [registry.create(FakeTask()) for _ in range(3)]
+    for run in runs:
+        run.fail()
+
+    # exceeding the maximum triggers eviction right away
+    pending = registry.create(FakeTask())
+    assert runs[0].task.was_reset
+    assert registry.runs() == runs[1:] + [pending]
+
+# ---- END OF <test_registry.py> ----
@@ -0,0 +1,163 @@
+# This is <test_response.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Tests of the result response facilities.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Tests of :py:mod:`ramsis.worker.utils.response`.
+"""
+
+import gzip
+
+import numpy as np
+import pytest
+
+from ramsis.worker.utils.response import (MIN_COMPRESS_SIZE, ResponseCache,
+                                          conditional, negotiate_encoding,
+                                          represent)
+
+
+BODY = bytes(range(256)) * 16
+
+
+@pytest.fixture
+def rep():
+    return represent(BODY, 'application/x-npy')
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding('gzip, deflate') == 'gzip'
+    assert negotiate_encoding('br') is None
+    assert negotiate_encoding('') is None
+    assert negotiate_encoding('gzip;q=0') is None
+
+
+def test_represent(rep):
+    assert rep.body == BODY
+    assert rep.encoding is None
+    # strong ETags depend on the content only
+    assert rep.etag == represent(BODY, 'application/x-npy').etag
+    assert rep.etag != represent(BODY[1:], 'application/x-npy').etag
+
+
+def test_represent_compressed(rep):
+    compressed = represent(BODY, 'application/x-npy', encoding='gzip')
+    assert compressed.encoding == 'gzip'
+    assert gzip.decompress(compressed.body) == BODY
+    assert compressed.etag == rep.etag + '-gzip'
+    # compression is deterministic
+    assert compressed == represent(BODY, 'application/x-npy',
+                                   encoding='gzip')
+
+
+def test_represent_small():
+    small = represent(b'x' * (MIN_COMPRESS_SIZE - 1), 'application/json',
+                      encoding='gzip')
+    assert small.encoding is None
+
+
+def test_conditional_full(rep):
+    status, body, headers = conditional(rep, {})
+    assert status == 200
+    assert body == BODY
+    assert headers['ETag'] == '"{}"'.format(rep.etag)
+    assert headers['Accept-Ranges'] == 'bytes'
+    assert 'Content-Encoding' not in headers
+
+
+@pytest.mark.parametrize('if_none_match', [
+    '"{etag}"', 'W/"{etag}"', '"other", "{etag}"', '*'])
+def test_not_modified(rep, if_none_match):
+    status, body, headers = conditional(
+        rep, {'If-None-Match': if_none_match.format(etag=rep.etag)})
+    assert status == 304
+    assert body == b''
+    assert headers['ETag'] == '"{}"'.format(rep.etag)
+
+
+def test_modified(rep):
+    status, body, _ = conditional(rep, {'If-None-Match': '"other"'})
+    assert status == 200
+    assert body == BODY
+
+
+def test_range(rep):
+    status, body, headers = conditional(rep, {'Range': 'bytes=10-19'})
+    assert status == 206
+    assert body == BODY[10:20]
+    assert headers['Content-Range'] == 'bytes 10-19/{}'.format(len(BODY))
+
+    status, body, _ = conditional(rep, {'Range': 'bytes=-5'})
+    assert status == 206
+    assert body == BODY[-5:]
+
+
+def test_range_not_satisfiable(rep):
+    status, body, headers = conditional(
+        rep, {'Range': 'bytes={}-'.format(len(BODY))})
+    assert status == 416
+    assert body == b''
+    assert headers['Content-Range'] == 'bytes */{}'.format(len(BODY))
+
+
+def test_multiple_ranges(rep):
+    status, body, _ = conditional(rep, {'Range': 'bytes=0-1,5-6'})
+    assert status == 200
+    assert body == BODY
+
+
+def test_if_range(rep):
+    headers = {'Range': 'bytes=0-9', 'If-Range': '"{}"'.format(rep.etag)}
+    status, body, _ = conditional(rep, headers)
+    assert status == 206
+    assert body == BODY[:10]
+
+    # the representation changed i.e. the full representation is returned
+    headers['If-Range'] = '"other"'
+    status, body, _ = conditional(rep, headers)
+    assert status == 200
+    assert body == BODY
+
+
+def test_compressed_range():
+    rep = represent(BODY, 'application/x-npy', encoding='gzip')
+    status, body, headers = conditional(rep, {'Range': 'bytes=0-9'})
+    # ranges apply to the encoded representation
+    assert status == 206
+    assert body == rep.body[:10]
+    assert headers['Content-Encoding'] == 'gzip'
+
+
+def test_cache(rep):
+    cache = ResponseCache(max_bytes=3 * len(BODY))
+    assert cache.get('run', 'application/x-npy') is None
+
+    cache.put('run', 'application/x-npy', None, None, rep)
+    assert cache.get('run', 'application/x-npy') == rep
+    assert cache.get('run', 'application/x-npy', encoding='gzip') is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 2
+
+    result = np.zeros(len(BODY) // 8)
+    cache.put_result('run', result, batch_size=2)
+    assert cache.get_result('run') == (result, 2)
+
+    cache.discard('run')
+    assert cache.get('run', 'application/x-npy') is None
+    assert cache.get_result('run') is None
+    assert cache.num_bytes == 0
+
+
+def test_cache_eviction(rep):
+    cache = ResponseCache(max_bytes=2 * len(BODY))
+    for run_id in ('a', 'b', 'c'):
+        cache.put(run_id, 'application/x-npy', None, None, rep)
+
+    assert cache.get('a', 'application/x-npy') is None
+    assert cache.get('b', 'application/x-npy') == rep
+    assert cache.get('c', 'application/x-npy') == rep
+    assert cache.num_bytes == 2 * len(BODY)
+
+# ---- END OF <test_response.py> ----
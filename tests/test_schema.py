@@ -0,0 +1,131 @@
+# This is <test_schema.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Tests of the compiled schemas.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Tests of :py:mod:`ramsis.worker.utils.schema`.
+"""
+
+import marshmallow
+import pytest
+
+from marshmallow import Schema, fields
+
+from ramsis.worker.utils.schema import CompiledSchema, compiled_schema
+
+
+class ItemSchema(Schema):
+    name = fields.String(required=True)
+    weight = fields.Float()
+
+
+class ModelSchema(Schema):
+    rate = fields.Float(required=True)
+    count = fields.Integer()
+    enabled = fields.Boolean()
+    label = fields.String()
+    options = fields.Dict()
+    items = fields.Nested(ItemSchema, many=True)
+
+
+class HookSchema(Schema):
+    rate = fields.Float()
+
+    @marshmallow.post_load
+    def double(self, data, **kwargs):
+        data['rate'] *= 2
+        return data
+
+
+def load(schema_class, message):
+    """
+    Reference implementation i.e. load `message` by means of `marshmallow`.
+    """
+    try:
+        result = schema_class().load(message)
+    except marshmallow.ValidationError as err:
+        return None, err.messages
+    if hasattr(result, 'errors'):
+        return result.data, result.errors
+    return result, {}
+
+
+VALID = [
+    {'rate': 1},
+    {'rate': -1.5, 'count': 0, 'enabled': False, 'label': ''},
+    {'rate': 2., 'count': 3, 'enabled': True, 'label': 'model',
+     'options': {'a': [1, 2], 'b': None}},
+    {'rate': 0, 'items': []},
+    {'rate': 0, 'items': [{'name': 'a', 'weight': 1}, {'name': 'b'}]},
+    {'rate': 1, 'count': 10**400},
+]
+
+INVALID = [
+    None,
+    [],
+    {},
+    {'rate': None},
+    {'rate': 1, 'label': None},
+    {'rate': True},
+    {'rate': False},
+    {'rate': 1, 'count': True},
+    {'rate': 1, 'count': 1.5},
+    {'rate': 1, 'enabled': 1},
+    {'rate': '1.5'},
+    {'rate': float('nan')},
+    {'rate': float('inf')},
+    {'rate': -float('inf')},
+    {'rate': 10**400},
+    {'rate': -10**400},
+    {'rate': 1, 'unknown': 1},
+    {'rate': 1, 'options': [1]},
+    {'rate': 1, 'items': {'name': 'a'}},
+    {'rate': 1, 'items': [[{'name': 'a'}]]},
+    {'rate': 1, 'items': [{'name': 1}]},
+    {'rate': 1, 'items': [{'name': 'a', 'weight': float('nan')}]},
+    {'rate': 1, 'items': [{'name': 'a', 'weight': 10**400}]},
+    {'rate': 1, 'items': [{'name': 'a', 'unknown': 1}]},
+    {'rate': 1, 'items': [{'weight': 1}]},
+]
+
+
+@pytest.mark.parametrize('message', VALID + INVALID)
+def test_load(message):
+    schema = CompiledSchema(ModelSchema)
+    assert schema.is_compiled
+    assert schema.load(message) == load(ModelSchema, message)
+
+
+@pytest.mark.parametrize('message', VALID)
+def test_load_compiled(message):
+    data, errors = CompiledSchema(ModelSchema).load(message)
+    assert not errors
+    assert type(data['rate']) is float
+    # the message is not modified
+    assert data is not message
+
+
+def test_hooks():
+    schema = CompiledSchema(HookSchema)
+    assert not schema.is_compiled
+    assert schema.load({'rate': 1}) == ({'rate': 2.}, {})
+
+
+def test_loads():
+    schema = CompiledSchema(ModelSchema)
+    assert schema.loads(b'{"rate": 1}') == ({'rate': 1.}, {})
+    assert schema.loads(b'') == load(ModelSchema, {})
+
+    data, errors = schema.loads(b'{"rate": ')
+    assert data is None
+    assert list(errors) == ['json']
+
+
+def test_compiled_schema():
+    assert compiled_schema(ModelSchema) is compiled_schema(ModelSchema)
+    assert compiled_schema(ModelSchema).schema_class is ModelSchema
+
+# ---- END OF <test_schema.py> ----
@@ -0,0 +1,165 @@
+# This is <test_serializer.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Tests of the result serialization facilities.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Tests of :py:mod:`ramsis.worker.utils.serializer`.
+"""
+
+import array
+import io
+import json
+
+import numpy as np
+import pytest
+
+from flask import Flask
+from flask_restful import Api
+
+from ramsis.worker.utils.registry import RunRegistry, RunState
+from ramsis.worker.utils.resource import AsyncWorkerResource, result_payload
+from ramsis.worker.utils.serializer import (MIMETYPE_ARROW, MIMETYPE_JSON,
+                                            MIMETYPE_MSGPACK, MIMETYPE_NPY,
+                                            SerializationError, mimetypes,
+                                            negotiate_mimetype, serialize,
+                                            to_ndarray)
+from ramsis.worker.utils.task import CompletedTask
+
+
+class FakeDouble(object):
+    """
+    Stand-in for :py:class:`matlab.double` (MATLAB < R2022a) i.e. without
+    buffer protocol and the data kept as a flat, column-major array.
+    """
+
+    def __init__(self, data, size):
+        self._data = array.array('d', data)
+        self.size = size
+
+# class FakeDouble
+
+
+@pytest.fixture
+def result():
+    arr = np.arange(6.).reshape(2, 3)
+    return result_payload('run', RunState.DONE, arr), arr
+
+
+def test_to_ndarray(tmp_path):
+    arr = np.arange(3.)
+    assert to_ndarray(arr) is arr
+    np.testing.assert_array_equal(to_ndarray([1., 2.]), [1., 2.])
+
+    fname = str(tmp_path / 'arr.npy')
+    np.save(fname, arr)
+    memmap = to_ndarray(np.load(fname, mmap_mode='r'))
+    assert type(memmap) is np.ndarray
+    np.testing.assert_array_equal(memmap, arr)
+
+
+def test_to_ndarray_dtype():
+    arr = to_ndarray(np.arange(3.), dtype='float32')
+    assert arr.dtype == np.float32
+    np.testing.assert_array_equal(arr, [0., 1., 2.])
+
+
+def test_to_ndarray_matlab():
+    arr = to_ndarray(FakeDouble(range(6), (2, 3)))
+    np.testing.assert_array_equal(arr, [[0., 2., 4.], [1., 3., 5.]])
+    assert arr.flags['C_CONTIGUOUS']
+    assert to_ndarray(FakeDouble(range(6), (2, 3)),
+                      dtype='float32').dtype == np.float32
+
+
+def test_json(result):
+    payload, arr = result
+    data = json.loads(serialize(MIMETYPE_JSON, payload, arr))
+    assert data['run_id'] == 'run'
+    assert data['result'] == [{'rate_prediction': arr.tolist()}]
+
+
+def test_msgpack(result):
+    msgpack = pytest.importorskip('msgpack')
+    payload, arr = result
+    data = msgpack.unpackb(serialize(MIMETYPE_MSGPACK, payload, arr),
+                           raw=False)
+    assert data['run_id'] == 'run'
+    value = data['result'][0]['rate_prediction']
+    np.testing.assert_array_equal(
+        np.frombuffer(value['data'], dtype=value['dtype']).reshape(
+            value['shape']), arr)
+
+
+@pytest.mark.parametrize('dtype', ['float32', 'float64'])
+def test_npy(result, dtype):
+    payload, arr = result
+    arr = to_ndarray(arr, dtype=dtype)
+    _arr = np.load(io.BytesIO(serialize(MIMETYPE_NPY, payload, arr)))
+    assert _arr.dtype == dtype
+    np.testing.assert_array_equal(_arr, arr)
+
+
+def test_arrow(result):
+    pyarrow = pytest.importorskip('pyarrow')
+    ipc = pytest.importorskip('pyarrow.ipc')
+    payload, arr = result
+    table = ipc.open_stream(
+        pyarrow.py_buffer(serialize(MIMETYPE_ARROW, payload, arr))).read_all()
+    shape = json.loads(table.schema.metadata[b'shape'])
+    np.testing.assert_array_equal(
+        table.column('rate_prediction').to_numpy().reshape(shape), arr)
+
+
+def test_unsupported_mimetype(result):
+    with pytest.raises(SerializationError):
+        serialize('text/html', *result)
+
+
+@pytest.mark.parametrize('accept,mimetype', [
+    (None, MIMETYPE_JSON),
+    ('', MIMETYPE_JSON),
+    ('*/*', MIMETYPE_JSON),
+    ('application/*', MIMETYPE_JSON),
+    ('text/html, application/x-npy;q=0.5', MIMETYPE_NPY),
+    ('application/json;q=0.5, application/x-npy', MIMETYPE_NPY),
+    ('text/html', None)])
+def test_negotiate_mimetype(accept, mimetype):
+    assert negotiate_mimetype(accept) == mimetype
+
+
+def test_negotiation():
+    registry = RunRegistry()
+    app = Flask(__name__)
+    api = Api(app)
+    api.add_resource(AsyncWorkerResource, '/runs/<run_id>',
+                     resource_class_kwargs={'registry': registry})
+    client = app.test_client()
+
+    def finished():
+        run = registry.create(CompletedTask(np.arange(3.)))
+        run.start()
+        run.poll()
+        return run.id
+
+    resp = client.get('/runs/{}'.format(finished()),
+                      headers={'Accept': 'text/html'})
+    assert resp.status_code == 406
+    assert resp.get_json()['result'] == mimetypes()
+
+    resp = client.get('/runs/{}'.format(finished()),
+                      headers={'Accept': MIMETYPE_NPY},
+                      query_string={'dtype': 'float32'})
+    assert resp.status_code == 200
+    assert resp.mimetype == MIMETYPE_NPY
+    arr = np.load(io.BytesIO(resp.data))
+    assert arr.dtype == np.float32
+    np.testing.assert_array_equal(arr, [0., 1., 2.])
+
+    resp = client.get('/runs/{}'.format(finished()))
+    assert resp.status_code == 200
+    assert resp.mimetype == MIMETYPE_JSON
+
+# ---- END OF <test_serializer.py> ----
@@ -0,0 +1,153 @@
+# This is <test_single_flight.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Tests of single-flight coalescing.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Tests of :py:class:`ramsis.worker.utils.registry.SingleFlight` and
+:py:meth:`ramsis.worker.utils.registry.Run.follow`.
+"""
+
+from ramsis.worker.utils.registry import Run, RunState, SingleFlight
+from ramsis.worker.utils.task import CompletedTask, SharedTask
+
+
+def leader(result=42):
+    return Run(CompletedTask(result))
+
+
+def follower():
+    return Run(SharedTask())
+
+
+def test_follow():
+    run = leader()
+    other = follower()
+    assert other.follow(run)
+    assert other.state is RunState.ACCEPTED
+
+    run.transition(RunState.RUNNING)
+    assert other.state is RunState.RUNNING
+
+    run.transition(RunState.DONE)
+    assert other.state is RunState.DONE
+    assert other.task.result == 42
+    assert run.followers == []
+
+
+def test_follow_finished():
+    run = leader()
+    run.transition(RunState.RUNNING)
+    run.transition(RunState.DONE)
+    assert not follower().follow(run)
+
+
+def test_follow_failed():
+    run = leader()
+    other = follower()
+    other.follow(run)
+
+    run.fail('boom')
+    assert other.state is RunState.FAILED
+    assert other.error == 'Coalesced run {} failed (boom).'.format(run.id)
+
+
+def test_cancel_follower():
+    run = leader()
+    other = follower()
+    other.follow(run)
+
+    assert other.cancel()
+    assert other.state is RunState.FAILED
+    assert run.state is RunState.ACCEPTED
+    assert run.followers == []
+
+
+def test_lead():
+    flight = SingleFlight()
+    run = leader()
+    flight.lead('key', run)
+    assert flight.get('key') is run
+    assert len(flight) == 1
+
+    run.transition(RunState.RUNNING)
+    run.transition(RunState.DONE)
+    assert flight.get('key') is None
+    assert len(flight) == 0
+
+
+def test_discard():
+    flight = SingleFlight()
+    run = leader()
+    other = follower()
+    flight.lead('key', run)
+    other.follow(run)
+
+    flight.discard(run)
+    assert flight.get('key') is None
+    assert run.state is RunState.FAILED
+    assert other.state is RunState.FAILED
+
+
+def test_cancelled_without_promotion():
+    flight = SingleFlight()
+    run = leader()
+    others = [follower(), follower()]
+    flight.lead('key', run)
+    for other in others:
+        other.follow(run)
+
+    run.cancel()
+    for other in others:
+        assert other.state is RunState.FAILED
+        assert other.error == 'Coalesced run {} cancelled.'.format(run.id)
+
+
+def test_cancelled_promotion():
+    flight = SingleFlight()
+    promoted = []
+
+    def promote(run):
+        run.promote(CompletedTask(7))
+        promoted.append(run)
+
+    run = leader()
+    first, second = follower(), follower()
+    flight.lead('key', run, promote=promote)
+    first.follow(run)
+    second.follow(run)
+    run.transition(RunState.RUNNING)
+
+    run.cancel()
+    # cancelling the run does not take its followers down
+    assert promoted == [first]
+    assert first.state is RunState.ACCEPTED
+    assert not second.is_finished
+    assert first.followers == [second]
+
+    # the promoted run is executed itself
+    first.transition(RunState.RUNNING)
+    first.transition(RunState.DONE)
+    assert second.state is RunState.DONE
+    assert second.task.result == 7
+
+
+def test_failed_promotion():
+    flight = SingleFlight()
+
+    def promote(run):
+        raise RuntimeError('queue full')
+
+    run = leader()
+    first, second = follower(), follower()
+    flight.lead('key', run, promote=promote)
+    first.follow(run)
+    second.follow(run)
+
+    run.cancel()
+    assert first.state is RunState.FAILED
+    assert second.state is RunState.FAILED
+
+# ---- END OF <test_single_flight.py> ----
@@ -0,0 +1,44 @@
+# This is <test_startup.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Tests of the worker's startup.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Tests of :py:mod:`ramsis.worker.utils.startup` and of the modules imported
+lazily.
+"""
+
+import subprocess
+import sys
+
+import pytest
+
+from ramsis.worker.utils.startup import StartupProfileError, import_times
+
+
+@pytest.mark.parametrize('module', ['ramsis.worker.utils.resource',
+                                    'ramsis.worker.utils.asgi',
+                                    'ramsis.worker.utils.dispatch',
+                                    'ramsis.worker.utils.bench'])
+def test_lazy_imports(module):
+    # e.g. --version, --help and the dispatcher do not require them
+    script = ('import sys, {}; print(sorted(m for m in '
+              "('numpy', 'orjson', 'zstandard') if m in sys.modules))")
+    proc = subprocess.run([sys.executable, '-c', script.format(module)],
+                          stdout=subprocess.PIPE, check=True,
+                          universal_newlines=True)
+    assert proc.stdout == '[]\n'
+
+
+def test_import_times():
+    times = import_times('json', top=3)
+    assert times['module'] == 'json'
+    assert times['total'] > 0
+    assert len(times['imports']) <= 3
+
+    with pytest.raises(StartupProfileError):
+        import_times('ramsis.worker.missing')
+
+# ---- END OF <test_startup.py> ----
@@ -0,0 +1,166 @@
+# This is <test_store.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Tests of the persistent result store.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Tests of :py:mod:`ramsis.worker.utils.store`.
+"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pytest
+
+from ramsis.worker.utils.registry import Run, RunState
+from ramsis.worker.utils.store import ResultStore
+from ramsis.worker.utils.task import CompletedTask
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultStore(str(tmp_path))
+    yield store
+    store.close()
+
+
+def finished_run(result):
+    run = Run(CompletedTask(result))
+    run.transition(RunState.RUNNING)
+    run.transition(RunState.DONE)
+    return run
+
+
+def set_owner(path, run_id, owner, heartbeat):
+    conn = sqlite3.connect(os.path.join(path, ResultStore.DB),
+                           isolation_level=None)
+    try:
+        conn.execute('UPDATE runs SET owner=?, heartbeat=? WHERE run_id=?',
+                     (owner, heartbeat, run_id))
+    finally:
+        conn.close()
+
+
+def exited_pid():
+    proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+    proc.wait()
+    return proc.pid
+
+
+def test_array_result(store, tmp_path):
+    run = finished_run(np.arange(6.).reshape(2, 3))
+    store.put(run)
+
+    record = store.get(run.id)
+    assert record.state is RunState.DONE
+    assert record.finished is not None
+    assert isinstance(record.result, np.memmap)
+    assert not record.result.flags.writeable
+    np.testing.assert_array_equal(record.result, np.arange(6.).reshape(2, 3))
+    assert (tmp_path / (run.id + '.npy')).exists()
+
+
+def test_object_result(store):
+    run = finished_run({'rate': [1, 2]})
+    store.put(run)
+    assert store.get(run.id).result == {'rate': [1, 2]}
+
+
+def test_remove(store, tmp_path):
+    run = finished_run(np.zeros(3))
+    store.put(run)
+    assert run.id in store
+
+    store.remove(run.id)
+    assert run.id not in store
+    assert store.get(run.id) is None
+    assert not (tmp_path / (run.id + '.npy')).exists()
+
+
+def test_array_file_removed(store, tmp_path):
+    run = finished_run(np.zeros(3))
+    store.put(run)
+
+    # e.g. evicted by another process sharing the store
+    os.remove(str(tmp_path / (run.id + '.npy')))
+    assert store.get(run.id) is None
+
+
+def test_recover(tmp_path):
+    store = ResultStore(str(tmp_path))
+    run = Run(CompletedTask(None))
+    store.add(run)
+    store.close()
+
+    # runs in flight while the worker was stopped fail
+    store = ResultStore(str(tmp_path))
+    try:
+        record = store.get(run.id)
+        assert record.state is RunState.FAILED
+        assert record.error == 'Worker restarted while the run was in flight.'
+    finally:
+        store.close()
+
+
+def test_evict(tmp_path):
+    store = ResultStore(str(tmp_path), retention=0)
+    try:
+        run = finished_run(np.zeros(3))
+        store.put(run)
+        time.sleep(0.01)
+
+        store.evict(force=True)
+        assert run.id not in store
+        assert not (tmp_path / (run.id + '.npy')).exists()
+    finally:
+        store.close()
+
+
+def test_orphaned_owner_exited(store, tmp_path):
+    run = Run(CompletedTask(None))
+    store.add(run)
+    owner = exited_pid()
+    set_owner(str(tmp_path), run.id, owner, time.time())
+
+    record = store.get(run.id)
+    assert record.state is RunState.FAILED
+    assert record.error == (
+        'Worker process {} exited while the run was in flight.'.format(owner))
+
+
+def test_orphaned_heartbeat(store, tmp_path):
+    run = Run(CompletedTask(None))
+    store.add(run)
+    set_owner(str(tmp_path), run.id, os.getppid(),
+              time.time() - 2 * store.HEARTBEAT_TIMEOUT)
+    assert store.get(run.id).state is RunState.FAILED
+
+
+def test_owned_run_not_orphaned(store):
+    run = Run(CompletedTask(None))
+    store.add(run)
+    record = store.get(run.id)
+    assert record.state is RunState.ACCEPTED
+    assert record.finished is None
+    assert store.wait(run.id, timeout=0.01).finished is None
+
+
+def test_request_cancel(store):
+    store.CANCEL_INTERVAL = 0.01
+    run = Run(CompletedTask(None))
+    store.add(run)
+
+    assert store.request_cancel(run.id)
+    assert run.wait(timeout=5) is RunState.FAILED
+    assert run.cancelled
+    assert run.error == 'Run cancelled by client.'
+
+    assert not store.request_cancel('unknown')
+
+# ---- END OF <test_store.py> ----
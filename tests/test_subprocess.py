@@ -0,0 +1,204 @@
+# This is <test_subprocess.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Tests of the subprocess task backend.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Tests of :py:class:`ramsis.worker.utils.task.SubprocessTask`.
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import pytest
+
+from ramsis.worker.utils.executor import RunExecutor
+from ramsis.worker.utils.registry import Run, RunState
+from ramsis.worker.utils.task import (InvalidConfiguration, NotConfigured,
+                                      SubprocessTask, TaskError)
+
+MODEL = '''
+import json, sys
+import numpy as np
+with open(sys.argv[1]) as ifd:
+    params = json.load(ifd)
+print('input', params)
+np.save(sys.argv[2], np.asarray(params['values'], dtype=float) * 2)
+'''
+
+RAW = '''
+import sys
+import numpy as np
+np.arange(4, dtype=np.float32).tofile(sys.argv[1])
+'''
+
+SLEEP = '''
+import signal, sys, time
+if len(sys.argv) > 1:
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+print('ready', flush=True)
+time.sleep(30)
+'''
+
+
+def command(script, *args):
+    return [sys.executable, '-c', script] + list(args)
+
+
+def execute(task, timeout=30, **kwargs):
+    task.configure(**kwargs)
+    task()
+    task.wait(timeout=timeout)
+    return task.poll()
+
+
+def started(task, timeout=10):
+    deadline = time.monotonic() + timeout
+    while 'ready' not in (task.stdout or ''):
+        assert time.monotonic() < deadline
+        task.wait(timeout=0.05)
+
+
+def test_npy_result():
+    task = SubprocessTask(command(MODEL, '{input}', '{output}'))
+    assert execute(task, values=[1, 2, 3]) == 0
+    assert isinstance(task.result, np.memmap)
+    np.testing.assert_array_equal(task.result, [2., 4., 6.])
+    assert task.stdout.startswith('input ')
+    assert task.stderr == ''
+
+
+def test_raw_result():
+    task = SubprocessTask(command(RAW, '{output}'), output='result.bin',
+                          output_dtype='float32')
+    assert execute(task) == 0
+    assert task.result.dtype == np.float32
+    np.testing.assert_array_equal(task.result, np.arange(4))
+
+
+def test_params_placeholder():
+    task = SubprocessTask(
+        command('import sys; print(sys.argv[1:])', '{params[n]}'),
+        output='missing.npy')
+    execute(task, n=42)
+    assert task.stdout == "['42']\n"
+
+
+def test_array_input():
+    values = np.arange(2000.)
+    task = SubprocessTask(command(MODEL, '{input}', '{output}'))
+    assert execute(task, values=values) == 0
+    # arrays are serialized completely
+    np.testing.assert_array_equal(task.result, values * 2)
+
+
+def test_invalid_placeholder():
+    task = SubprocessTask(command('pass', '{params[missing]}'))
+    task.configure(n=1)
+    with pytest.raises(InvalidConfiguration):
+        task()
+
+
+def test_not_configured():
+    with pytest.raises(NotConfigured):
+        SubprocessTask(command('pass'))()
+
+
+def test_launch_failure(tmp_path):
+    task = SubprocessTask([str(tmp_path / 'missing')])
+    task.configure()
+    with pytest.raises(TaskError):
+        task()
+
+
+def test_exit_code():
+    task = SubprocessTask(command('import sys; sys.exit(3)'))
+    assert execute(task) == 3
+    assert task.result is None
+    assert task.stderr == 'Process exited with code 3.\n'
+
+
+def test_missing_output():
+    task = SubprocessTask(command('pass'))
+    assert execute(task) == 1
+    assert task.stderr.startswith('Failed to load result (')
+
+
+def test_large_output():
+    # more than the pipe's buffer and several chunks
+    script = ("import sys; sys.stdout.write('x' * 500000); "
+              "print('e' * 10, file=sys.stderr)")
+    task = SubprocessTask(command(script), output='missing.npy')
+    execute(task)
+    assert task.stdout == 'x' * 500000
+    assert task.stderr.startswith('e' * 10 + '\n')
+
+
+def test_wait_timeout():
+    task = SubprocessTask(command(SLEEP))
+    task.configure()
+    task()
+    try:
+        task.wait(timeout=0.05)
+        assert task.poll() is None
+    finally:
+        task.reset()
+
+
+def test_reset(tmp_path):
+    task = SubprocessTask(command(MODEL, '{input}', '{output}'),
+                          workdir=str(tmp_path))
+    assert execute(task, values=[1]) == 0
+    assert len(os.listdir(str(tmp_path))) == 1
+
+    task.reset()
+    assert not task.is_configured
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_cancel():
+    task = SubprocessTask(command(SLEEP))
+    task.configure()
+    task()
+    started(task)
+
+    start = time.monotonic()
+    assert task.cancel()
+    assert time.monotonic() - start < SubprocessTask.KILL_TIMEOUT
+    assert task.poll() < 0
+    assert not task.cancel()
+    task.reset()
+
+
+def test_cancel_kill():
+    task = SubprocessTask(command(SLEEP, 'ignore'))
+    task.KILL_TIMEOUT = 0.2
+    task.configure()
+    task()
+    started(task)
+
+    assert task.cancel()
+    assert task.poll() == -9
+    task.reset()
+
+
+def test_deadline():
+    executor = RunExecutor(max_workers=1)
+    try:
+        task = SubprocessTask(command(SLEEP))
+        task.configure()
+        run = Run(task, timeout=0.2)
+        executor.submit(run)
+
+        assert run.wait(timeout=30) is RunState.FAILED
+        assert run.error == 'Deadline exceeded (0.2s).'
+        assert task.poll() < 0
+    finally:
+        executor.shutdown()
+        task.reset()
+
+# ---- END OF <test_subprocess.py> ----
@@ -0,0 +1,145 @@
+# This is <test_task_stream.py>
+# -----------------------------------------------------------------------------
+#
+# Purpose: Tests of the task stream facilities.
+#
+# Copyright (c) Daniel Armbruster (SED, ETH), Lukas Heiniger (SED, ETH)
+# =============================================================================
+"""
+Tests of :py:class:`ramsis.worker.utils.task.RingBufferTaskStream`.
+"""
+
+import pytest
+
+from flask import Flask
+from flask_restful import Api
+
+from ramsis.worker.utils.registry import RunRegistry
+from ramsis.worker.utils.resource import RunLogResource
+from ramsis.worker.utils.task import RingBufferTaskStream, Task
+
+
+class LogTask(Task):
+    """
+    Task writing to a ring buffer stdout stream.
+    """
+
+    def __init__(self, stream):
+        super().__init__()
+        self.is_configured = True
+        self._stdout = stream
+
+    def poll(self):
+        return None
+
+# class LogTask
+
+
+@pytest.fixture
+def spill_stream(tmp_path):
+    stream = RingBufferTaskStream(capacity=8, spill_dir=str(tmp_path))
+    yield stream
+    stream.close()
+
+
+def test_read_from():
+    stream = RingBufferTaskStream(capacity=8)
+    assert stream.write('abc') == 3
+    assert stream.read_from() == (b'abc', 3)
+    assert stream.read_from(1) == (b'bc', 3)
+    # offsets beyond the end of the stream are clipped
+    assert stream.read_from(10) == (b'', 3)
+    assert stream.read_from(-1) == (b'abc', 3)
+
+
+def test_wraparound():
+    stream = RingBufferTaskStream(capacity=8)
+    stream.write('0123456789')
+    stream.write(b'ab')
+
+    assert stream.size == 12
+    assert str(stream) == '456789ab'
+    assert stream.read_from(4) == (b'456789ab', 12)
+    assert stream.read_from(10) == (b'ab', 12)
+
+
+def test_dropped_prefix():
+    stream = RingBufferTaskStream(capacity=8)
+    stream.write('0123456789')
+
+    # without a spill file evicted bytes are skipped
+    assert stream.read_from(0) == (b'23456789', 10)
+    assert stream.read_from(1, max_bytes=3) == (b'234', 5)
+
+
+def test_spill(spill_stream):
+    spill_stream.write('0123456789')
+    spill_stream.write('abcdef')
+
+    assert str(spill_stream) == '89abcdef'
+    # reads span both the spill file and the buffer
+    assert spill_stream.read_from() == (b'0123456789abcdef', 16)
+    assert spill_stream.read_from(3, max_bytes=4) == (b'3456', 7)
+    assert spill_stream.read_from(6, max_bytes=4) == (b'6789', 10)
+    assert spill_stream.read_from(10) == (b'abcdef', 16)
+
+
+def test_max_bytes(spill_stream):
+    spill_stream.write('0123456789')
+
+    data, offset = b'', 0
+    while True:
+        chunk, offset = spill_stream.read_from(offset, max_bytes=3)
+        if not chunk:
+            break
+        assert len(chunk) <= 3
+        data += chunk
+    assert data == b'0123456789'
+    assert offset == 10
+    assert spill_stream.read_from(8, max_bytes=0) == (b'', 8)
+
+
+def test_read_after_close(spill_stream):
+    spill_stream.write('0123456789')
+    spill_stream.close()
+
+    # the spilled prefix is gone, the buffer is still available
+    assert spill_stream.read_from(0) == (b'23456789', 10)
+    spill_stream.close()
+
+
+def test_log_resource(spill_stream):
+    registry = RunRegistry()
+    run = registry.create(LogTask(spill_stream))
+    spill_stream.write('0123456789')
+
+    app = Flask(__name__)
+    api = Api(app)
+    api.add_resource(RunLogResource, '/runs/<run_id>/log',
+                     resource_class_kwargs={'registry': registry})
+    client = app.test_client()
+
+    resp = client.get('/runs/{}/log'.format(run.id))
+    assert resp.status_code == 200
+    assert resp.data == b'0123456789'
+    assert resp.headers['X-Log-Offset'] == '10'
+    assert resp.headers['X-Run-State'] == 'accepted'
+
+    spill_stream.write('abc')
+    resp = client.get('/runs/{}/log'.format(run.id),
+                      query_string={'offset': 10})
+    assert resp.data == b'abc'
+    assert resp.headers['X-Log-Offset'] == '13'
+
+    resp = client.get('/runs/{}/log'.format(run.id),
+                      query_string={'stream': 'stderr', 'offset': 5})
+    assert resp.data == b''
+    assert resp.headers['X-Log-Offset'] == '5'
+
+    resp = client.get('/runs/{}/log'.format(run.id),
+                      query_string={'stream': 'invalid'})
+    assert resp.status_code == 400
+    resp = client.get('/runs/unknown/log')
+    assert resp.status_code == 404
+
+# ---- END OF <test_task_stream.py> ----